@@ -0,0 +1,246 @@
+'''
+Feasibility atlas of the baluns.
+
+The atlas tells which baluns Balun_Build would build over a whole grid of
+(topology, L, W, S, Pri, Sec), from the closed-form rules of Valid_Check.
+No geometry is generated and gdspy is not needed.  The atlas can be saved
+to and loaded from a NumPy .npz file.
+
+'Min_Length' inverts the same rules to give the smallest balun that fits
+the requested turns.
+
+Atlas keys:
+
+topology, L, W, S, Pri, Sec : The axes of the grid, in that order.
+
+viaM, viaW, viaS : The via array the atlas was computed for.
+
+max_tracks : Maximum number of tracks, shape (topology, L, W, S).
+             Already made even for 'XX' baluns.
+
+reason : Why a balun is not feasible, shape (topology, L, W, S, Pri, Sec).
+         0 if feasible, otherwise the sum of the REASON_* flags.
+
+feasible : Boolean tensor, reason == 0.
+
+NumPy is imported by the functions that use it, so 'Min_Length' of plain
+numbers, as in the 'check' command, does not import it.
+'''
+
+import math
+import Balun_Scripts.Part_Extents as PE
+import Balun_Scripts.Valid_Check as VC
+from Balun_Scripts.Valid_Check import LIMIT
+
+###########################################
+# Flags of the reasons for infeasibility  #
+###########################################
+REASON_RATIO = 1     # Turn ratio not valid for the topology
+REASON_TRACKS = 2    # More turns than the maximum number of tracks
+
+AXES = ('topology', 'L', 'W', 'S', 'Pri', 'Sec')
+
+
+def Balun_Atlas(L, W, S, Pri, Sec, topology=('X', 'XX', 'XI'), viaM=4, viaW=1, viaS=1):
+    '''
+
+    Evaluate the feasibility of every balun of a grid.
+
+    L : Overall lengths of the octagonal balun.
+
+    W : Widths of the metal track.
+
+    S : Spacings between the metal tracks.
+
+    Pri : Numbers of turns of the primary.
+
+    Sec : Numbers of turns of the secondary.
+
+    topology : Balun topologies, out of 'X', 'XX', and 'XI'.
+
+    viaM, viaW, viaS : Rows and columns, width, and spacing of the via array.
+
+    Each axis is a value or a list of values.
+    Returns the atlas as a dictionary, see the module documentation.
+
+    '''
+
+    import numpy as np
+
+    axes = {}
+    axes['topology'] = np.atleast_1d(np.asarray(topology, dtype=str))
+    axes['L'] = np.atleast_1d(np.asarray(L, dtype=float))
+    axes['W'] = np.atleast_1d(np.asarray(W, dtype=float))
+    axes['S'] = np.atleast_1d(np.asarray(S, dtype=float))
+    axes['Pri'] = np.atleast_1d(np.asarray(Pri, dtype=int))
+    axes['Sec'] = np.atleast_1d(np.asarray(Sec, dtype=int))
+
+    # Footprint axes broadcast over (L, W, S), turn axes over (Pri, Sec)
+    L_g = axes['L'][:, None, None]
+    W_g = axes['W'][None, :, None]
+    S_g = axes['S'][None, None, :]
+    Pri_g = axes['Pri'][:, None]
+    Sec_g = axes['Sec'][None, :]
+
+    shape = tuple(len(axes[name]) for name in AXES)
+    max_tracks = np.zeros(shape[:4], dtype=int)
+    reason = np.zeros(shape, dtype=np.int8)
+
+    for index, top in enumerate(axes['topology']):
+        tracks = VC.max_tracks_analytic(L_g, W_g, S_g, LIMIT[top], viaM, viaW, viaS)
+        tracks = np.broadcast_to(tracks, shape[1:4])
+
+        # Total tracks should be even for 'XX' baluns
+        if top == 'XX':
+            tracks = tracks - tracks%2
+        max_tracks[index] = tracks
+
+        ratio = VC.Ratio_Valid(top, Pri_g, Sec_g)
+        short = tracks[..., None, None] < (Pri_g + Sec_g)
+        reason[index] = REASON_RATIO*~ratio + REASON_TRACKS*short
+
+    atlas = dict(axes)
+    atlas['viaM'] = viaM
+    atlas['viaW'] = viaW
+    atlas['viaS'] = viaS
+    atlas['max_tracks'] = max_tracks
+    atlas['reason'] = reason
+    atlas['feasible'] = reason == 0
+
+    return atlas
+
+
+def Save_Atlas(atlas, path):
+    '''
+
+    Write an atlas to a compressed NumPy .npz file.
+
+    '''
+
+    import numpy as np
+
+    np.savez_compressed(path, **atlas)
+
+
+def Load_Atlas(path):
+    '''
+
+    Read an atlas written by 'Save_Atlas'.
+
+    '''
+
+    import numpy as np
+
+    with np.load(path) as data:
+        atlas = {name : data[name] for name in data.files}
+
+    for name in ('viaM', 'viaW', 'viaS'):
+        atlas[name] = atlas[name].item()
+
+    return atlas
+
+
+def Min_Length(topology, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1, grid=None):
+    '''
+
+    Smallest overall length L of a balun that fits Pri + Sec tracks.
+
+    Inverts max_tracks: the inner most track must still be as long as the
+    limiting crossover, so L >= 2*((N-1)*(W+S) + W + length/(2*tan(pi/8)))
+    with N = Pri + Sec tracks and 'length' the width of the crossover.
+
+    topology : Balun topology, one of 'X', 'XX', or 'XI'.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    Pri : Number of turns of the primary.
+
+    Sec : Number of turns of the secondary.
+
+    viaM, viaW, viaS : Rows and columns, width, and spacing of the via array.
+
+    grid : If given, L is rounded up to a multiple of grid.
+
+    W, S, Pri, Sec, and the via parameters may be NumPy arrays of
+    broadcastable shapes, for batch queries.
+    Returns L as a float or a float array.  L is NaN where the turn ratio
+    is not valid for the topology.
+
+    '''
+
+    if PE.scalars(W, S, Pri, Sec, viaM, viaW, viaS):
+        return _min_length(topology, W, S, Pri, Sec, viaM, viaW, viaS, grid)
+
+    import numpy as np
+
+    W = np.asarray(W, dtype=float)
+    S = np.asarray(S, dtype=float)
+    N = np.asarray(Pri) + np.asarray(Sec)
+
+    length = VC.limit_tracks(0, W, S, LIMIT[topology], viaM, viaW, viaS)[0]
+    tanz = np.tan(np.pi/8)
+
+    L = 2*((N - 1)*(W + S) + W + length/(2*tanz))
+    if grid != None:
+        L = np.ceil(L/grid)*grid
+
+    # Guard against rounding: step up until max_tracks agrees, then down
+    # while the next smaller length still fits
+    for attempt in range(8):
+        short = VC.limit_tracks(L, W, S, LIMIT[topology], viaM, viaW, viaS)[1] < N
+        if not np.any(short):
+            break
+        if grid != None:
+            L = np.where(short, L + grid, L)
+        else:
+            L = np.where(short, np.nextafter(L, np.inf), L)
+
+    for attempt in range(8):
+        if grid != None:
+            smaller = L - grid
+        else:
+            smaller = np.nextafter(L, -np.inf)
+        fits = VC.limit_tracks(smaller, W, S, LIMIT[topology], viaM, viaW, viaS)[1] >= N
+        if not np.any(fits):
+            break
+        L = np.where(fits, smaller, L)
+
+    L = np.where(VC.Ratio_Valid(topology, np.asarray(Pri), np.asarray(Sec)), L, np.nan)
+
+    if np.ndim(L) == 0:
+        return float(L)
+    return L
+
+
+def _min_length(topology, W, S, Pri, Sec, viaM, viaW, viaS, grid):
+    '''
+
+    Min_Length of plain numbers, with the same guard against rounding.
+
+    '''
+
+    if not VC.Ratio_Valid(topology, Pri, Sec):
+        return math.nan
+
+    N = Pri + Sec
+    limit = LIMIT[topology]
+    length = VC.limit_tracks(0, W, S, limit, viaM, viaW, viaS)[0]
+
+    L = 2*((N - 1)*(W + S) + W + length/(2*math.tan(math.pi/8)))
+    if grid != None:
+        L = math.ceil(L/grid)*grid
+
+    for attempt in range(8):
+        if VC.limit_tracks(L, W, S, limit, viaM, viaW, viaS)[1] >= N:
+            break
+        L = L + grid if grid != None else math.nextafter(L, math.inf)
+
+    for attempt in range(8):
+        smaller = L - grid if grid != None else math.nextafter(L, -math.inf)
+        if VC.limit_tracks(smaller, W, S, limit, viaM, viaW, viaS)[1] < N:
+            break
+        L = smaller
+
+    return float(L)
@@ -0,0 +1,388 @@
+'''
+Benchmarks of the balun builds.
+
+'Balun_Bench' times Balun_Build end to end and per stage (see
+Balun_Profile) for the 'X', 'XX', and 'XI' topologies, from 2 tracks up to
+the maximum number of tracks that fits a large balun.  The results can be
+saved as a baseline JSON file; later runs are compared against it and the
+cases that got slower are flagged.
+
+Result keys:
+
+meta : Versions of Python, NumPy, and gdspy, and the machine.
+
+cases : List of one dictionary per balun, with the balun parameters,
+        'tracks', 'seconds' (best of the repeats), 'stages' (stage name to
+        seconds, from the best repeat), and 'polygons'.
+
+scaling : Topology to the exponent k of seconds ~ tracks**k, fitted on a
+          log-log scale.
+
+'Memory_Bench' builds each balun in a fresh process and reports its peak
+RSS and, with tracemalloc, the memory of each stage, the bytes per
+polygon, the bytes per balun, and the top allocation sites.  See
+'Memory_Bench' for its keys.
+'''
+
+import json
+import multiprocessing
+import os
+import platform
+import time
+import numpy as np
+import gdspy
+import Balun_Scripts.Balun_Profile as BPF
+import Balun_Scripts.Valid_Check as VC
+from Balun_Scripts.Balun_Build import Balun_Build, LIMIT
+
+
+def Bench_Cases(topology=('X', 'XX', 'XI'), L=1000, W=8, S=3, step=2, viaM=4, viaW=1, viaS=1):
+    '''
+
+    Baluns to benchmark, from 2 tracks up to the maximum for L.
+
+    The tracks are split as evenly as the turn ratio rule of each topology
+    allows: equal turns for 'XX', and an even secondary for 'XI'.
+
+    topology : Balun topologies to cover.
+
+    L, W, S : Balun length, track width, and track spacing.
+
+    step : Step of the total number of tracks.  The maximum is always
+           included.
+
+    Returns a list of dictionaries of Balun_Build arguments.
+
+    '''
+
+    cases = []
+    for top in topology:
+        max_tracks = VC.max_tracks_analytic(L, W, S, LIMIT[top], viaM, viaW, viaS)
+        counts = list(range(2, max_tracks + 1, step))
+        if max_tracks not in counts:
+            counts.append(max_tracks)
+
+        for tracks in counts:
+            if top == 'XX':
+                Pri = Sec = tracks//2
+            elif top == 'XI':
+                Sec = max(2, 2*(tracks//4))
+                Pri = tracks - Sec
+            else:
+                Pri = tracks//2
+                Sec = tracks - Pri
+
+            # Tracks that cannot be split, e.g. an odd count for 'XX'
+            if Pri + Sec != tracks or not VC.Ratio_Valid(top, Pri, Sec):
+                continue
+
+            cases.append({'topology' : top, 'L' : L, 'W' : W, 'S' : S, 'Pri' : Pri, 'Sec' : Sec,
+                          'viaM' : viaM, 'viaW' : viaW, 'viaS' : viaS})
+    return cases
+
+
+def _time_case(case, repeat):
+    '''
+
+    Best of 'repeat' builds of a balun, with the stages of the best build.
+
+    '''
+
+    best = None
+    for attempt in range(repeat):
+        lib = gdspy.GdsLibrary()
+        with BPF.Profile() as profile:
+            t0 = time.perf_counter()
+            balun_cell = Balun_Build(lib, **case)[0]
+            seconds = time.perf_counter() - t0
+
+        if best == None or seconds < best['seconds']:
+            stages = {}
+            for record in profile.records:
+                stages[record['stage']] = stages.get(record['stage'], 0.0) + record['seconds']
+            best = dict(case)
+            best['tracks'] = case['Pri'] + case['Sec']
+            best['seconds'] = seconds
+            best['stages'] = stages
+            best['polygons'] = len(balun_cell.get_polygons()) if balun_cell != None else 0
+    return best
+
+
+def Scaling(cases):
+    '''
+
+    Exponent k of seconds ~ tracks**k for each topology, fitted on a
+    log-log scale.
+
+    cases : 'cases' of the benchmark results.
+
+    Returns a dictionary of topology to k, or NaN with fewer than 2 cases.
+
+    '''
+
+    scaling = {}
+    for top in dict.fromkeys(case['topology'] for case in cases):
+        tracks = np.array([case['tracks'] for case in cases if case['topology'] == top], dtype=float)
+        seconds = np.array([case['seconds'] for case in cases if case['topology'] == top])
+        if len(tracks) < 2:
+            scaling[top] = float('nan')
+        else:
+            scaling[top] = float(np.polyfit(np.log(tracks), np.log(seconds), 1)[0])
+    return scaling
+
+
+def Balun_Bench(cases=None, repeat=3):
+    '''
+
+    Run the benchmark.
+
+    cases : List of Balun_Build arguments.  The default is Bench_Cases().
+
+    repeat : Number of builds of each balun; the fastest one is kept.
+
+    Returns the results as a dictionary, see the module documentation.
+
+    '''
+
+    if cases == None:
+        cases = Bench_Cases()
+
+    meta = {'python' : platform.python_version(), 'numpy' : np.__version__,
+            'gdspy' : gdspy.__version__, 'machine' : platform.machine(),
+            'processor' : platform.processor(), 'repeat' : repeat}
+
+    timed = [_time_case(case, repeat) for case in cases]
+
+    return {'meta' : meta, 'cases' : timed, 'scaling' : Scaling(timed)}
+
+
+def _key(case):
+    return tuple(case[name] for name in ('topology', 'L', 'W', 'S', 'Pri', 'Sec', 'viaM', 'viaW', 'viaS'))
+
+
+def Compare(results, baseline, tolerance=0.25, min_seconds=1.0e-3):
+    '''
+
+    Flag the cases that are slower than in a baseline.
+
+    results : Benchmark results.
+
+    baseline : Benchmark results to compare against.
+
+    tolerance : Allowed relative slow down, e.g. 0.25 for 25%.
+
+    min_seconds : Slow downs shorter than this are ignored as noise.
+
+    Returns a list of dictionaries, one per regression, with the balun
+    parameters, 'seconds', 'baseline', and 'ratio'.  Cases missing from
+    the baseline are not compared.
+
+    '''
+
+    base = {_key(case) : case for case in baseline['cases']}
+
+    regressions = []
+    for case in results['cases']:
+        old = base.get(_key(case))
+        if old == None:
+            continue
+        slower = case['seconds'] - old['seconds']
+        if slower > tolerance*old['seconds'] and slower > min_seconds:
+            regression = {name : case[name] for name in ('topology', 'L', 'W', 'S', 'Pri', 'Sec')}
+            regression['seconds'] = case['seconds']
+            regression['baseline'] = old['seconds']
+            regression['ratio'] = case['seconds']/old['seconds']
+            regressions.append(regression)
+    return regressions
+
+
+def Save_Bench(results, path):
+    '''
+
+    Write benchmark results to a JSON file.
+
+    '''
+
+    with open(path, 'w') as outfile:
+        json.dump(results, outfile, indent = 1)
+
+
+def Load_Bench(path):
+    '''
+
+    Read benchmark results written by 'Save_Bench'.
+
+    '''
+
+    with open(path) as infile:
+        return json.load(infile)
+
+
+def Bench_Baseline(path, results, update=False, tolerance=0.25, min_seconds=1.0e-3):
+    '''
+
+    Compare benchmark results with the baseline in 'path'.
+
+    If there is no baseline yet, or 'update' is True, the results are saved
+    as the new baseline and nothing is flagged.
+
+    Returns the list of regressions, see 'Compare'.
+
+    '''
+
+    if update or not os.path.exists(path):
+        Save_Bench(results, path)
+        return []
+    return Compare(results, Load_Bench(path), tolerance, min_seconds)
+
+
+def _rss():
+    '''
+
+    Peak resident set size of this process in bytes, or None where the
+    'resource' module is not available.
+
+    '''
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if platform.system() == 'Darwin':
+        return rss
+    return 1024*rss
+
+
+def _memory_case(args):
+    '''
+
+    Worker for 'Memory_Bench'.  Builds a balun once for its peak RSS, then
+    again under tracemalloc for the memory of its stages.
+
+    '''
+
+    case, sites = args
+
+    rss0 = _rss()
+    balun_cell = Balun_Build(gdspy.GdsLibrary(), **case)[0]
+    rss1 = _rss()
+    polygons = len(balun_cell.get_polygons()) if balun_cell != None else 0
+    del balun_cell
+
+    lib = gdspy.GdsLibrary()
+    with BPF.Profile(memory = True, sites = sites) as profile:
+        Balun_Build(lib, **case)
+
+    result = dict(case)
+    result['tracks'] = case['Pri'] + case['Sec']
+    result['polygons'] = polygons
+    result['rss_start'] = rss0
+    result['rss_peak'] = rss1
+    result['stages'] = {}
+    for record in profile.records:
+        stage = result['stages'].setdefault(record['stage'], {'bytes' : 0, 'peak_bytes' : 0})
+        stage['bytes'] += record['bytes']
+        stage['peak_bytes'] = max(stage['peak_bytes'], record['peak_bytes'])
+        if record['stage'] == 'balun':
+            result['bytes'] = record['bytes']
+            result['peak_bytes'] = record['peak_bytes']
+            result['sites'] = record.get('sites', [])
+    result['bytes_per_polygon'] = result['bytes']/polygons if polygons else None
+
+    return result
+
+
+def Memory_Bench(cases=None, sites=10):
+    '''
+
+    Run the memory benchmark.  Each balun is built in a fresh process, so
+    the peak RSS of one does not hide the next.
+
+    cases : List of Balun_Build arguments.  The default is Bench_Cases().
+
+    sites : Number of top allocation sites to keep per balun.
+
+    Returns a dictionary with 'meta' and 'cases'.  Each case has the balun
+    parameters and:
+
+    tracks, polygons : Number of tracks, and of polygons of the balun cell.
+
+    rss_start, rss_peak : Peak RSS of the worker before and after the
+                          untraced build, in bytes.  None without the
+                          'resource' module.
+
+    bytes : Memory kept by the GDS library of the balun once built, i.e.
+            the bytes per balun a worker holds.
+
+    peak_bytes : Peak memory allocated while building.
+
+    bytes_per_polygon : bytes over polygons.
+
+    stages : Stage name to its 'bytes' and 'peak_bytes'.
+
+    sites : Top allocation sites of the memory kept, [file:line, bytes, count].
+
+    '''
+
+    if cases == None:
+        cases = Bench_Cases()
+
+    meta = {'python' : platform.python_version(), 'numpy' : np.__version__,
+            'gdspy' : gdspy.__version__, 'machine' : platform.machine(),
+            'processor' : platform.processor()}
+
+    with multiprocessing.Pool(1, maxtasksperchild = 1) as pool:
+        measured = list(pool.imap(_memory_case, [(case, sites) for case in cases], 1))
+
+    return {'meta' : meta, 'cases' : measured}
+
+
+def Memory_Report(results, sites=3):
+    '''
+
+    Text report of memory benchmark results, per topology, with the top
+    allocation sites of its largest balun.
+
+    '''
+
+    lines = []
+    for top in dict.fromkeys(case['topology'] for case in results['cases']):
+        cases = [case for case in results['cases'] if case['topology'] == top]
+        lines.append(top + ' :')
+        lines.append('  tracks   polygons   kept(kB)   peak(kB)   B/polygon   RSS peak(MB)')
+        for case in cases:
+            rss = case['rss_peak']/2**20 if case['rss_peak'] != None else float('nan')
+            lines.append('  {:6d}   {:8d}   {:8.1f}   {:8.1f}   {:9.0f}   {:12.1f}'.format(
+                case['tracks'], case['polygons'], case['bytes']/1024, case['peak_bytes']/1024,
+                case['bytes_per_polygon'] or 0, rss))
+        for site, size, count in cases[-1]['sites'][:sites]:
+            lines.append('  {:8.1f} kB in {:6d} blocks at {}'.format(size/1024, count, site))
+    return '\n'.join(lines)
+
+
+def Report(results, regressions=()):
+    '''
+
+    Text report of benchmark results: the scaling curve of each topology
+    with the stage times, then the regressions.
+
+    '''
+
+    lines = []
+    for top, k in results['scaling'].items():
+        lines.append('{} : seconds ~ tracks**{:.2f}'.format(top, k))
+        lines.append('  tracks   total(ms)   parts(ms)   build(ms)   polygons')
+        for case in results['cases']:
+            if case['topology'] != top:
+                continue
+            stages = case['stages']
+            parts = sum(stages.get(name, 0.0) for name in ('SQ', 'VIA', 'X', 'XX', 'XI', 'parts', 'TR', 'P'))
+            lines.append('  {:6d}   {:9.2f}   {:9.2f}   {:9.2f}   {:8d}'.format(
+                case['tracks'], 1e3*case['seconds'], 1e3*parts, 1e3*stages.get('build', 0.0), case['polygons']))
+
+    for regression in regressions:
+        lines.append('SLOWER {topology} L={L} W={W} S={S} Pri={Pri} Sec={Sec}: '
+                     '{seconds:.4f} s vs {baseline:.4f} s ({ratio:.2f}x)'.format(**regression))
+    return '\n'.join(lines)
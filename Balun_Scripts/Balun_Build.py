@@ -0,0 +1,316 @@
+import hashlib
+import gdspy
+import Balun_Scripts.Balun_Parts as BP
+import Balun_Scripts.Valid_Check as VC
+import Balun_Scripts.Balun_Profile as BPF
+from Balun_Scripts.Balun_X_Build import Balun_X_Build
+from Balun_Scripts.Balun_XX_Build import Balun_XX_Build
+from Balun_Scripts.Balun_XI_Build import Balun_XI_Build
+from Balun_Scripts.Valid_Check import LIMIT
+
+######################################################################
+# Crossovers used, and the turn ratio rule for each balun topology,  #
+# as used by the example scripts.  The crossover that limits the     #
+# inner most track is Valid_Check.LIMIT.                             #
+######################################################################
+CROSS = {'X' : ('X',), 'XX' : ('X', 'XX'), 'XI' : ('X', 'XX', 'XI')}
+RATIO = {'X' : VC.Ratio_X, 'XX' : VC.Ratio_XX, 'XI' : VC.Ratio_XI}
+
+# Cells made for a single balun, not shared with other baluns as the
+# parts are
+BUILD_CELLS = ('TR', 'P', 'CLR', 'temp')
+BUILD = {'X' : Balun_X_Build, 'XX' : Balun_XX_Build, 'XI' : Balun_XI_Build}
+
+
+def Balun_Build(lib, topology, L, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1, C_Name=None, ns='', clearance='boolean', flat=True, cache=None,
+                tl=37, bl=33, vl=36):
+    '''
+
+    Run the Balun_Parts -> Valid_Check -> Build chain of the example scripts
+    for a single balun.
+
+    lib : GDS library to generate the cells into.
+
+    topology : Balun topology, one of 'X', 'XX', or 'XI'.
+
+    L : Overall length of the octagonal balun.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    Pri : Number of turns of the primary.
+
+    Sec : Number of turns of the secondary.
+
+    viaM : Number of rows and columns of the via array.
+
+    viaW : Width of a square via.
+
+    viaS : Spacing between vias in the array.
+
+    C_Name : Cell name for the balun.
+             The default is 'Balun_' followed by the topology.
+
+    ns : Namespace prefixed to the names of the GDS cells of the parts.
+         Lets many baluns be built into one GDS library.
+
+    clearance : How the tracks are cleared for the crossovers and ports.
+                'boolean' subtracts the clearances with gdspy.fast_boolean.
+                'analytic' generates the tracks already split at the clearances.
+
+    flat : True to flatten the balun and its parts into polygons.
+           False keeps the via arrays as array references and the
+           crossovers and ports as cell references, so the written GDS
+           stays hierarchical.  Write the balun cell together with
+           balun_cell.get_dependencies(True) in that case.
+
+    cache : Balun_Parts.Part_Cache to take the cells of the parts and the
+            crossovers from.  None generates them for this balun only.
+
+    tl : Upper metal GDS layer number.
+
+    bl : Lower metal GDS layer number.
+
+    vl : Via GDS layer number.
+
+    Returns a tuple (balun_cell, max_tracks, ratio_valid).
+    balun_cell is None when the balun is not valid.
+
+    '''
+
+    if C_Name == None:
+        C_Name = 'Balun_' + topology
+
+    with BPF.Stage('balun', C_Name) as stage:
+        result = _build(lib, topology, L, W, S, Pri, Sec, viaM, viaW, viaS, C_Name, ns, clearance, flat,
+                        cache, tl, bl, vl)
+        stage.count(result[0])
+
+    return result
+
+
+def _build(lib, topology, L, W, S, Pri, Sec, viaM, viaW, viaS, C_Name, ns, clearance, flat, cache, tl, bl, vl):
+    '''
+
+    Balun_Build, inside the profiling stage of the balun.
+
+    '''
+
+    #############################################################
+    # With the given balun parameters, will the balun be valid? #
+    #############################################################
+    # Screened from the closed-form extents of the crossovers, so no GDS
+    # cells are generated for baluns that are not valid.
+    with BPF.Stage('screen'):
+        max_tracks = VC.max_tracks_analytic(L, W, S, LIMIT[topology], int(viaM), viaW, viaS)
+
+        # Total tracks should be even for 'XX' baluns
+        if topology == 'XX' and max_tracks%2:
+            max_tracks = max_tracks - 1
+
+        ratio_valid = RATIO[topology](int(Pri), int(Sec))
+
+    if max_tracks < (int(Pri) + int(Sec)) or not ratio_valid:
+        return None, max_tracks, ratio_valid
+
+    ##########################################
+    # Generate GDS cells of the balun parts  #
+    ##########################################
+    # Order is important as certain functions depend on previously generated GDS cells.
+    if cache != None:
+        with BPF.Stage('parts'):
+            cache.parts(lib, W, S, int(viaM), viaW, viaS, CROSS[topology], tl, bl, vl, ns = ns, flat = flat)
+    else:
+        with BPF.Stage('SQ') as stage:
+            stage.count(BP.SQ(lib, W, tl, ns = ns))
+        with BPF.Stage('VIA') as stage:
+            stage.count(BP.VIA(lib, int(viaM), viaW, viaS, vl, ns = ns, flat = flat))
+        with BPF.Stage('X') as stage:
+            stage.count(BP.X(lib, W, S, tl, bl, ns = ns, flat = flat))
+        if topology != 'X':
+            with BPF.Stage('XX') as stage:
+                stage.count(BP.XX(lib, W, S, tl, bl, ns = ns, flat = flat))
+        if topology == 'XI':
+            with BPF.Stage('XI') as stage:
+                stage.count(BP.XI(lib, W, S, tl, bl, ns = ns, flat = flat))
+
+    ##############################################
+    # Generate GDS cells of the tracks and ports #
+    ##############################################
+    with BPF.Stage('TR') as stage:
+        stage.count(BP.TR(lib, L, W, S, int(Pri), int(Sec), tl, ns = ns))
+
+    with BPF.Stage('P') as stage:
+        if topology == 'X':
+            stage.count(BP.P(lib, 'X', ns = ns, flat = flat))
+        else:
+            stage.count(BP.P(lib, ns = ns, flat = flat))
+
+    ########################
+    # Construct the balun  #
+    ########################
+    with BPF.Stage('build') as stage:
+        balun_cell = BUILD[topology](lib, L, W, S, int(Pri), int(Sec), tl, C_Name = C_Name, ns = ns,
+                                     clearance = clearance, flat = flat)
+        stage.count(balun_cell)
+
+    return balun_cell, max_tracks, ratio_valid
+
+
+class Build_Context:
+    '''
+
+    Owns the intermediate GDS cells of the baluns built in a library.
+
+    Balun_Build leaves the cells of the parts, the tracks 'TR', the ports
+    'P', the clearances 'CLR', and the temporary cells in the library, so
+    the same names cannot be built into it again.  A Build_Context removes
+    every cell added to the library since it was entered, except the
+    balun cells it is told to keep and the cells they reference.  The
+    library can then be reused for any number of builds while its memory
+    stays bounded.
+
+    The cells of a hierarchical (not flat) balun are referenced by the
+    balun cell, so unless a namespace is passed, the context names them
+    apart.  The parts get a namespace derived from their track, via, and
+    layer settings, so the builds that share parts reuse them from the
+    Part_Cache, and a GDS_Stream writes them once.  The BUILD_CELLS of each
+    balun get a prefix of its own.  Without a Part_Cache the parts are
+    generated again for each build, so they get the prefix too.
+
+    lib : GDS library the baluns are built into.
+
+    keep_parts : True to keep the cells of the parts in a Part_Cache for
+                 the next builds, instead of generating them every time.
+                 The cache is bounded by its maxsize.
+
+    cache : Balun_Parts.Part_Cache to use.  The default makes a new one
+            when keep_parts is True.
+
+    Use as a context manager, e.g.
+
+        with Build_Context(lib) as context:
+            for L in (250, 300, 400):
+                balun_cell, max_tracks, ratio_valid = context.build('XX', L, 8, 3, 2, 2,
+                                                                     C_Name = 'XX_' + str(L))
+
+    '''
+
+    def __init__(self, lib, keep_parts=True, cache=None):
+        self.lib = lib
+        if cache == None and keep_parts:
+            cache = BP.Part_Cache()
+        self.cache = cache
+        self._names = set(lib.cells)
+        self._kept = set()
+        self._builds = 0
+
+    def __enter__(self):
+        self._names = set(self.lib.cells)
+        self._kept = set()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+        return False
+
+    def build(self, topology, L, W, S, Pri, Sec, keep=True, **params):
+        '''
+
+        Build a balun with Balun_Build, then remove its intermediate cells.
+
+        keep : True to keep the balun cell in the library.
+               False removes it too; the returned cell is still usable,
+               e.g. to write it to a GDS_Stream.
+
+        params : Other arguments of Balun_Build.  Without 'ns', the
+                 BUILD_CELLS of a hierarchical balun are prefixed with
+                 '<C_Name or topology>_<build number>_', see the class
+                 documentation.
+
+        Returns the tuple (balun_cell, max_tracks, ratio_valid) of
+        Balun_Build.
+
+        '''
+
+        params.setdefault('cache', self.cache)
+        self._builds += 1
+        prefix = None
+        if 'ns' not in params and not params.get('flat', True):
+            prefix = '{}_{}_'.format(params.get('C_Name') or topology, self._builds)
+            params['ns'] = prefix
+            if params['cache'] != None:
+                params['ns'] = _parts_ns(topology, W, S, params)
+
+        before = set(self.lib.cells)
+        balun_cell, max_tracks, ratio_valid = Balun_Build(self.lib, topology, L, W, S, Pri, Sec, **params)
+
+        if prefix != None and params['ns'] != prefix:
+            # The cells of this balun only, out of the namespace of the parts
+            cells = self.lib.cells
+            for name in [params['ns'] + name for name in BUILD_CELLS]:
+                if name in cells and name not in before:
+                    cell = cells.pop(name)
+                    cell.name = prefix + name[len(params['ns']):]
+                    cells[cell.name] = cell
+
+        if balun_cell != None and keep:
+            self.keep(balun_cell)
+        self.release()
+        return balun_cell, max_tracks, ratio_valid
+
+    def keep(self, cell):
+        '''
+
+        Keep a cell, and the cells it references, in the library when the
+        intermediate cells are removed.
+
+        '''
+
+        self._kept.add(cell.name)
+
+    def discard(self, cell):
+        '''
+
+        Stop keeping a cell.  It is removed with the next 'release'.
+
+        '''
+
+        self._kept.discard(cell.name)
+
+    def release(self):
+        '''
+
+        Remove the cells added to the library since the context was
+        entered, except the kept cells and the cells they reference.
+
+        Returns the number of cells removed.
+
+        '''
+
+        cells = self.lib.cells
+        kept = set(self._kept)
+        for name in self._kept:
+            if name in cells:
+                kept.update(dep.name for dep in cells[name].get_dependencies(True))
+        self._kept = {name for name in self._kept if name in cells}
+
+        removed = [name for name in cells if name not in self._names and name not in kept]
+        for name in removed:
+            del cells[name]
+        return len(removed)
+
+
+def _parts_ns(topology, W, S, params):
+    '''
+
+    Namespace of the parts of a balun, the same for every balun with the
+    same crossovers, track, via, and layer settings.
+
+    '''
+
+    key = [CROSS[topology], float(W), float(S)]
+    for name, default in (('viaM', 4), ('viaW', 1), ('viaS', 1), ('tl', 37), ('bl', 33), ('vl', 36)):
+        key.append(float(params.get(name, default)))
+    return 'parts_' + hashlib.sha1(repr(key).encode()).hexdigest()[:8] + '_'
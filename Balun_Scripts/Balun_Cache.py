@@ -0,0 +1,251 @@
+'''
+Persistent on-disk cache of built baluns.
+
+Each balun is stored as the polygon arrays of its flattened cell in a
+NumPy .npz file named after the SHA-256 hash of its canonical parameters
+and of the source code of the balun scripts.  Any change to the scripts
+changes the hash, so stale entries are never returned; they age out of
+the cache instead.  The least recently used files are removed once the
+cache grows past its size limit.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import gdspy
+import Balun_Scripts.Balun_Parts as BP
+from Balun_Scripts.Balun_Build import Balun_Build
+
+##############################################################
+# Parameters of a cached balun and their defaults, in order. #
+##############################################################
+PARAMS = (('topology', 'XX'), ('L', 300), ('W', 8), ('S', 3),
+          ('Pri', 2), ('Sec', 2), ('viaM', 4), ('viaW', 1), ('viaS', 1),
+          ('tl', 37), ('bl', 33), ('vl', 36), ('clearance', 'boolean'))
+
+# Scripts whose source is part of the hash
+SOURCES = ('Balun_Build.py', 'Balun_Parts.py', 'Balun_Plan.py', 'Part_Extents.py',
+           'Valid_Check.py', 'Balun_X_Build.py', 'Balun_XX_Build.py', 'Balun_XI_Build.py')
+
+_version = None
+
+
+def Code_Version():
+    '''
+
+    SHA-256 hash of the source of the scripts that build the baluns.
+
+    '''
+
+    global _version
+    if _version == None:
+        digest = hashlib.sha256()
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for name in SOURCES:
+            with open(os.path.join(folder, name), 'rb') as source:
+                digest.update(source.read())
+        _version = digest.hexdigest()
+    return _version
+
+
+def Cache_Key(**params):
+    '''
+
+    Canonical hash of the parameters of a balun and of the code version.
+
+    params : Parameters of 'Balun_Build', see PARAMS.
+             Parameters left out take their default.
+
+    '''
+
+    canon = {}
+    for name, default in PARAMS:
+        value = params.get(name, default)
+        if isinstance(default, str):
+            canon[name] = str(value)
+        elif name in ('L', 'W', 'S', 'viaW', 'viaS'):
+            # 8, 8.0, and numpy.float64(8) are the same balun
+            canon[name] = float(value)
+        else:
+            canon[name] = int(value)
+
+    text = json.dumps([canon, Code_Version()], sort_keys = True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class Balun_Cache:
+    '''
+
+    Persistent cache of built baluns in a directory.
+
+    directory : Folder of the cache files.  Created if needed.
+
+    max_bytes : Size limit of the cache files.  The least recently used
+                files are removed beyond it.
+
+    '''
+
+    def __init__(self, directory, max_bytes=256*2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok = True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        '''
+
+        Cached polygons of a balun, or None on a miss.
+
+        Returns a tuple (polygons, max_tracks, ratio_valid).
+        polygons is a dictionary of (layer, datatype) to a list of vertex
+        arrays, or None if the balun is not valid.
+
+        '''
+
+        path = self._path(key)
+        try:
+            data = np.load(path)
+        except (OSError, ValueError):
+            return None
+
+        with data:
+            max_tracks = int(data['max_tracks'])
+            ratio_valid = bool(data['ratio_valid'])
+            polygons = None
+            if bool(data['built']):
+                polygons = {}
+                for layer, datatype in data['specs']:
+                    name = 'L{}_D{}'.format(layer, datatype)
+                    splits = np.cumsum(data[name + '_n'])[:-1]
+                    polygons[(int(layer), int(datatype))] = np.split(data[name], splits)
+
+        # Mark as recently used, unless another process just evicted it
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return polygons, max_tracks, ratio_valid
+
+    def put(self, key, cell, max_tracks, ratio_valid):
+        '''
+
+        Store a built balun.
+
+        cell : GDS cell of the balun, or None if it is not valid.
+
+        '''
+
+        arrays = {'max_tracks' : max_tracks, 'ratio_valid' : ratio_valid,
+                  'built' : cell != None}
+
+        specs = []
+        if cell != None:
+            for (layer, datatype), polygons in sorted(cell.get_polygons(by_spec = True).items()):
+                name = 'L{}_D{}'.format(layer, datatype)
+                arrays[name] = np.concatenate(polygons)
+                arrays[name + '_n'] = [len(polygon) for polygon in polygons]
+                specs.append((layer, datatype))
+        arrays['specs'] = np.array(specs, dtype = int).reshape(-1, 2)
+
+        # Write to a temporary file first so readers never see a partial file
+        handle, temp = tempfile.mkstemp(suffix = '.npz', dir = self.directory)
+        with os.fdopen(handle, 'wb') as outfile:
+            np.savez(outfile, **arrays)
+        os.replace(temp, self._path(key))
+
+        self.evict()
+
+    def evict(self):
+        '''
+
+        Remove the least recently used files until the cache fits in
+        max_bytes.
+
+        '''
+
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        '''
+
+        Remove every file of the cache.
+
+        '''
+
+        max_bytes = self.max_bytes
+        self.max_bytes = -1
+        self.evict()
+        self.max_bytes = max_bytes
+
+    def build(self, lib, C_Name=None, ns='', cache=None, **params):
+        '''
+
+        Same as Balun_Build, returning the cached balun when there is one.
+
+        A cached balun is returned as a flat GDS cell of polygons, added to
+        'lib' under C_Name.  On a miss the balun is built with Balun_Build
+        and stored.
+
+        lib : GDS library to add the balun cell to.
+
+        C_Name : Cell name for the balun.
+                 The default is 'Balun_' followed by the topology.
+
+        ns : Namespace of the cells of the parts, on a miss.
+
+        cache : Balun_Parts.Part_Cache used on a miss.
+
+        params : Parameters of the balun, see PARAMS.  The cache holds
+                 flat baluns only, so flat=False raises ValueError.
+
+        Returns a tuple (balun_cell, max_tracks, ratio_valid).
+
+        '''
+
+        if not params.get('flat', True):
+            raise ValueError('Balun_Cache holds flat baluns only, not flat=False')
+
+        key = Cache_Key(**params)
+        found = self.get(key)
+
+        if found == None:
+            self.misses += 1
+            balun_cell, max_tracks, ratio_valid = Balun_Build(lib, C_Name = C_Name, ns = ns,
+                                                              cache = cache, **params)
+            self.put(key, balun_cell, max_tracks, ratio_valid)
+            return balun_cell, max_tracks, ratio_valid
+
+        self.hits += 1
+        polygons, max_tracks, ratio_valid = found
+        if polygons == None:
+            return None, max_tracks, ratio_valid
+
+        if C_Name == None:
+            C_Name = 'Balun_' + params.get('topology', 'XX')
+        balun_cell = BP.Cell(lib, C_Name)
+        for (layer, datatype), points in polygons.items():
+            balun_cell.add(gdspy.PolygonSet(points, layer, datatype))
+
+        return balun_cell, max_tracks, ratio_valid
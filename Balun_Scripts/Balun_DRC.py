@@ -0,0 +1,407 @@
+'''
+Design rule check of the balun layouts.
+
+The rules come from a rule deck, a dictionary of GDS layer to the rules of
+that layer:
+
+width : Minimum width of the metal.
+
+spacing : Minimum spacing between the shapes of the layer, and across the
+          notches of a shape.
+
+size : Exact width and height of the square vias of a via layer.
+
+enclosure : Dictionary of metal layer to the minimum enclosure of the vias
+            by that metal.  A via must lie inside the metal.
+
+A layer may have any of the rules; the other layers are not checked.  The
+polygons of each layer are first merged, so shapes that touch or overlap
+count as one.  Width and spacing are measured between the edges that
+face each other, within 45 degrees of opposite, from the inside of the
+shape for the width and from the outside for the spacing.
+
+Nearby edges are found through the uniform grid of Balun_Nets.Layout_Index,
+so only the edges within a rule distance of each other are measured, and
+the layers are checked in parallel threads.
+
+Violation keys:
+
+rule : 'width', 'spacing', 'size', 'enclosure', or 'cover' for a via not
+       inside the metal of an enclosure rule.
+
+layer : GDS layer of the shapes.
+
+other : Metal layer of an enclosure or cover rule.
+
+value : Measured distance, or the width and height of a via for 'size'.
+
+limit : Value of the rule.
+
+points : Pair of points [[x, y], [x, y]] the distance was measured
+         between, or the corners of the via for 'size' and 'cover'.
+'''
+
+import concurrent.futures
+import json
+import os
+import numpy as np
+import gdspy
+import Balun_Scripts.Balun_Nets as BN
+import Balun_Scripts.Balun_Plan as BPL
+
+##############################################################
+# Rule deck for the default track and via settings of the    #
+# example scripts: W=8, S=3, viaM=4, viaW=1, viaS=1           #
+##############################################################
+DECK = {37 : {'width' : 2.0, 'spacing' : 2.0},
+        33 : {'width' : 2.0, 'spacing' : 2.0},
+        36 : {'size' : 1.0, 'spacing' : 1.0, 'enclosure' : {37 : 0.5, 33 : 0.5}}}
+
+
+def Load_Deck(path):
+    '''
+
+    Read a rule deck from a JSON file, e.g.
+
+        {"37" : {"width" : 2, "spacing" : 2},
+         "36" : {"size" : 1, "spacing" : 1, "enclosure" : {"37" : 0.5}}}
+
+    Returns the rule deck, with the layers as integers.
+
+    '''
+
+    with open(path) as infile:
+        deck = json.load(infile)
+
+    rules = {}
+    for layer, layer_rules in deck.items():
+        rules[int(layer)] = dict(layer_rules)
+        if 'enclosure' in layer_rules:
+            rules[int(layer)]['enclosure'] = {int(metal) : value for metal, value in layer_rules['enclosure'].items()}
+    return rules
+
+
+def _layers(polygons):
+    '''
+
+    Dictionary of GDS layer to its list of polygons, of all datatypes.
+
+    '''
+
+    if hasattr(polygons, 'get_polygons'):
+        polygons = polygons.get_polygons(by_spec = True)
+
+    layers = {}
+    for (layer, datatype), points in polygons.items():
+        layers.setdefault(layer, []).extend(points)
+    return layers
+
+
+def _merge(polygons):
+    '''
+
+    Merge overlapping and touching polygons, and orient the result
+    counterclockwise, so the inside of every edge is on its left.
+
+    '''
+
+    if not polygons:
+        return []
+    merged = gdspy.boolean(polygons, None, 'or', max_points = 0)
+    if merged == None:
+        return []
+
+    area = _areas(merged.polygons)
+    return [points if a > 0 else points[::-1] for points, a in zip(merged.polygons, area)]
+
+
+def _areas(polygons):
+    '''
+
+    Signed areas of a list of polygons, positive for the counterclockwise
+    ones.
+
+    '''
+
+    starts, ends, owner = BN._edges(polygons)
+    cross = starts[:, 0]*ends[:, 1] - starts[:, 1]*ends[:, 0]
+    return np.bincount(owner, cross, len(polygons))/2
+
+
+def _bin_size(polygons, limit):
+    '''
+
+    Size of the grid bins to check the polygons against a rule distance:
+    about the length of their short edges, e.g. the track ends, but at
+    least a few times the rule distance.
+
+    '''
+
+    starts, ends, owner = BN._edges(polygons)
+    return max(np.percentile(np.hypot(*(ends - starts).T), 25), 4*limit)
+
+
+def _closest(a0, a1, b0, b1):
+    '''
+
+    Closest points of the segments a0-a1 and b0-b1.
+
+    Returns the arrays (distance, point on a, point on b).  Segments that
+    cross are at distance 0, at their crossing.
+
+    '''
+
+    def project(p, s0, s1):
+        d = s1 - s0
+        t = np.clip(((p - s0)*d).sum(1)/np.maximum((d*d).sum(1), 1e-300), 0, 1)
+        return s0 + t[:, None]*d
+
+    def cross(o, p, q):
+        return (p[:, 0] - o[:, 0])*(q[:, 1] - o[:, 1]) - (p[:, 1] - o[:, 1])*(q[:, 0] - o[:, 0])
+
+    p = np.stack((a0, a1, project(b0, a0, a1), project(b1, a0, a1)))
+    q = np.stack((project(a0, b0, b1), project(a1, b0, b1), b0, b1))
+    distance = np.hypot(q[..., 0] - p[..., 0], q[..., 1] - p[..., 1])
+    k = distance.argmin(0)
+    n = np.arange(len(a0))
+    distance, p, q = distance[k, n], p[k, n], q[k, n]
+
+    c0 = cross(a0, a1, b0)
+    c1 = cross(a0, a1, b1)
+    crossing = (c0*c1 < 0) & (cross(b0, b1, a0)*cross(b0, b1, a1) < 0)
+    t = c0[crossing]/(c0[crossing] - c1[crossing])
+    p[crossing] = q[crossing] = b0[crossing] + t[:, None]*(b1[crossing] - b0[crossing])
+    distance[crossing] = 0
+    return distance, p, q
+
+
+def _violation(rule, layer, value, limit, p, q, other=None):
+    '''
+
+    Violation dictionary, see the module documentation.
+
+    '''
+
+    violation = {'rule' : rule, 'layer' : int(layer)}
+    if other != None:
+        violation['other'] = int(other)
+    violation['value'] = value
+    violation['limit'] = limit
+    violation['points'] = [[float(p[0]), float(p[1])], [float(q[0]), float(q[1])]]
+    return violation
+
+
+def _facing(layer, polygons, width, spacing, tolerance):
+    '''
+
+    Width and spacing violations of the merged polygons of a layer.
+
+    '''
+
+    limit = max(width or 0, spacing or 0)
+    if not polygons or limit <= 0:
+        return []
+
+    index = BN.Layout_Index(polygons, _bin_size(polygons, limit))
+    i, j = index.near(np.ones(len(polygons), dtype = bool), None, limit/2)
+    edges = BN._unique_pairs(index.edge[i], index.edge[j], len(index.starts))
+    a, b = edges[:, 0], edges[:, 1]
+
+    # Edges next to each other in a polygon share a vertex
+    sizes = np.array([len(points) for points in polygons])
+    offsets = np.cumsum(sizes) - sizes
+    following = np.arange(len(index.starts)) + 1
+    following[offsets + sizes - 1] = offsets
+    keep = (a != b) & (following[a] != b) & (following[b] != a)
+
+    # The two edges of the cut that joins a hole to the outside of a
+    # merged polygon lie on each other
+    twin = np.all(np.isclose(index.starts[a], index.ends[b], 0, tolerance) &
+                  np.isclose(index.ends[a], index.starts[b], 0, tolerance), axis = 1)
+    a, b = a[keep & ~twin], b[keep & ~twin]
+
+    distance, p, q = _closest(index.starts[a], index.ends[a], index.starts[b], index.ends[b])
+
+    # Outward normals, to the right of the counterclockwise edges
+    def outward(e):
+        d = index.ends[e] - index.starts[e]
+        return np.stack((d[:, 1], -d[:, 0]), axis = 1)/np.maximum(np.hypot(*d.T), 1e-300)[:, None]
+
+    na, nb = outward(a), outward(b)
+    opposite = (na*nb).sum(1) < -np.sqrt(0.5) - 1e-9
+    v = q - p
+    va = (v*na).sum(1)
+    vb = (v*nb).sum(1)
+    small = 1e-6*distance
+
+    violations = []
+    for rule, limit, faces in (('width', width, (va < -small) & (vb > small)),
+                               ('spacing', spacing, (va > small) & (vb < -small))):
+        if not limit:
+            continue
+        for k in np.flatnonzero(opposite & faces & (distance > tolerance) & (distance < limit - tolerance)):
+            violations.append(_violation(rule, layer, float(distance[k]), limit, p[k], q[k]))
+    return violations
+
+
+def _size(layer, polygons, size, tolerance):
+    '''
+
+    Vias of a layer that are not squares of the given size.
+
+    '''
+
+    if not polygons:
+        return []
+
+    points = np.concatenate(polygons)
+    sizes = np.array([len(p) for p in polygons])
+    low = np.minimum.reduceat(points, np.cumsum(sizes) - sizes)
+    high = np.maximum.reduceat(points, np.cumsum(sizes) - sizes)
+    box = high - low
+    # A square has the area of its bounding box
+    wrong = (np.any(abs(box - size) > tolerance, axis = 1) |
+             (abs(abs(_areas(polygons)) - box[:, 0]*box[:, 1]) > tolerance*box.sum(1)))
+
+    return [_violation('size', layer, box[k].tolist(), size, low[k], high[k]) for k in np.flatnonzero(wrong)]
+
+
+def _enclosure(layer, vias, metal_layer, metal, limit, tolerance):
+    '''
+
+    Vias of a layer not enclosed by at least 'limit' of the metal.
+
+    '''
+
+    if not vias:
+        return []
+
+    violations = []
+    polygons = vias + metal
+    is_metal = np.arange(len(polygons)) >= len(vias)
+    covered = np.zeros(len(vias), dtype = bool)
+    if metal:
+        # Bins for the metal edges, the vias are much smaller
+        index = BN.Layout_Index(polygons, _bin_size(metal, limit))
+        sizes = np.array([len(points) for points in vias])
+        centers = np.add.reduceat(np.concatenate(vias), np.cumsum(sizes) - sizes)/sizes[:, None]
+        covered[index.inside(centers, is_metal)[0]] = True
+
+    for v in np.flatnonzero(~covered):
+        violations.append(_violation('cover', layer, 0.0, limit, vias[v].min(0), vias[v].max(0), metal_layer))
+
+    if metal and limit > 0:
+        i, j = index.near(~is_metal, is_metal, limit/2)
+        a, b = index.edge[i], index.edge[j]
+        edges = BN._unique_pairs(a, b, len(index.starts))
+        a, b = edges[:, 0], edges[:, 1]
+        distance, p, q = _closest(index.starts[a], index.ends[a], index.starts[b], index.ends[b])
+
+        # Only the nearest metal edge of each via counts
+        via = index.owner[np.searchsorted(index.edge, a)]
+        near = covered[via] & (distance < limit - tolerance)
+        order = np.lexsort((distance[near], via[near]))
+        via, distance, p, q = via[near][order], distance[near][order], p[near][order], q[near][order]
+        first = np.concatenate(([True], via[1:] != via[:-1])) if len(via) else np.zeros(0, dtype = bool)
+        for k in np.flatnonzero(first):
+            violations.append(_violation('enclosure', layer, float(distance[k]), limit, p[k], q[k], metal_layer))
+    return violations
+
+
+def _check_layer(task):
+    '''
+
+    Check the rules of a layer.  Worker of 'Layout_DRC'.
+
+    '''
+
+    layer, rules, polygons, metals, tolerance = task
+
+    merged = _merge(polygons)
+    violations = _facing(layer, merged, rules.get('width'), rules.get('spacing'), tolerance)
+    if 'size' in rules:
+        violations.extend(_size(layer, merged, rules['size'], tolerance))
+    for metal_layer, limit in rules.get('enclosure', {}).items():
+        violations.extend(_enclosure(layer, merged, metal_layer, _merge(metals[metal_layer]), limit, tolerance))
+    return violations
+
+
+def Layout_DRC(polygons, deck=DECK, workers=None, tolerance=1e-3):
+    '''
+
+    Check a layout against a rule deck.
+
+    polygons : gdspy cell, or dictionary of (layer, datatype) to a list of
+               arrays of points, as returned by get_polygons(by_spec=True).
+
+    deck : Rule deck, see the module documentation and 'Load_Deck'.
+
+    workers : Number of threads checking the layers.  The default of None
+              uses one per layer, up to the number of CPUs.  Use 1 inside
+              the worker processes of a sweep.
+
+    tolerance : Distances within this of a rule pass.
+
+    Returns the list of violations, see the module documentation, sorted
+    by rule, layer, and position.
+
+    '''
+
+    layers = _layers(polygons)
+
+    tasks = []
+    for layer, rules in deck.items():
+        metals = {metal : layers.get(metal, []) for metal in rules.get('enclosure', {})}
+        tasks.append((layer, rules, layers.get(layer, []), metals, tolerance))
+
+    if workers == None:
+        workers = min(len(tasks), os.cpu_count() or 1)
+    if workers <= 1:
+        checked = map(_check_layer, tasks)
+        violations = [violation for result in checked for violation in result]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            violations = [violation for result in pool.map(_check_layer, tasks) for violation in result]
+
+    # The same spot is found from both of its edges
+    unique = {}
+    for violation in violations:
+        points = tuple(sorted(tuple(np.round(point, 6)) for point in violation['points']))
+        unique.setdefault((violation['rule'], violation['layer'], violation.get('other'), points), violation)
+
+    return sorted(unique.values(), key = lambda v : (v['rule'], v['layer'], v['points']))
+
+
+def Balun_DRC(balun_cell, topology, L, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1, deck=DECK, bl=33, workers=None,
+              tolerance=1e-3):
+    '''
+
+    Check a balun cell built by Balun_Build against a rule deck.
+
+    The via arrays of the center taps only land on the upper metal; the
+    lower metal that reaches them is drawn with the rest of the chip.
+    Their 'cover' violations by bl are left out.
+
+    balun_cell : Balun cell, flat or not.
+
+    The other arguments are those the balun was built with, and those of
+    'Layout_DRC'.
+
+    Returns the list of violations, see the module documentation.
+
+    '''
+
+    plan = BPL.Balun_Plan(topology, L, W, S, Pri, Sec, viaM, viaW, viaS)
+    # The vias are in the frame of the tracks
+    sign = -1 if plan['rotation'] % 360 == 180 else 1
+    ctaps = np.array([(sign*x, sign*y) for x, y in plan['vias']]).reshape(-1, 2)
+    half = (viaM*viaW + (viaM - 1)*viaS)/2 + tolerance
+
+    def at_ctap(violation):
+        if violation['rule'] != 'cover' or violation.get('other') != bl:
+            return False
+        center = np.mean(violation['points'], axis = 0)
+        return bool(np.any(np.all(abs(ctaps - center) <= half, axis = 1)))
+
+    violations = Layout_DRC(balun_cell, deck, workers, tolerance)
+    return [violation for violation in violations if not at_ctap(violation)]
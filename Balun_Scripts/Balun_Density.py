@@ -0,0 +1,198 @@
+'''
+Metal density of the balun layouts.
+
+Foundry density rules bound the fraction of each window of the chip
+covered by a metal layer.  The windows are squares of side 'window',
+placed every 'step' from the origin, so they overlap when the step is
+smaller than the window.  The window must be a whole number of steps.
+
+The area of metal in each window is integrated exactly, not sampled.
+The polygons of a layer are merged, then every edge is cut at the lines
+of a grid of tiles of side 'step'.  Each piece of edge lies in one tile:
+it adds the trapezoid between itself and the left side of its tile to
+that tile, and a full tile width to every tile left of it in its row.
+This is the shoelace formula, split by tile, and takes a few sorts and
+sums whatever the number of tiles.  The windows are then summed from the
+tiles with a summed-area table.
+
+Density map keys:
+
+origin : Lower left corner [x, y] of the first window.
+
+window, step : Side of the windows, and distance between them.
+
+layers : Dictionary of GDS layer to the array of the density of each
+         window, indexed [row, column], rows along y and columns along x.
+         The window [i, j] has its lower left corner at
+         origin + (j*step, i*step).
+'''
+
+import numpy as np
+import Balun_Scripts.Balun_DRC as BD
+import Balun_Scripts.Balun_Nets as BN
+
+
+def _tile_areas(polygons, origin, tile, shape):
+    '''
+
+    Area of the counterclockwise polygons in each tile of a grid.
+
+    origin : Lower left corner of the grid.
+
+    tile : Side of the square tiles.
+
+    shape : Number of tiles (rows, columns).
+
+    Returns an array of the areas, of the given shape.
+
+    '''
+
+    rows, columns = shape
+    if not polygons:
+        return np.zeros(shape)
+
+    starts, ends, owner = BN._edges(polygons)
+    starts = (starts - origin)/tile
+    ends = (ends - origin)/tile
+    d = ends - starts
+
+    # Parameters along each edge of its crossings with the grid lines
+    cuts = [np.zeros(len(starts)), np.ones(len(starts))]
+    edges = [np.arange(len(starts))]*2
+    for axis in (0, 1):
+        low = np.minimum(starts[:, axis], ends[:, axis])
+        high = np.maximum(starts[:, axis], ends[:, axis])
+        first = np.floor(low).astype(np.int64) + 1
+        last = np.ceil(high).astype(np.int64)
+        edge, line = BN._ranges(first, last)
+        cuts.append((line - starts[edge, axis])/d[edge, axis])
+        edges.append(edge)
+    t = np.concatenate(cuts)
+    edge = np.concatenate(edges)
+    order = np.lexsort((t, edge))
+    t, edge = t[order], edge[order]
+
+    # Pieces between consecutive cuts of the same edge
+    same = edge[1:] == edge[:-1]
+    e = edge[:-1][same]
+    a = starts[e] + t[:-1][same, None]*d[e]
+    b = starts[e] + t[1:][same, None]*d[e]
+    middle = (a + b)/2
+    column = np.floor(middle[:, 0]).astype(np.int64)
+    row = np.floor(middle[:, 1]).astype(np.int64)
+    dy = b[:, 1] - a[:, 1]
+
+    inside = (row >= 0) & (row < rows)
+    # Trapezoid between the piece and the left side of its tile
+    here = inside & (column >= 0) & (column < columns)
+    areas = np.bincount(row[here]*columns + column[here], (middle[here, 0] - column[here])*dy[here],
+                        rows*columns).reshape(shape).astype(float)
+
+    # A full tile for every tile left of the piece, summed from the right
+    # end of the row.  The pieces right of the grid cover its whole row.
+    left = inside & (column > 0)
+    cover = np.bincount(row[left]*(columns + 1) + np.minimum(column[left], columns), dy[left],
+                        rows*(columns + 1)).reshape(rows, columns + 1)
+    areas += np.cumsum(cover[:, :0:-1], axis = 1)[:, ::-1]
+
+    return areas*tile*tile
+
+
+def Density_Map(polygons, window=100.0, step=50.0, layers=(37, 33), origin=None, extent=None):
+    '''
+
+    Density of metal layers over a grid of windows.
+
+    polygons : gdspy cell, or dictionary of (layer, datatype) to a list of
+               arrays of points, as returned by get_polygons(by_spec=True).
+
+    window : Side of the square windows.
+
+    step : Distance between the windows.  window must be a multiple of it.
+
+    layers : GDS layers to map, e.g. the upper and lower metal tl and bl.
+
+    origin : Lower left corner [x, y] of the first window.  The default is
+             the lower left corner of the layout.
+
+    extent : Upper right corner [x, y] the windows must reach.  The
+             default is the upper right corner of the layout.  Metal
+             outside origin-extent still counts in the windows it is in.
+
+    Returns the density map, see the module documentation.
+
+    '''
+
+    windows = int(round(window/step))
+    if windows < 1 or abs(windows*step - window) > 1e-9*window:
+        raise ValueError('The window {} is not a multiple of the step {}'.format(window, step))
+
+    shapes = BD._layers(polygons)
+    if origin is None or extent is None:
+        points = np.concatenate([np.concatenate(shapes[layer]) for layer in layers if shapes.get(layer)] or
+                                [np.zeros((1, 2))])
+        if origin is None:
+            origin = points.min(0)
+        if extent is None:
+            extent = points.max(0)
+    origin = np.asarray(origin, dtype = float)
+
+    # Windows to reach the extent, and the tiles under them
+    count = np.maximum(np.ceil((np.asarray(extent) - origin - window)/step - 1e-9).astype(np.int64), 0) + 1
+    tiles = (count[1] + windows - 1, count[0] + windows - 1)
+
+    density = {}
+    for layer in layers:
+        areas = _tile_areas(BD._merge(shapes.get(layer, [])), origin, step, tiles)
+        # Summed-area table of the tiles
+        table = np.zeros((tiles[0] + 1, tiles[1] + 1))
+        table[1:, 1:] = areas.cumsum(0).cumsum(1)
+        n = windows
+        sums = table[n:, n:] - table[:-n, n:] - table[n:, :-n] + table[:-n, :-n]
+        # Up to the rounding of the sums
+        density[layer] = np.clip(sums/(window*window), 0, 1)
+
+    return {'origin' : origin.tolist(), 'window' : window, 'step' : step, 'layers' : density}
+
+
+def Check_Density(density_map, limits):
+    '''
+
+    Windows of a density map outside the density limits.
+
+    density_map : Density map from 'Density_Map'.
+
+    limits : Dictionary of GDS layer to (minimum, maximum) density, e.g.
+             {37 : (0.2, 0.8)}.  Either may be None.
+
+    Returns a list of violations, each a dictionary of:
+
+    layer : GDS layer.
+
+    rule : 'min' or 'max'.
+
+    limit : Density limit.
+
+    density : Density of the window.
+
+    window : Lower left and upper right corners [[x, y], [x, y]] of the
+             window.
+
+    '''
+
+    origin = np.asarray(density_map['origin'])
+    step = density_map['step']
+    window = density_map['window']
+
+    violations = []
+    for layer, (low, high) in limits.items():
+        density = np.asarray(density_map['layers'][layer])
+        for rule, limit, sign in (('min', low, -1), ('max', high, 1)):
+            if limit == None:
+                continue
+            for i, j in zip(*np.nonzero(sign*(density - limit) > 0)):
+                corner = origin + (j*step, i*step)
+                violations.append({'layer' : int(layer), 'rule' : rule, 'limit' : limit,
+                                   'density' : float(density[i, j]),
+                                   'window' : [corner.tolist(), (corner + window).tolist()]})
+    return violations
@@ -0,0 +1,304 @@
+'''
+Graph representation of the baluns, as described in the README.
+
+The tracks are cut at the crossovers on the x-axis and on the y-axis into
+quarters.  Each quarter is a vertex (half, k, side): half 'u' above or 'd'
+below the x-axis, side 'l' left or 'r' right of the y-axis, and k the
+track, 0 for the outer most one.  The crossovers become edges:
+
+- A crossover on the x-axis joins upper quarters to lower quarters.
+- A crossover on the y-axis joins left quarters to right quarters.
+- A track that runs straight across an axis joins its two quarters.
+- The outer most track is cut by the ports on the y-axis, so its quarters
+  only have the edge across the x-axis.  These are the port vertices.
+
+The graphs of the README fold the balun about the y-axis, so that their
+vertex ('u', k) stands for both ('u', k, 'l') and ('u', k, 'r'), and a
+straight track across the y-axis becomes a self loop, the center tap.
+The graph here is kept unfolded, so that a crossover on the right that
+is not the mirror image of the one on the left shows up.
+A winding is the path from its left port to its right port; its center
+tap is the straight track across the y-axis in the middle of the path,
+reported as the folded vertex (half, k).
+
+The graph is made from a placement plan of Balun_Plan, without any
+geometry, so a design is verified in microseconds.
+
+Graph keys:
+
+topology, Pri, Sec : The balun parameters.
+
+tracks : Number of tracks, Pri + Sec.
+
+vertices : List of the vertices (half, k, side).
+
+edges : List of (vertex, vertex, cell) with the cell name of the crossover,
+        or None for a track that runs straight across an axis.
+
+ports : Dictionary of 'primary' and 'secondary' to the pair of their port
+        vertices, left and right.
+
+ctaps : List of the folded vertices (half, k) the center tap parts of the
+        plan connect to.
+
+All vertices are in the frame of the balun, i.e. after the rotation of the
+plan, so the ports of the primary are on 'u' and those of the secondary
+on 'd'.
+'''
+
+import math
+import Balun_Scripts.Balun_Plan as BPL
+
+##############################################################
+# Number of tracks each crossover spans, and how it joins    #
+# them in the frame of its cell: the left end of track i     #
+# joins the right end of track SWAP[cell][i], with the       #
+# tracks counted from the bottom of the cell.                #
+##############################################################
+SPAN = {'X' : 2, 'XM' : 2, 'XX' : 4, 'XXM' : 4, 'XI' : 3, 'XIM' : 3}
+SWAP = {'X' : (1, 0), 'XM' : (1, 0), 'XX' : (2, 3, 0, 1), 'XXM' : (2, 3, 0, 1),
+        'XI' : (2, 0, 1), 'XIM' : (1, 2, 0)}
+
+
+def _track(plan, c):
+    '''
+
+    Index of the track whose center line is at a distance c from the
+    center of the balun.
+
+    '''
+
+    L = plan['L']
+    W = plan['W']
+    S = plan['S']
+    return int(round((L/2 - W/2 - abs(c))/(W + S)))
+
+
+def _end(plan, co, side, offset):
+    '''
+
+    Vertex at an end of a track through a placed crossover.
+
+    co : Placement of the crossover.
+
+    side : -1 for the left end, 1 for the right end, in the frame of the
+           cell.
+
+    offset : Offset of the track from the center of the cell.
+
+    '''
+
+    c = int(round(math.cos(math.radians(co.rotation))))
+    s = int(round(math.sin(math.radians(co.rotation))))
+
+    def place(x, y):
+        if co.x_reflection:
+            y = -y
+        return x*c - y*s, x*s + y*c
+
+    sx, sy = place(side, 0)
+    ox, oy = place(0, offset)
+    if co.rotation % 180:
+        # On the x-axis, the tracks run along y
+        return ('u' if sy > 0 else 'd', _track(plan, co.x + ox), 'l' if co.x < 0 else 'r')
+    return ('u' if co.y > 0 else 'd', _track(plan, co.y + oy), 'l' if sx < 0 else 'r')
+
+
+def Plan_Graph(plan):
+    '''
+
+    Graph of a balun from its placement plan.
+
+    plan : Placement plan from Balun_Plan.
+
+    Returns the graph as a dictionary, see the module documentation.
+
+    '''
+
+    N = plan['Pri'] + plan['Sec']
+    pitch = plan['W'] + plan['S']
+
+    edges = []
+    crossed = set()
+    for co in plan['crossovers']:
+        span = SPAN[co.cell]
+        for i, j in enumerate(SWAP[co.cell]):
+            a = _end(plan, co, -1, (i - (span - 1)/2)*pitch)
+            b = _end(plan, co, 1, (j - (span - 1)/2)*pitch)
+            edges.append((a, b, co.cell))
+            # Quarters and the axis they cross on
+            crossed.update(((a, co.rotation % 180), (b, co.rotation % 180)))
+
+    # Tracks that run straight across the axes.  The outer most track is
+    # cut by the ports on the y-axis.
+    for half in ('u', 'd'):
+        for k in range(N):
+            a = (half, k, 'l')
+            if k > 0 and (a, 0) not in crossed:
+                edges.append((a, (half, k, 'r'), None))
+    for side in ('l', 'r'):
+        for k in range(N):
+            a = ('u', k, side)
+            if (a, 90) not in crossed:
+                edges.append((a, ('d', k, side), None))
+
+    # Center taps, from the parts that extend them
+    ctaps = []
+    for x, y in plan['vias']:
+        # Via on the track, in the frame of the tracks
+        ctaps.append(('u' if y > 0 else 'd', _track(plan, y)))
+
+    # Into the frame of the balun
+    if plan['rotation'] % 360 == 180:
+        flip = {'u' : 'd', 'd' : 'u', 'l' : 'r', 'r' : 'l'}
+        edges = [((flip[a[0]], a[1], flip[a[2]]), (flip[b[0]], b[1], flip[b[2]]), cell) for a, b, cell in edges]
+        ctaps = [(flip[half], k) for half, k in ctaps]
+
+    for x, y in plan['ctaps']:
+        # Square abutting the outer edge of the track, in the frame of the
+        # balun, so a track width further out than the track
+        ctaps.append(('u' if y > 0 else 'd', _track(plan, abs(y) - plan['W'])))
+
+    vertices = [(half, k, side) for half in ('u', 'd') for side in ('l', 'r') for k in range(N)]
+    ports = {'primary' : (('u', 0, 'l'), ('u', 0, 'r')), 'secondary' : (('d', 0, 'l'), ('d', 0, 'r'))}
+
+    return {'topology' : plan['topology'], 'Pri' : plan['Pri'], 'Sec' : plan['Sec'],
+            'tracks' : N, 'vertices' : vertices, 'edges' : edges,
+            'ports' : ports, 'ctaps' : ctaps}
+
+
+def Balun_Graph(topology, L, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1):
+    '''
+
+    Graph of the balun built by Balun_Build with the same arguments.
+
+    '''
+
+    return Plan_Graph(BPL.Balun_Plan(topology, L, W, S, Pri, Sec, viaM, viaW, viaS))
+
+
+def Windings(graph):
+    '''
+
+    Trace the windings of a balun graph.
+
+    Each winding is traced from its left port along the edges until the
+    path stops, at its right port for a valid balun.  Edges that end off
+    the tracks of the balun are left out; Check_Graph reports them.
+
+    Returns a dictionary of 'primary' and 'secondary' to a dictionary:
+
+    path : Vertices from the left port.
+
+    closed : True if the path ends at the right port of the winding.
+
+    turns : Number of turns of the path, a quarter per vertex.
+
+    center : Folded vertex (half, k) of the straight track across the
+             y-axis in the middle of a closed path, or None.
+
+    '''
+
+    adjacent = {vertex : [] for vertex in graph['vertices']}
+    for a, b, cell in graph['edges']:
+        if a in adjacent and b in adjacent:
+            adjacent[a].append(b)
+            adjacent[b].append(a)
+
+    windings = {}
+    for name, (left, right) in graph['ports'].items():
+        path = [left]
+        seen = {left}
+        while True:
+            following = [v for v in adjacent[path[-1]] if v not in seen]
+            if len(following) != 1:
+                break
+            path.append(following[0])
+            seen.add(following[0])
+
+        closed = path[-1] == right
+        center = None
+        if closed and len(path) % 4 == 0:
+            a = path[len(path)//2 - 1]
+            b = path[len(path)//2]
+            if a[:2] == b[:2] and a[2] != b[2]:
+                center = a[:2]
+        windings[name] = {'path' : path, 'closed' : closed, 'turns' : len(path)/4, 'center' : center}
+
+    return windings
+
+
+def Check_Graph(graph):
+    '''
+
+    Verify a balun graph against the rules of the README.
+
+    - Every edge joins two of the vertices.  A crossover placed off the
+      pitch of the tracks, e.g. when its via array is wider than the
+      tracks, ends off them:
+
+        >>> Check_Graph(Balun_Graph('XI', 200, 4, 4, 1, 6))[:1]
+        ["The XM crossover ends at ('u', 7, 'l'), off the 7 tracks of the balun"]
+
+    - Every vertex other than a port has exactly one edge across the
+      x-axis and one across the y-axis; the ports only have their edge
+      across the x-axis.
+    - The windings run from their left port to their right port, have Pri
+      and Sec turns, and between them cover every vertex.
+    - The center tap parts connect to the center of a winding.  This is
+      the secondary, except for the 'XX' baluns with an odd number of
+      turns, where the center tap on the second outer most track is the
+      center of the primary.
+
+    Returns a list of the problems found, empty if the graph is valid.
+
+    '''
+
+    problems = []
+
+    ports = set(graph['ports']['primary'] + graph['ports']['secondary'])
+
+    # Edges of each vertex across the x-axis and across the y-axis
+    across_x = {vertex : 0 for vertex in graph['vertices']}
+    across_y = {vertex : 0 for vertex in graph['vertices']}
+    for a, b, cell in graph['edges']:
+        off = [end for end in (a, b) if end not in across_x]
+        for end in off:
+            problems.append('The {} crossover ends at {}, off the {} tracks of the balun'.format(
+                cell, end, graph['tracks']))
+        if off:
+            continue
+        across = across_x if a[0] != b[0] else across_y
+        across[a] += 1
+        across[b] += 1
+
+    for vertex in graph['vertices']:
+        expect = 0 if vertex in ports else 1
+        if across_x[vertex] != 1 or across_y[vertex] != expect:
+            problems.append('Vertex {} has {} edges across the x-axis and {} across the y-axis'.format(
+                vertex, across_x[vertex], across_y[vertex]))
+
+    windings = Windings(graph)
+    covered = set()
+    for name, turns in (('primary', graph['Pri']), ('secondary', graph['Sec'])):
+        winding = windings[name]
+        covered.update(winding['path'])
+        if not winding['closed']:
+            problems.append('The {} winding does not end at its right port'.format(name))
+        elif winding['center'] == None:
+            problems.append('The {} winding has no center tap'.format(name))
+        if winding['turns'] != turns:
+            problems.append('The {} winding has {:g} turns instead of {}'.format(name, winding['turns'], turns))
+
+    if len(covered) != len(graph['vertices']):
+        problems.append('{} vertices are not on a winding'.format(len(graph['vertices']) - len(covered)))
+
+    tapped = 'secondary'
+    if graph['topology'] == 'XX' and graph['Pri'] % 2:
+        tapped = 'primary'
+    center = windings[tapped]['center']
+    for ctap in graph['ctaps']:
+        if ctap != center:
+            problems.append('Center tap at {} is not the center of the {} winding {}'.format(ctap, tapped, center))
+
+    return problems
@@ -0,0 +1,526 @@
+'''
+Connectivity of the balun layouts.
+
+The polygons of a balun cell are joined into nets: polygons on the same
+metal layer connect where they touch or overlap, and a via connects the
+upper and lower metal polygons it touches.  Vias only connect through
+metal, not to each other.  The nets of a balun are then checked
+against its ports and center tap: there must be exactly two, the primary
+with the two ports at the top and the secondary with the two ports at the
+bottom, and the center tap on one of them.
+
+The polygons are found through a uniform grid.  Every polygon edge is cut
+into fragments no longer than a grid bin and each fragment is filed under
+the bins it covers, so building the index is a sort of the fragments,
+O(n log n).  Only the fragments that share a bin are tested against each
+other.  A polygon inside another one, e.g. a via inside a track, has no
+edge near the other's edges; it is found by casting a ray from one of its
+vertices through the fragments of its row of bins.
+
+Only NumPy is needed.  The polygons may come from any gdspy cell, or from
+a dictionary of (layer, datatype) to a list of arrays of points, as
+returned by get_polygons(by_spec=True).
+
+Net keys:
+
+polygons : Dictionary of GDS layer to the number of polygons of the net.
+
+bbox : Bounding box [[x_min, y_min], [x_max, y_max]] of the net.
+
+terminals : Names of the terminals on the net, see 'Balun_Terminals'.
+'''
+
+import numpy as np
+import Balun_Scripts.Balun_Plan as BPL
+
+
+def _edges(polygons):
+    '''
+
+    Edges of a list of polygons.
+
+    Returns the arrays (start points, end points, polygon of each edge).
+
+    '''
+
+    sizes = np.array([len(points) for points in polygons])
+    starts = np.concatenate([np.asarray(points, dtype = float) for points in polygons])
+    offsets = np.cumsum(sizes) - sizes
+    owner = np.repeat(np.arange(len(polygons)), sizes)
+
+    # Next vertex of each vertex, wrapping around each polygon
+    following = np.arange(len(starts)) + 1
+    following[offsets + sizes - 1] = offsets
+    return starts, starts[following], owner
+
+
+def _pairs(keys):
+    '''
+
+    All pairs of indices with the same key.
+
+    Returns two arrays of indices (i, j), with i < j in the sort order.
+
+    '''
+
+    order = np.argsort(keys, kind = 'stable')
+    sorted_keys = keys[order]
+    first_in_bin = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+    bin_end = np.append(np.flatnonzero(first_in_bin)[1:], len(keys))
+    ends = bin_end[np.cumsum(first_in_bin) - 1]
+
+    # Each element pairs with the elements after it in its bin
+    i, j = _ranges(np.arange(1, len(keys) + 1), ends)
+    return order[i], order[j]
+
+
+def _ranges(low, high):
+    '''
+
+    Expand the index ranges low[i]:high[i].
+
+    Returns two arrays: the range i of each index, and the index.
+
+    '''
+
+    count = np.maximum(high - low, 0)
+    i = np.repeat(np.arange(len(low)), count)
+    step = np.arange(len(i)) - np.repeat(np.cumsum(count) - count, count)
+    return i, np.repeat(low, count) + step
+
+
+def _join(keys_a, keys_b):
+    '''
+
+    All pairs of an index into keys_a and an index into keys_b with the
+    same key.
+
+    Returns two arrays of indices (i, j).
+
+    '''
+
+    order = np.argsort(keys_b, kind = 'stable')
+    sorted_keys = keys_b[order]
+    i, j = _ranges(np.searchsorted(sorted_keys, keys_a, 'left'), np.searchsorted(sorted_keys, keys_a, 'right'))
+    return i, order[j]
+
+
+def _segments_touch(a0, a1, b0, b1, tolerance):
+    '''
+
+    True where the segments a0-a1 and b0-b1 cross, or come within
+    'tolerance' of each other.
+
+    '''
+
+    def cross(o, p, q):
+        return (p[:, 0] - o[:, 0])*(q[:, 1] - o[:, 1]) - (p[:, 1] - o[:, 1])*(q[:, 0] - o[:, 0])
+
+    def distance(p, s0, s1):
+        d = s1 - s0
+        length = np.maximum((d*d).sum(1), 1e-300)
+        t = np.clip(((p - s0)*d).sum(1)/length, 0, 1)
+        return np.hypot(*(s0 + t[:, None]*d - p).T)
+
+    crossing = ((cross(a0, a1, b0)*cross(a0, a1, b1) < 0) &
+                (cross(b0, b1, a0)*cross(b0, b1, a1) < 0))
+    near = np.minimum(np.minimum(distance(a0, b0, b1), distance(a1, b0, b1)),
+                      np.minimum(distance(b0, a0, a1), distance(b1, a0, a1)))
+    return crossing | (near <= tolerance)
+
+
+class Layout_Index:
+    '''
+
+    Uniform grid of the polygon edges of a layout.
+
+    polygons : List of arrays of points.
+
+    bin_size : Size of the square bins of the grid.  The default of None
+               uses the mean edge length, so the number of fragments is
+               about twice the number of edges.
+
+    '''
+
+    def __init__(self, polygons, bin_size=None):
+        self.count = len(polygons)
+        starts, ends, owner = _edges(polygons)
+        lengths = np.hypot(*(ends - starts).T)
+
+        if bin_size == None:
+            bin_size = max(lengths.mean(), 1e-9)
+        self.bin_size = bin_size
+
+        # Cut the edges into fragments no longer than a bin
+        pieces = np.maximum(np.ceil(lengths/bin_size).astype(np.int64), 1)
+        edge = np.repeat(np.arange(len(starts)), pieces)
+        k = np.arange(len(edge)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        delta = (ends - starts)[edge]/pieces[edge][:, None]
+        self.p0 = starts[edge] + k[:, None]*delta
+        self.p1 = self.p0 + delta
+        # Exact vertices at the ends of the edges
+        last = k == pieces[edge] - 1
+        self.p1[last] = ends[edge[last]]
+        self.owner = owner[edge]
+        self.edge = edge
+        self.starts = starts
+        self.ends = ends
+
+        self.origin = np.minimum(self.p0, self.p1).min(0)
+
+    def _bins(self, low, high):
+        '''
+
+        Bins covered by the boxes low-high.
+
+        Returns the arrays (box index, bin column, bin row).
+
+        '''
+
+        i0 = np.floor((low - self.origin)/self.bin_size).astype(np.int64)
+        i1 = np.floor((high - self.origin)/self.bin_size).astype(np.int64)
+        nx = i1[:, 0] - i0[:, 0] + 1
+        ny = i1[:, 1] - i0[:, 1] + 1
+        box = np.repeat(np.arange(len(low)), nx*ny)
+        r = np.arange(len(box)) - np.repeat(np.cumsum(nx*ny) - nx*ny, nx*ny)
+        return box, i0[box, 0] + r % nx[box], i0[box, 1] + r//nx[box]
+
+    def touching(self, group, other=None, tolerance=1e-3):
+        '''
+
+        Pairs of polygons whose edges cross or come within 'tolerance'.
+
+        group : Boolean array over the polygons, e.g. those of a layer.
+
+        other : Boolean array over the polygons, or None.  With None, the
+                polygons of 'group' are paired with each other, otherwise
+                with the polygons of 'other'.
+
+        Returns an array of polygon index pairs, shape (n, 2).
+
+        '''
+
+        i, j = self.near(group, other, tolerance)
+        a = self.owner[i]
+        b = self.owner[j]
+        keep = a != b
+        i, j, a, b = i[keep], j[keep], a[keep], b[keep]
+
+        hit = _segments_touch(self.p0[i], self.p1[i], self.p0[j], self.p1[j], tolerance)
+        return _unique_pairs(a[hit], b[hit], self.count)
+
+    def near(self, group, other=None, margin=0.0):
+        '''
+
+        Pairs of fragments whose bounding boxes, grown by 'margin', overlap.
+        Fragments closer than twice the margin are always paired, others
+        may be.
+
+        group, other : Boolean arrays over the polygons, see 'touching'.
+
+        Returns two arrays of fragment indices (i, j).  With other None,
+        both fragments are from group and each pair is listed once.
+
+        '''
+
+        low = np.minimum(self.p0, self.p1) - margin
+        high = np.maximum(self.p0, self.p1) + margin
+
+        def bins(polygons):
+            fragment = np.flatnonzero(polygons[self.owner])
+            box, bx, by = self._bins(low[fragment], high[fragment])
+            return fragment[box], (bx << 32) + by
+
+        fragment, keys = bins(group)
+        if other is None:
+            i, j = _pairs(keys)
+            i, j = fragment[i], fragment[j]
+        else:
+            fragment_b, keys_b = bins(other)
+            i, j = _join(keys, keys_b)
+            i, j = fragment[i], fragment_b[j]
+
+        # Fragments in a shared bin may still be apart
+        keep = np.all((low[i] <= high[j]) & (low[j] <= high[i]), axis = 1)
+        return i[keep], j[keep]
+
+    def inside(self, points, polygons=None):
+        '''
+
+        Polygons that contain each point, by casting a ray from the point
+        along its row of bins.  The ray goes left or right, whichever way
+        has fewer fragments to cross.
+
+        points : Array of points, shape (n, 2).
+
+        polygons : Boolean array of the polygons to look in, or None for
+                   all of them.
+
+        Returns the arrays (point index, polygon index).
+
+        '''
+
+        points = np.asarray(points, dtype = float).reshape(-1, 2)
+
+        # Fragments that can cross a ray, in each row of bins they span
+        fragment = np.flatnonzero(self.p0[:, 1] != self.p1[:, 1])
+        if polygons is not None:
+            fragment = fragment[polygons[self.owner[fragment]]]
+        low = (np.minimum(self.p0[fragment], self.p1[fragment]) - self.origin)/self.bin_size
+        high = (np.maximum(self.p0[fragment], self.p1[fragment]) - self.origin)/self.bin_size
+        row0 = np.floor(low[:, 1]).astype(np.int64)
+        f, row = _ranges(row0, np.floor(high[:, 1]).astype(np.int64) + 1)
+        fragment = fragment[f]
+
+        # Keyed by row, then by the first column of the fragment for the
+        # rays to the right, or by its last column for the rays to the left
+        columns = int(np.floor(high[:, 0].max(initial = 0))) + 4
+        first = np.floor(low[f, 0]).astype(np.int64) + 1
+        last = np.floor(high[f, 0]).astype(np.int64) + 1
+        order_right = np.argsort(row*columns + first, kind = 'stable')
+        order_left = np.argsort(row*columns + last, kind = 'stable')
+        key_right = (row*columns + first)[order_right]
+        key_left = (row*columns + last)[order_left]
+
+        at = (points - self.origin)/self.bin_size
+        point_row = np.floor(at[:, 1]).astype(np.int64)
+        point_column = np.clip(np.floor(at[:, 0]).astype(np.int64) + 1, 1, columns - 2)
+        start = point_row*columns
+        # A fragment is no longer than a bin, so it spans at most one more
+        # column than the one it is keyed by
+        right = (np.searchsorted(key_right, start + point_column - 1),
+                 np.searchsorted(key_right, start + columns - 1, 'right'))
+        left = (np.searchsorted(key_left, start),
+                np.searchsorted(key_left, start + point_column + 1, 'right'))
+        to_right = right[1] - right[0] <= left[1] - left[0]
+
+        q_right, f_right = _ranges(np.where(to_right, right[0], 0), np.where(to_right, right[1], 0))
+        q_left, f_left = _ranges(np.where(to_right, 0, left[0]), np.where(to_right, 0, left[1]))
+        q = np.concatenate((q_right, q_left))
+        f = fragment[np.concatenate((order_right[f_right], order_left[f_left]))]
+        sign = np.concatenate((np.ones(len(q_right)), -np.ones(len(q_left))))
+
+        x, y = points[q, 0], points[q, 1]
+        x0, y0 = self.p0[f, 0], self.p0[f, 1]
+        x1, y1 = self.p1[f, 0], self.p1[f, 1]
+        # Half open in y, so a ray through a vertex is counted once
+        spans = (y0 > y) != (y1 > y)
+        q, f, sign = q[spans], f[spans], sign[spans]
+        x, y, x0, y0, x1, y1 = x[spans], y[spans], x0[spans], y0[spans], x1[spans], y1[spans]
+        ahead = sign*(x0 + (y - y0)*(x1 - x0)/(y1 - y0) - x) > 0
+
+        # Odd number of crossings with a polygon: the point is inside it
+        key, crossings = np.unique(q[ahead]*self.count + self.owner[f[ahead]], return_counts = True)
+        key = key[crossings % 2 == 1]
+        return key//self.count, key % self.count
+
+
+def _unique_pairs(a, b, count):
+    '''
+
+    Unique unordered pairs of the indices a and b, below count.
+
+    Returns an array of pairs, shape (n, 2), with the smaller index first.
+
+    '''
+
+    key = np.unique(np.minimum(a, b)*count + np.maximum(a, b))
+    return np.stack((key//count, key % count), axis = 1)
+
+
+def _components(count, pairs):
+    '''
+
+    Connected component of each of 'count' nodes joined by 'pairs'.
+
+    '''
+
+    parent = list(range(count))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    return np.array([root(i) for i in range(count)], dtype = np.int64)
+
+
+def Layout_Nets(polygons, tl=37, bl=33, vl=36, terminals=None, tolerance=1e-3, bin_size=None):
+    '''
+
+    Join the polygons of a layout into nets.
+
+    polygons : gdspy cell, or dictionary of (layer, datatype) to a list of
+               arrays of points.  Only the layers tl, bl, and vl are used.
+
+    tl, bl, vl : Upper metal, lower metal, and via GDS layers.
+
+    terminals : Optional dictionary of name to (x, y) of points on the
+                upper metal, e.g. the ports.  Each name is added to the
+                'terminals' of the net of the polygon that contains it.
+
+    tolerance : Polygons closer than this are touching.
+
+    bin_size : Size of the bins of the grid, see 'Layout_Index'.
+
+    Returns a list of nets, see the module documentation.  A terminal on
+    no polygon is not on any net.
+
+    '''
+
+    if hasattr(polygons, 'get_polygons'):
+        polygons = polygons.get_polygons(by_spec = True)
+
+    shapes = []
+    layers = []
+    for (layer, datatype), points in polygons.items():
+        if layer in (tl, bl, vl):
+            shapes.extend(points)
+            layers.extend([layer]*len(points))
+    if not shapes:
+        return []
+    layers = np.array(layers)
+
+    metal = (layers == tl) | (layers == bl)
+    via = layers == vl
+
+    index = Layout_Index(shapes, bin_size)
+    pairs = [index.touching(layers == tl, tolerance = tolerance),
+             index.touching(layers == bl, tolerance = tolerance),
+             index.touching(via, metal, tolerance)]
+
+    # Polygons inside a metal polygon, e.g. the vias of an array inside a track
+    point, polygon = index.inside([points[0] for points in shapes], metal)
+    keep = (point != polygon) & ((layers[point] == layers[polygon]) | via[point])
+    pairs.append(_unique_pairs(point[keep], polygon[keep], len(shapes)))
+
+    net = _components(len(shapes), np.concatenate(pairs).tolist())
+
+    names = list(terminals or ())
+    on = {}
+    if names:
+        point, polygon = index.inside([terminals[name] for name in names], layers == tl)
+        for p, q in zip(point, polygon):
+            on.setdefault(net[q], []).append(names[p])
+
+    nets = []
+    for root in np.unique(net):
+        members = np.flatnonzero(net == root)
+        points = np.concatenate([shapes[m] for m in members])
+        counts = dict(zip(*np.unique(layers[members], return_counts = True)))
+        nets.append({'polygons' : {int(layer) : int(n) for layer, n in counts.items()},
+                     'bbox' : [points.min(0).tolist(), points.max(0).tolist()],
+                     'terminals' : sorted(set(on.get(root, ())))})
+    return nets
+
+
+def Balun_Terminals(topology, L, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1):
+    '''
+
+    Ports and center taps of the balun built by Balun_Build with the same
+    arguments, in the frame of the balun.
+
+    Returns a dictionary of name to (x, y):
+
+    P1, P2 : Ports of the primary, at the top, left and right.
+
+    S1, S2 : Ports of the secondary, at the bottom, left and right.
+
+    CT1, CT2, ... : Center taps, on the 'SQ' or 'VIA_ARR' cells of the plan.
+
+    '''
+
+    plan = BPL.Balun_Plan(topology, L, W, S, Pri, Sec, viaM, viaW, viaS)
+    x = BPL.Part_Ext(topology, L, W, S, viaM, viaW, viaS)['P'][0] - W/2
+    y = L/2 + W/2
+    terminals = {'P1' : (-x, y), 'P2' : (x, y), 'S1' : (-x, -y), 'S2' : (x, -y)}
+
+    # The vias are in the frame of the tracks
+    sign = -1 if plan['rotation'] % 360 == 180 else 1
+    ctaps = [(sign*vx, sign*vy) for vx, vy in plan['vias']] + list(plan['ctaps'])
+    for n, point in enumerate(ctaps):
+        terminals['CT' + str(n + 1)] = point
+    return terminals
+
+
+def Balun_Nets(balun_cell, topology, L, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1, tl=37, bl=33, vl=36,
+               tolerance=1e-3):
+    '''
+
+    Nets of a balun cell built by Balun_Build, with its terminals.
+
+    balun_cell : Balun cell, flat or not.
+
+    The other arguments are those the balun was built with.
+
+    Returns a list of nets, see the module documentation.
+
+    '''
+
+    terminals = Balun_Terminals(topology, L, W, S, Pri, Sec, viaM, viaW, viaS)
+    return Layout_Nets(balun_cell, tl, bl, vl, terminals, tolerance)
+
+
+def Check_Nets(nets, graph=None):
+    '''
+
+    Verify the nets of a balun.
+
+    - There are exactly two nets, and every polygon is on one of them.
+    - The primary net has the ports P1 and P2 and the secondary net the
+      ports S1 and S2.
+    - Every center tap is on one of the two nets.  With the graph of the
+      balun from Balun_Graph, on the net of the winding the graph has its
+      center tap on.
+
+    Returns a list of the problems found, empty if the nets are valid.
+
+    '''
+
+    problems = []
+
+    if len(nets) != 2:
+        problems.append('{} nets instead of 2'.format(len(nets)))
+
+    on = {}
+    for n, net in enumerate(nets):
+        for name in net['terminals']:
+            on[name] = n
+
+    for name in ('P1', 'P2', 'S1', 'S2'):
+        if name not in on:
+            problems.append('Port {} is not on any net'.format(name))
+    if 'P1' in on and on.get('P1') != on.get('P2'):
+        problems.append('Primary ports P1 and P2 are on different nets')
+    if 'S1' in on and on.get('S1') != on.get('S2'):
+        problems.append('Secondary ports S1 and S2 are on different nets')
+    if 'P1' in on and on.get('P1') == on.get('S1'):
+        problems.append('Primary and secondary are shorted')
+
+    winding = {on.get('P1') : 'primary', on.get('S1') : 'secondary'}
+    expect = None
+    if graph != None:
+        import Balun_Scripts.Balun_Graph as BG
+        windings = BG.Windings(graph)
+        for ctap in graph['ctaps']:
+            expect = 'primary' if ctap == windings['primary']['center'] else 'secondary'
+        found = len([name for name in on if name.startswith('CT')])
+        if found != len(graph['ctaps']):
+            problems.append('{} center taps on the nets instead of {}'.format(found, len(graph['ctaps'])))
+
+    for name in sorted(on):
+        if not name.startswith('CT'):
+            continue
+        side = winding.get(on[name])
+        if side == None:
+            problems.append('Center tap {} is not on a winding'.format(name))
+        elif expect != None and side != expect:
+            problems.append('Center tap {} is on the {} instead of the {}'.format(name, side, expect))
+
+    return problems
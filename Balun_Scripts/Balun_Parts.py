@@ -1,7 +1,47 @@
+import collections
 import numpy as np
 import gdspy
+import Balun_Scripts.Part_Extents as PE
+import Balun_Scripts.Balun_Profile as BPF
 
-def SQ(lib, W, tl=37):
+class Part_Cell(gdspy.Cell):
+    '''
+    
+    GDS cell that also carries its bounding box.
+    
+    extent : Bounding box [[x_min, y_min], [x_max, y_max]] of the cell,
+             published by the function that generates the cell so that
+             placements never walk its polygons.  None if not known.
+    
+    '''
+    
+    __slots__ = ('extent',)
+    
+    def __init__(self, name, extent=None):
+        gdspy.Cell.__init__(self, name, exclude_from_current=True)
+        self.extent = extent
+
+
+def Cell(lib, name):
+    '''
+    
+    Create a GDS cell and add it to 'lib' only.
+    
+    Unlike lib.new_cell, the cell is not also registered in gdspy's current
+    library, so the same name can be used in any number of libraries.
+    
+    lib : GDS library to add the cell to.
+    
+    name : Name of the GDS cell.
+    
+    '''
+    
+    cell = Part_Cell(name)
+    lib.add(cell, include_dependencies=False)
+    return cell
+
+
+def SQ(lib, W, tl=37, ns=''):
     '''
     
     Generate a W by W square. 
@@ -12,20 +52,26 @@ def SQ(lib, W, tl=37):
          The default of 37 is the top metal layer of the MOCMOS technology.
          This is convenient when using 'Electric' to view the resulting GDS.  
     
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
     '''
     
     ###############################
     # Create GDS cell of a square #
     ###############################     
-    SQ = lib.new_cell('SQ')
+    SQ = Cell(lib, ns + 'SQ')
     
     ###################################
     # Add a W wide square to GDS cell #
     ###################################
     SQ.add(gdspy.Rectangle((W/2,W/2),(-W/2,-W/2),tl))
+    SQ.extent = PE.BB(PE.SQ_EXT(W))
+    
+    return SQ
         
         
-def J(lib, W, S, tl = 37, ext = None):
+def J(lib, W, S, tl = 37, ext = None, ns = ''):
     '''
     
     Generate jumper crossover for use in baluns
@@ -38,6 +84,11 @@ def J(lib, W, S, tl = 37, ext = None):
          The default of 37 is the top metal layer of the MOCMOS technology.
          This is convenient when using 'Electric' to view the resulting GDS.  
     
+    ext : GDS cell name of the width to use.
+    
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
     '''
      
     ##########################
@@ -55,8 +106,7 @@ def J(lib, W, S, tl = 37, ext = None):
         edge_x = Stanz + WpSd2 + WdSqr2
         
     else:
-        CO = gdspy.CellReference(ext)
-        edge_x = CO.get_bounding_box()[1][0]
+        edge_x = PE.bbox(lib.cells[ns + ext])[1][0]
     
     #################################
     # Points of the straight jumper #
@@ -73,14 +123,17 @@ def J(lib, W, S, tl = 37, ext = None):
     #################################
     # Create GDS cell and add shape #
     ################################# 
-    J = lib.new_cell('J')
+    J = Cell(lib, ns + 'J')
     J.add(shape)
+    J.extent = PE.BB(PE.J_EXT(W, S, edge_x))
+    
+    return J
     
     
-def TR(lib,L, W, S, Pri, Sec, tl=37):
+def TR_Points(L, W, S, Pri, Sec):
     '''
     
-    Generate tracks for Balun
+    Vertices of the tracks of the balun, for all 8 wedges of the octagon.
     
     L : Overall length of the octagonal balun.
     
@@ -92,9 +145,9 @@ def TR(lib,L, W, S, Pri, Sec, tl=37):
     
     Sec : Number of turns of the secondary.
     
-    tl : Upper metal layer number.
-         The default of 37 is the top metal layer of the MOCMOS technology.
-         This is convenient when using 'Electric' to view the resulting GDS. 
+    Returns an array of shape (8, Pri+Sec, 4, 2).
+    Index [ang, t] is the 4 point strip of track t (0 is the outermost)
+    in the wedge rotated by ang*pi/4.
     
     '''
     
@@ -102,41 +155,254 @@ def TR(lib,L, W, S, Pri, Sec, tl=37):
     
     #preliminary calculations of some constants
     tanz = np.tan(np.pi/8)
-    #x = S*tanz
-               
+    
+    # Outer and inner edges of each track in the upright wedge
+    y_out = L/2 - np.arange(tracks)*(W+S)
+    y_in = y_out - W
+    
     # Forms an octagonal wedge of 2*T metal strips
-    # wedge is a list of lists for use with PolygonSet()
-    wedge = []
-    for t in range(tracks):
-        pl = []
-        pl.append(((L/2-t*W-t*S)*tanz, L/2-t*W-t*S))
-        pl.append(((L/2-(t+1)*W-t*S)*tanz, L/2-(t+1)*W-t*S))
-        pl.append((-1*(L/2-(t+1)*W-t*S)*tanz, L/2-(t+1)*W-t*S))
-        pl.append((-1*(L/2-t*W-t*S)*tanz, L/2-t*W-t*S))
-        wedge.append(pl)   
-    
-    # # Forms a rectangular strip to clear the middle of the wedge
-    # # rect_clear is a list containing the two points of the rectangle
-    # rect_clear = []
-    # rclx = x+0.5*S+W*np.sqrt(2)+S/np.sqrt(2)
-    # rcly = 0.5*L
-    # rect_clear.append((-1.0*rclx,1.0*rcly))
-    # rect_clear.append((1.0*rclx,0))
-    
-    # Generate the tracks of the octagon with rotated wedges. 
+    wedge = np.empty((tracks, 4, 2))
+    wedge[:, 0, 0] = y_out*tanz
+    wedge[:, 0, 1] = y_out
+    wedge[:, 1, 0] = y_in*tanz
+    wedge[:, 1, 1] = y_in
+    wedge[:, 2, 0] = -y_in*tanz
+    wedge[:, 2, 1] = y_in
+    wedge[:, 3, 0] = -y_out*tanz
+    wedge[:, 3, 1] = y_out
+    
+    # Stack of the 8 rotations of the wedge
+    ang = np.arange(8)*(np.pi/4)
+    ca = np.cos(ang)
+    sa = np.sin(ang)
+    rot = np.stack((np.stack((ca, -sa), axis=-1), np.stack((sa, ca), axis=-1)), axis=-2)
+    
+    return np.einsum('aij,tkj->atki', rot, wedge)
+
+
+def TR(lib,L, W, S, Pri, Sec, tl=37, ns=''):
+    '''
+    
+    Generate tracks for Balun
+    
+    L : Overall length of the octagonal balun.
+    
+    W : Width of the metal track.
+    
+    S : Spacing between the metal tracks.
+    
+    Pri : Number of turns of the primary.
+    
+    Sec : Number of turns of the secondary.
+    
+    tl : Upper metal layer number.
+         The default of 37 is the top metal layer of the MOCMOS technology.
+         This is convenient when using 'Electric' to view the resulting GDS. 
+    
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
+    '''
+    
+    # Generate the tracks of the octagon with rotated wedges in one go. 
     ## The middle of the wedges at 0,90,180,and 270 degrees are cleared for crossovers
-    TR = lib.new_cell('TR')
+    ## by the balun build functions.
+    pts = TR_Points(L, W, S, Pri, Sec)
+    
+    TR = Cell(lib, ns + 'TR')
+    TR.add(gdspy.PolygonSet(list(pts.reshape(-1, 4, 2)), tl))
+    TR.extent = PE.BB(PE.TR_EXT(L))
+    
+    return TR
+
+
+def TR_Clear(L, W, S, Pri, Sec, clears, tl=37, eps=1e-9):
+    '''
+    
+    Generate the tracks of the balun already split at the clearances, 
+    without a polygon boolean.
+    
+    Gives the same geometry as gdspy.fast_boolean(TR, CLR, 'not') when every
+    clearance rectangle lies in one of the wedges at 0, 90, 180, or 270
+    degrees and cuts straight across the tracks it touches, which is how the
+    balun build functions place them. 
+    
+    L : Overall length of the octagonal balun.
+    
+    W : Width of the metal track.
+    
+    S : Spacing between the metal tracks.
+    
+    Pri : Number of turns of the primary.
+    
+    Sec : Number of turns of the secondary.
+    
+    clears : Bounding boxes [[x_min, y_min], [x_max, y_max]] of the
+             clearance rectangles.
+    
+    tl : Upper metal layer number.
+    
+    eps : Tolerance used to decide that a clearance cuts across a track.
+    
+    Returns a gdspy.PolygonSet, or None if a clearance does not cut straight
+    across the tracks and the boolean is needed.
+    
+    '''
+    
+    tanz = np.tan(np.pi/8)
+    pts = TR_Points(L, W, S, Pri, Sec)
+    tracks = Pri+Sec
+    
+    # Outer and inner edges of each track in the upright wedge
+    y_out = L/2 - np.arange(tracks)*(W+S)
+    y_in = y_out - W
+    
+    clears = np.asarray(clears, dtype=float).reshape(-1, 2, 2)
+    x_min, y_min = clears[:, 0, 0], clears[:, 0, 1]
+    x_max, y_max = clears[:, 1, 0], clears[:, 1, 1]
+    
+    ##################################################################
+    # Bring each clearance into the frame of the upright wedge by    #
+    # undoing the quarter turn of the wedge at 0, 90, 180 or 270 deg #
+    ##################################################################
+    # Ranges of x and y after turning by -q*90 degrees, for q = 0..3
+    x0 = np.array([x_min, y_min, -x_max, -y_max])
+    x1 = np.array([x_max, y_max, -x_min, -y_min])
+    y0 = np.array([y_min, -x_max, -y_max, x_min])
+    y1 = np.array([y_max, -x_min, -y_min, x_max])
+    
+    # Clearance inside the wedge?
+    inside = (y0 > 0) & (np.maximum(abs(x0), abs(x1)) <= y0*tanz + eps)
+    if not np.all(inside.any(axis=0)):
+        return None
+    n = np.arange(len(clears))
+    q = inside.argmax(axis=0)
+    x0, x1, y0, y1 = x0[q, n], x1[q, n], y0[q, n], y1[q, n]
+    
+    # Tracks touched by each clearance, which have to be cut straight across
+    hit = (y0[:, None] < y_out - eps) & (y1[:, None] > y_in + eps)
+    full = (y0[:, None] <= y_in + eps) & (y1[:, None] >= y_out - eps)
+    if np.any(hit & ~full):
+        return None
+    
+    # cuts[ang][t] is the list of (x0, x1) cuts of track t in wedge ang
+    cuts = {}
+    for r, t in zip(*np.nonzero(hit)):
+        cuts.setdefault(2*q[r], {}).setdefault(t, []).append((x0[r], x1[r]))
+    
+    #########################################################
+    # Split the cut tracks between the cuts, wedge by wedge #
+    #########################################################
+    polygons = []
     for ang in range(8):
-        shape = gdspy.PolygonSet(wedge, tl).rotate(ang*(np.pi/4))
-        # clear = gdspy.Rectangle(rect_clear[0], rect_clear[1], tl).rotate(ang*(np.pi/4))
-        # if not(ang%2):
-        #     TR.add(gdspy.fast_boolean(shape, clear, 'not', layer=tl))
-        # else:
-        #     TR.add(shape)
-        TR.add(shape)
+        ang_cuts = cuts.get(ang, {})
+        keep = [t for t in range(tracks) if t not in ang_cuts]
+        polygons.extend(pts[ang, keep])
+        if not ang_cuts:
+            continue
+        
+        pieces = []
+        for t, intervals in ang_cuts.items():
+            yo = y_out[t]
+            yi = y_in[t]
+            
+            # Merge overlapping cuts
+            intervals.sort()
+            merged = [list(intervals[0])]
+            for c0, c1 in intervals[1:]:
+                if c0 <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], c1)
+                else:
+                    merged.append([c0, c1])
+            
+            # Left end, pieces between the cuts, right end
+            edges = [None] + [x for cut in merged for x in cut] + [None]
+            for left, right in zip(edges[0::2], edges[1::2]):
+                if left == None:
+                    bottom_left, top_left = -yi*tanz, -yo*tanz
+                else:
+                    bottom_left, top_left = left, left
+                if right == None:
+                    bottom_right, top_right = yi*tanz, yo*tanz
+                else:
+                    bottom_right, top_right = right, right
+                if bottom_right - bottom_left <= eps:
+                    continue
+                pieces.append([[top_right, yo], [bottom_right, yi],
+                               [bottom_left, yi], [top_left, yo]])
+        
+        if pieces:
+            ca = np.cos(ang*(np.pi/4))
+            sa = np.sin(ang*(np.pi/4))
+            rot = np.array([[ca, -sa], [sa, ca]])
+            polygons.extend(np.array(pieces) @ rot.T)
+    
+    return gdspy.PolygonSet(polygons, tl)
+
+
+def Plan_Place(lib, plan, cell, tl=37, ns='', clearance='boolean'):
+    '''
+    
+    Place the crossovers, the ports, the vias, and the cleared tracks of a
+    balun plan into a GDS cell, in the frame of the tracks.
+    
+    The clearances are also added to the GDS cell 'CLR'.
+    
+    plan : Placement plan from Balun_Plan.
+    
+    cell : GDS cell to place the parts into.
+    
+    tl : Upper metal layer number.
+    
+    ns : Namespace prefix of the GDS cells of the balun parts.
+    
+    clearance : How the tracks are cleared for the crossovers and ports.
+                'boolean' subtracts the clearances with gdspy.fast_boolean.
+                'analytic' generates the tracks already split at the clearances.
+    
+    '''
+    
+    #############################################################
+    # Create GDS cell of the crossover clearances of the tracks #
+    #############################################################
+    CLR = Cell(lib, ns + 'CLR')
+    
+    for co in plan['crossovers'] + [plan['ports']]:
+        ref = gdspy.CellReference(lib.cells[ns + co.cell], (co.x, co.y),
+                                  rotation = co.rotation or None,
+                                  x_reflection = co.x_reflection)
+        cell.add(ref)
+    
+    for bb in plan['clears']:
+        CLR.add(gdspy.Rectangle(bb[0], bb[1], tl))
+    
+    ########################
+    # Add and clear tracks #
+    ########################
+    # Tracks split at the clearances without a boolean
+    tracks = None
+    if clearance == 'analytic':
+        with BPF.Stage('TR_Clear') as stage:
+            tracks = TR_Clear(plan['L'], plan['W'], plan['S'], plan['Pri'], plan['Sec'],
+                              plan['clears'], tl)
+            stage.count(tracks)
+    #
+    if tracks == None:
+        TR = gdspy.CellReference(lib.cells[ns + 'TR'])
+        CLR = gdspy.CellReference(CLR)
+        # Boolean for clearance
+        with BPF.Stage('fast_boolean') as stage:
+            tracks = gdspy.fast_boolean(TR, CLR, 'not', layer=tl)
+            stage.count(tracks)
+    cell.add(tracks)
+    
+    for v_loc in plan['vias']:
+        cell.add(gdspy.CellReference(lib.cells[ns + 'VIA_ARR'], v_loc))
+    
+    return cell
 
 
-def P(lib, sep = 'XX'):
+def P(lib, sep = 'XX', ns = '', flat = True):
     '''
     
     Generate ports for balun. 
@@ -148,54 +414,62 @@ def P(lib, sep = 'XX'):
     This function also depends on the GDS cell 'TR' and its dimension to
     extract the distance between the primary and secondary ports. 
     
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
+    flat : True to flatten the GDS cell into polygons.
+           False keeps the references to the 'SQ' cell.
+    
     '''
     
     ##############################
     # Create GDS cell the ports  #
     ##############################  
-    PORTS = lib.new_cell('P')
+    PORTS = Cell(lib, ns + 'P')
     
     ##############################
     # Get width of the crossover #
     ##############################
-    CO = gdspy.CellReference(lib.cells[sep])
-    sep_half = CO.get_bounding_box()[1][0] 
+    sep_half = PE.bbox(lib.cells[ns + sep])[1][0] 
     
     ###########################
     # Get height of the balun #
     ###########################
-    Trks = gdspy.CellReference(lib.cells['TR'])
-    ports_sep_half = Trks.get_bounding_box()[1][1]
+    ports_sep_half = PE.bbox(lib.cells[ns + 'TR'])[1][1]
     
     ###################################
     # Get width of the port extension #
     ###################################
-    Port_Ex = gdspy.CellReference(lib.cells['SQ'])
-    W_half = Port_Ex.get_bounding_box()[1][1]
+    W_half = PE.bbox(lib.cells[ns + 'SQ'])[1][1]
        
     ###############################################
     # Place the extention squares to create ports #
     ###############################################
     # Add Primary Port
-    Port_Ex = gdspy.CellReference(lib.cells['SQ'])
+    Port_Ex = gdspy.CellReference(lib.cells[ns + 'SQ'])
     Port_Ex.translate(sep_half - W_half, ports_sep_half + W_half)
     PORTS.add(Port_Ex)
     
-    Port_Ex = gdspy.CellReference(lib.cells['SQ'])
+    Port_Ex = gdspy.CellReference(lib.cells[ns + 'SQ'])
     Port_Ex.translate(-sep_half + W_half, ports_sep_half + W_half)
     PORTS.add(Port_Ex)
     
     # Add Secondary Port  
-    Port_Ex = gdspy.CellReference(lib.cells['SQ'])
+    Port_Ex = gdspy.CellReference(lib.cells[ns + 'SQ'])
     Port_Ex.translate(sep_half - W_half, -ports_sep_half - W_half)
     PORTS.add(Port_Ex)
     
-    Port_Ex = gdspy.CellReference(lib.cells['SQ'])
+    Port_Ex = gdspy.CellReference(lib.cells[ns + 'SQ'])
     Port_Ex.translate(-sep_half + W_half, -ports_sep_half - W_half)
-    PORTS.add(Port_Ex).flatten()
+    PORTS.add(Port_Ex)
+    if flat:
+        PORTS.flatten()
+    PORTS.extent = PE.BB((sep_half, ports_sep_half + 2*W_half))
+    
+    return PORTS
 
         
-def VIA(lib, m, w, s, vl=36):
+def VIA(lib, m, w, s, vl=36, ns='', flat=True):
     '''
     
     Generates via array for top metal and bottom metal interconnections
@@ -210,14 +484,19 @@ def VIA(lib, m, w, s, vl=36):
           The default value of 37 corresponds to the via between the top
           and 2nd metal layers of the MOCMOS technology.
      
+     ns = Namespace prefixed to the names of the generated GDS cells.
+          Lets the parts of many baluns live in one GDS library.
+     
+     flat = True to flatten the via array into m*m polygons.
+            False keeps it as a single array reference (AREF) to 'VIA_1'.
      
     '''
     
     #########################################################
     # Create GDS cell the individual via and the via array  #
     #########################################################       
-    v1 = lib.new_cell('VIA_1')
-    var = lib.new_cell('VIA_ARR')
+    v1 = Cell(lib, ns + 'VIA_1')
+    var = Cell(lib, ns + 'VIA_ARR')
     
     ##############################################
     # The two points that defines the square via #
@@ -230,6 +509,7 @@ def VIA(lib, m, w, s, vl=36):
     # create via square via #
     #########################
     v1.add(gdspy.Rectangle(via[0],via[1],vl))
+    v1.extent = PE.BB(PE.SQ_EXT(w))
     
     ##########################################################################
     # translate from the center of the lower leftmost via to center of array #
@@ -240,11 +520,15 @@ def VIA(lib, m, w, s, vl=36):
     # Generate translated via array #
     #################################
     var.add(gdspy.CellArray(v1, m, m, (w+s,w+s), (loc,loc)))
-    var.flatten()
+    if flat:
+        var.flatten()
+    var.extent = PE.BB(PE.VIA_EXT(m, w, s))
+    
+    return var
     
 
 
-def X(lib, W, S, tl=37, bl=33, ext = None):
+def X(lib, W, S, tl=37, bl=33, ext = None, ns = '', flat = True):
     '''
     
     Generate X crossover
@@ -263,6 +547,13 @@ def X(lib, W, S, tl=37, bl=33, ext = None):
     
     ext : GDS cell name of the width to use.
     
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
+    flat : True to flatten the crossover cells into polygons.
+           False keeps the references to 'VIA_ARR', and the mirrored cell
+           is a reference to the crossover cell.
+    
     '''   
                 
     ##########################
@@ -280,8 +571,7 @@ def X(lib, W, S, tl=37, bl=33, ext = None):
         edge_x = Stanz + WpSd2 + WdSqr2
         
     else:
-        CO = gdspy.CellReference(ext)
-        edge_x = CO.get_bounding_box()[1][0]
+        edge_x = PE.bbox(lib.cells[ns + ext])[1][0]
         
         
     ############################        
@@ -341,7 +631,7 @@ def X(lib, W, S, tl=37, bl=33, ext = None):
     #####################################
     # Create GDS cell for 'X' crossover #
     #####################################         
-    X = lib.new_cell('X')
+    X = Cell(lib, ns + 'X')
     
     ##########################################
     # Add the 'X' polygons into the GDS cell #
@@ -359,24 +649,32 @@ def X(lib, W, S, tl=37, bl=33, ext = None):
     #via locations
     via_2l=[(edge_x - W/2, -0.5*(W + S)), (-(edge_x - W/2), 0.5*(W + S))]
     for v_loc in via_2l:
-        VIA = gdspy.CellReference(lib.cells['VIA_ARR'])
+        VIA = gdspy.CellReference(lib.cells[ns + 'VIA_ARR'])
         VIA.translate(v_loc[0],v_loc[1])
         X.add(VIA)
     #End of adding via
     
-    X.flatten()
+    if flat:
+        X.flatten()
+    v = PE.bbox(lib.cells[ns + 'VIA_ARR'])[1][0]
+    X.extent = PE.BB(PE.X_EXT(W, S, v, edge_x))
     #End of 'X' crossover generation
     
     ##################################################
     # Generate a mirrored version of 'X' called 'XM' #
     ##################################################
-    XM = lib.new_cell('XM') 
-    X_ref = gdspy.CellReference(lib.cells['X'], (0,0), x_reflection=True)
-    XM.add(X_ref).flatten()
+    XM = Cell(lib, ns + 'XM') 
+    X_ref = gdspy.CellReference(X, (0,0), x_reflection=True)
+    XM.add(X_ref)
+    if flat:
+        XM.flatten()
+    XM.extent = X.extent
     #End of 'XM' crossover generation   
+    
+    return X, XM
 
         
-def XX(lib, W, S, tl=37, bl=33):
+def XX(lib, W, S, tl=37, bl=33, ns='', flat=True):
     '''
     
     Generate XX crossover
@@ -393,6 +691,13 @@ def XX(lib, W, S, tl=37, bl=33):
          The default of 33 is the 2nd metal layer of the MOCMOS technology.
          This is convenient when using 'Electric' to view the resulting GDS. 
        
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
+    flat : True to flatten the crossover cells into polygons.
+           False keeps the references to 'VIA_ARR', and the mirrored cell
+           is a reference to the crossover cell.
+    
     '''   
      
     ##########################
@@ -481,7 +786,7 @@ def XX(lib, W, S, tl=37, bl=33):
     ######################################
     # Create GDS cell for 'XX' crossover #
     ######################################        
-    XX = lib.new_cell('XX')
+    XX = Cell(lib, ns + 'XX')
     
     ###########################################
     # Add the 'XX' polygons into the GDS cell #
@@ -499,25 +804,33 @@ def XX(lib, W, S, tl=37, bl=33):
     #via locations
     via_4l=[(B4x-W/2,-0.5*(S+W)),(-1*(B4x-W/2),0.5*(S+W)),(B4x-W/2,-1.5*(W+S)),(-1*(B4x-W/2),1.5*(W+S))]
     for v_loc in via_4l:
-        VIA = gdspy.CellReference(lib.cells['VIA_ARR'])
+        VIA = gdspy.CellReference(lib.cells[ns + 'VIA_ARR'])
         VIA.translate(v_loc[0],v_loc[1])
         XX.add(VIA)
     #End of adding via
     
-    XX.flatten()    
+    if flat:
+        XX.flatten()    
+    v = PE.bbox(lib.cells[ns + 'VIA_ARR'])[1][0]
+    XX.extent = PE.BB(PE.XX_EXT(W, S, v))
     #End of 'XX' crossover generation
     
     ####################################################
     # Generate a mirrored version of 'XX' called 'XXM' #
     ####################################################
-    XX_ref = gdspy.CellReference(lib.cells['XX'], (0,0), x_reflection=True)
-    XXM = lib.new_cell('XXM')
-    XXM.add(XX_ref).flatten()
+    XX_ref = gdspy.CellReference(XX, (0,0), x_reflection=True)
+    XXM = Cell(lib, ns + 'XXM')
+    XXM.add(XX_ref)
+    if flat:
+        XXM.flatten()
+    XXM.extent = XX.extent
     #End of 'XXM' crossover generation    
+    
+    return XX, XXM
 
  
    
-def XI(lib, W, S, tl = 37, bl = 33, ext = None):
+def XI(lib, W, S, tl = 37, bl = 33, ext = None, ns = '', flat = True):
     '''
     
     Generate XI crossover
@@ -536,6 +849,13 @@ def XI(lib, W, S, tl = 37, bl = 33, ext = None):
     
     ext : GDS cell name of the width to use.
     
+    ns : Namespace prefixed to the names of the generated GDS cells.
+         Lets the parts of many baluns live in one GDS library.
+    
+    flat : True to flatten the crossover cells into polygons.
+           False keeps the references to 'VIA_ARR', and the mirrored cell
+           is a reference to the crossover cell.
+    
     '''
      
     ##########################
@@ -555,8 +875,7 @@ def XI(lib, W, S, tl = 37, bl = 33, ext = None):
         edge_x = SpWd2 + WdSqr2 + W + Stanz
         
     else:
-        CO = gdspy.CellReference(lib.cells[ext])
-        edge_x = CO.get_bounding_box()[1][0]
+        edge_x = PE.bbox(lib.cells[ns + ext])[1][0]
     
     #############################        
     # Points for 'XI' structure #
@@ -648,7 +967,7 @@ def XI(lib, W, S, tl = 37, bl = 33, ext = None):
     ######################################
     # Create GDS cell for 'XI' crossover #
     ######################################       
-    XI = lib.new_cell('XI')
+    XI = Cell(lib, ns + 'XI')
     
     ###########################################
     # Add the 'XI' polygons into the GDS cell #
@@ -666,19 +985,112 @@ def XI(lib, W, S, tl = 37, bl = 33, ext = None):
     #via locations
     via_3l=[(edge_x - W/2, (S + W)), (-(edge_x - W/2), -(S + W))]
     for v_loc in via_3l:
-        VIA = gdspy.CellReference(lib.cells['VIA_ARR'])
+        VIA = gdspy.CellReference(lib.cells[ns + 'VIA_ARR'])
         VIA.translate(v_loc[0],v_loc[1])
         XI.add(VIA)
     #End of adding via
     
-    XI.flatten()    
+    if flat:
+        XI.flatten()    
+    v = PE.bbox(lib.cells[ns + 'VIA_ARR'])[1][0]
+    XI.extent = PE.BB(PE.XI_EXT(W, S, v, edge_x))
     #End of 'XI' crossover generation
     
     ####################################################
     # Generate a mirrored version of 'XI' called 'XIM' #
     ####################################################
-    XI_ref = gdspy.CellReference(lib.cells['XI'])
-    XIM = lib.new_cell('XIM')
-    XIM.add(XI_ref).flatten()
+    XI_ref = gdspy.CellReference(XI, (0,0), x_reflection=True)
+    XIM = Cell(lib, ns + 'XIM')
+    XIM.add(XI_ref)
+    if flat:
+        XIM.flatten()
+    XIM.extent = XI.extent
     #End of 'XIM' crossover generation    
-   
\ No newline at end of file
+    
+    return XI, XIM
+   
+
+
+
+class Part_Cache:
+    '''
+    
+    Memoizes the GDS cells of the parts shared by baluns with the same
+    track and via settings: 'SQ', 'VIA_1', 'VIA_ARR', and the crossovers
+    with their mirrored cells.
+    
+    The cells are generated once per key and the same cell objects are
+    added to every library that asks for them again.  They are never
+    modified after they are generated, so they can be shared.
+    
+    maxsize : Number of part sets kept.  The least recently used set is
+              evicted beyond that.
+    
+    '''
+    
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._parts = collections.OrderedDict()
+    
+    def __len__(self):
+        return len(self._parts)
+    
+    def clear(self):
+        self._parts.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def parts(self, lib, W, S, m, w, s, crossovers=('X', 'XX', 'XI'),
+              tl=37, bl=33, vl=36, ns='', flat=True):
+        '''
+        
+        Add the cells of the balun parts to 'lib', generating them only if
+        they are not cached yet.
+        
+        W : Width of the metal track.
+        
+        S : Spacing between the metal tracks.
+        
+        m, w, s : Rows and columns, width, and spacing of the via array.
+        
+        crossovers : Crossover cells to provide, out of 'X', 'XX', and 'XI'.
+                     'XI' needs 'XX', so list both.
+        
+        tl, bl, vl : Upper metal, lower metal, and via layer numbers.
+        
+        ns : Namespace prefixed to the names of the GDS cells.
+        
+        flat : Passed on to the part generators.
+        
+        Returns a dictionary of GDS cell name to cell.
+        
+        '''
+        
+        key = (ns, W, S, m, w, s, tuple(crossovers), tl, bl, vl, flat)
+        cells = self._parts.get(key)
+        
+        if cells == None:
+            self.misses += 1
+            # Order is important as the crossovers reference 'VIA_ARR'
+            new = [SQ(lib, W, tl, ns = ns), VIA(lib, m, w, s, vl, ns = ns, flat = flat)]
+            new.append(lib.cells[ns + 'VIA_1'])
+            if 'X' in crossovers:
+                new.extend(X(lib, W, S, tl, bl, ns = ns, flat = flat))
+            if 'XX' in crossovers:
+                new.extend(XX(lib, W, S, tl, bl, ns = ns, flat = flat))
+            if 'XI' in crossovers:
+                new.extend(XI(lib, W, S, tl, bl, ns = ns, flat = flat))
+            
+            cells = {cell.name : cell for cell in new}
+            self._parts[key] = cells
+            if len(self._parts) > self.maxsize:
+                self._parts.popitem(last = False)
+        
+        else:
+            self.hits += 1
+            self._parts.move_to_end(key)
+            lib.add(list(cells.values()), include_dependencies = False)
+        
+        return cells
@@ -0,0 +1,634 @@
+'''
+Placement plans of the baluns.
+
+A plan lists where every part of a balun goes, without generating any
+geometry.  It is a dictionary of plain numbers, strings, and tuples, so it
+can be pickled, written as JSON, compared, and analyzed without gdspy.
+The Balun_X/XX/XI_Build functions only turn a plan into GDS cells.
+
+Plan keys:
+
+topology : Balun topology, 'X', 'XX', or 'XI'.
+
+L, W, S, Pri, Sec : The balun parameters.
+
+crossovers : List of Placement of the crossover cells, in the frame of the
+             tracks.
+
+ports : Placement of the port cell 'P', in the frame of the tracks.
+
+vias : List of (x, y) of 'VIA_ARR' cells, in the frame of the tracks.
+
+clears : List of track clearances ((x_min, y_min), (x_max, y_max)), in
+         the frame of the tracks.
+
+rotation : Rotation in degrees of the frame of the tracks in the balun.
+           Either 0 or 180 so that the secondary is on the bottom.
+
+ctaps : List of (x, y) of 'SQ' cells extending the center tap, in the
+        frame of the balun.
+'''
+
+import collections
+import Balun_Scripts.Part_Extents as PE
+
+#######################################################################
+# A cell placed with its origin at (x, y), rotated by 'rotation'      #
+# degrees, after a reflection about the x-axis if 'x_reflection'.     #
+# Same meaning as the arguments of gdspy.CellReference.               #
+#######################################################################
+Placement = collections.namedtuple('Placement', ['cell', 'x', 'y', 'rotation', 'x_reflection'])
+
+
+def Part_Ext(topology, L, W, S, viaM=4, viaW=1, viaS=1):
+    '''
+
+    Half extents (hx, hy) of the parts used by a balun, by cell name, as
+    generated by Balun_Build.
+
+    topology : Balun topology, one of 'X', 'XX', or 'XI'.
+
+    L : Overall length of the octagonal balun.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    viaM, viaW, viaS : Rows and columns, width, and spacing of the via array.
+
+    '''
+
+    v = PE.VIA_EXT(viaM, viaW, viaS)[0]
+
+    ext = {}
+    ext['X'] = ext['XM'] = PE.X_EXT(W, S, v)
+    if topology != 'X':
+        ext['XX'] = ext['XXM'] = PE.XX_EXT(W, S, v)
+    if topology == 'XI':
+        ext['XI'] = ext['XIM'] = PE.XI_EXT(W, S, v)
+
+    # Ports are separated by the widest crossover used
+    if topology == 'X':
+        ext['P'] = PE.P_EXT(L, W, ext['X'][0])
+    else:
+        ext['P'] = PE.P_EXT(L, W, ext['XX'][0])
+
+    return ext
+
+
+def _plan(topology, L, W, S, Pri, Sec):
+    '''
+
+    Empty plan of a balun.
+
+    '''
+
+    return {'topology' : topology, 'L' : L, 'W' : W, 'S' : S, 'Pri' : Pri, 'Sec' : Sec,
+            'crossovers' : [], 'ports' : None, 'vias' : [], 'clears' : [],
+            'rotation' : 0, 'ctaps' : []}
+
+
+def _place(plan, ext, cell, x, y, rotation=0, x_reflection=False):
+    '''
+
+    Add the placement of a crossover and the clearance of the tracks that it
+    crosses to a plan.
+
+    A crossover rotated by 90 degrees sits on the x-axis and cuts the
+    tracks on its left and right.  Otherwise it sits on the y-axis and cuts
+    the tracks above and below it.
+
+    '''
+
+    W = plan['W']
+    S = plan['S']
+
+    plan['crossovers'].append(Placement(cell, x, y, rotation, x_reflection))
+
+    # The parts are symmetric about their origin
+    hx, hy = ext[cell]
+    if rotation % 180:
+        hx, hy = hy, hx
+        clear = ((x - hx - S/2, y - hy + W), (x + hx + S/2, y + hy - W))
+    else:
+        clear = ((x - hx + W, y - hy - S/2), (x + hx - W, y + hy + S/2))
+    plan['clears'].append(tuple((float(cx), float(cy)) for cx, cy in clear))
+
+
+def _ports(plan, ext):
+    '''
+
+    Add the ports and the clearance of the outer tracks at the ports to a
+    plan.
+
+    '''
+
+    L = plan['L']
+    W = plan['W']
+    S = plan['S']
+
+    plan['ports'] = Placement('P', 0, 0, 0, False)
+
+    # Clear the outer tracks at ports
+    sep_x = ext['P'][0]
+    p1 = float(-sep_x + W)
+    p2 = float(sep_x - W)
+    plan['clears'].append(((p1, -L/2), (p2, -L/2 + W + S/2)))
+    plan['clears'].append(((p1, L/2 - W - S/2), (p2, L/2)))
+
+
+def Plan_X(L, W, S, Pri, Sec, ext=None):
+    '''
+
+    Placement plan of a planar balun with X crossovers.
+    Center tap point of the secondary is indicated with a via structure.
+
+    L : Overall length of the octagonal balun.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    Pri : Number of turns of the primary.
+
+    Sec : Number of turns of the secondary.
+
+    ext : Half extents of the parts by cell name, see 'Part_Ext'.
+          The default is the parts generated by Balun_Build with a 4x4 via
+          array.
+
+    '''
+
+    if ext == None:
+        ext = Part_Ext('X', L, W, S)
+
+    plan = _plan('X', L, W, S, Pri, Sec)
+
+    ########################################
+    # Determine number of shared turns (T) #
+    ########################################
+    T = min([Pri, Sec])
+
+    ##################################################
+    # Start of left to right placement of crossovers #
+    ##################################################
+    # xl is starting point for leftmost X crossover
+    # xs is the step size for the X crossover
+    # xn is the number of X crossover on each half about y-axis
+    xl = -L/2 + W + S/2
+    xs = 2*(W + S)
+    xn = int((Pri + Sec) / 2)
+
+    for step in range(xn):
+        _place(plan, ext, 'X', xl+step*xs, 0, 90)
+        _place(plan, ext, 'XM', -xl-step*xs, 0, 90)
+
+    ################################################
+    # Start of up and down placement of crossovers #
+    ################################################
+    # xl is starting point for bottom most X crossover
+    # xs is the step size for the X crossover
+    # xv is the number of X crossover on each half about x-axis
+    xl = xl + (W+S)
+    xv = T - 1
+
+    for step in range(xv):
+        _place(plan, ext, 'X', 0, xl+step*xs)
+        _place(plan, ext, 'XM', 0, -xl-step*xs)
+
+    # Jumper below the x-axis, at the end of the shared turns
+    jl = -L/2 +(W+S) + (xv*xs) + W/2
+
+    # When Pri is not equal to Sec, then the process of fitting 'X' and '-' structures
+    # along the y-axis is repeated for the remaining tracks.
+    if Pri != Sec:
+        # xl is starting point for remaining X crossovers below x-axis
+        # xv is the number of X crossovers below x-axis
+        xv = int(abs(Sec-Pri)/2)
+        xl = jl + 1.5*(W+S)
+
+        for step in range(xv):
+            _place(plan, ext, 'X', 0, xl + step*xs)
+
+        # xl is starting point for remaining X crossovers above x-axis (1 less turns then previous)
+        # xv is the number of X crossovers above x-axis (2 more turns then previous)
+        xv = int((abs(Sec-Pri) + 1)/2)
+        xl = -jl - 0.5*(W+S)
+        for step in range(xv):
+            _place(plan, ext, 'XM', 0, xl - step*xs)
+
+    ##############################
+    # Add in/out port extensions #
+    ##############################
+    _ports(plan, ext)
+
+    #########################################
+    # Place ctap via structure to secondary #
+    #########################################
+    if Sec <= Pri:
+        plan['vias'].append((0, -L/2 + W/2 + (2*Sec-1)*(W+S)))
+    else:
+        if (Sec-Pri)%2:
+            plan['vias'].append((0, -L/2 + W/2 + (Pri+Sec-1)*(W+S)))
+        else:
+            plan['vias'].append((0, L/2 - W/2 - (Pri+Sec-1)*(W+S)))
+
+    #####################################################################
+    # Logic for rotating balun so the secondary is always on the bottom #
+    #####################################################################
+    # If T/2 is even
+    if T%2:
+        if Pri >= Sec:
+            plan['rotation'] = 180
+
+    # If T/2 is odd
+    else:
+        if Sec > Pri:
+            plan['rotation'] = 180
+
+    return plan
+
+
+def Plan_XX(L, W, S, Pri, Sec, ext=None):
+    '''
+
+    Placement plan of a planar balun with XX crossovers.
+    Center tap point of the secondary is extended with a square.
+
+    L : Overall length of the octagonal balun.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    Pri : Number of turns of the primary.
+
+    Sec : Number of turns of the secondary.
+
+    ext : Half extents of the parts by cell name, see 'Part_Ext'.
+          The default is the parts generated by Balun_Build with a 4x4 via
+          array.
+
+    '''
+
+    if ext == None:
+        ext = Part_Ext('XX', L, W, S)
+
+    plan = _plan('XX', L, W, S, Pri, Sec)
+
+    ########################################
+    # Determine number of shared turns (T) #
+    ########################################
+    T = min([Pri, Sec])
+
+    ##################################################
+    # Start of left to right placement of crossovers #
+    ##################################################
+    # xxl is starting point for leftmost XX crossover
+    # xxs is the step size for the XX crossover
+    # xxn is the number of XX crossover on each half about y-axis
+    xxl = -L/2 + (2*W+1.5*S)
+    xxs = 4*(W+S)
+    xxn = int(2*T/4)
+    for step in range(xxn):
+        _place(plan, ext, 'XX', xxl+step*xxs, 0, 90)
+        _place(plan, ext, 'XXM', -xxl-step*xxs, 0, 90)
+
+    # xl is starting point for leftmost X crossover
+    # xs is the step size for the X crossover
+    # xn is the number of X crossover on each half of the y-axis
+    xl = -L/2 + (xxn*4*(W+S)) + (W+0.5*S)
+    xs = 2*W+2*S
+    xn = int((Pri+Sec-4*(xxn))/2)
+
+    for step in range(xn):
+        _place(plan, ext, 'X', xl+step*xs, 0, 90)
+        _place(plan, ext, 'XM', -xl-step*xs, 0, 90)
+
+    ################################################
+    # Start of up and down placement of crossovers #
+    ################################################
+    # xxl is starting point for bottom most XX crossover
+    # xxv is the number of XX crossover on each half about x-axis
+    xxl = xxl + 2*(W+S)
+    xxv = int((2*T-2)/4)
+
+    for step in range(xxv):
+        _place(plan, ext, 'XX', 0, xxl+step*xxs)
+        _place(plan, ext, 'XXM', 0, -xxl-step*xxs)
+
+    # If 2*T-2 tracks is not divisible by 4(number of tracks for XX), then
+    # there should be two tracks remaining for either the Pri or the Sec
+    # for one X structure below the x-axis.
+    # xv tests whether this is the case.
+    xv = 4*xxv < 2*T-2
+    if xv:
+        _place(plan, ext, 'X', 0, -L/2 + (xxv*4*(W+S)) + 2*(W+S) + W+0.5*S)
+        # If Pri == Sec, then add the remining X structure above the x-axis.
+        # When Pri != Sec, these two tracks are used to expand to remaining tracks
+        # with the XX structure.
+        if Pri == Sec:
+            _place(plan, ext, 'XM', 0, L/2 - (xxv*4*(W+S)) - 2*(W+S) - (W+0.5*S))
+
+    # When Pri is not equal to Sec, then the process of fitting XX and X structures
+    # along the y-axis is repeated for the remaining tracks.
+    if Pri != Sec:
+        # xxl is starting point for remaining XX crossovers below x-axis
+        # xxv is the number of XX crossovers below x-axis
+        xxv = int(abs(Sec-Pri)/4)
+        xxl = -L/2 + (W+S)*2*T + 2*W+1.5*S
+
+        for step in range(xxv):
+            _place(plan, ext, 'XX', 0, xxl+step*xxs)
+        # If the remaining tracks are not divisible by 4,
+        # then there are two tracks remaining for an X structure
+        if (Pri+Sec > 4*xxv+2*T):
+            _place(plan, ext, 'X', 0, -L/2 + (W+S)*2*T + 4*(W+S)*xxv + W+0.5*S)
+
+        # xxl is starting point for remaining XX crossovers above x-axis (2 less turns then previous)
+        # xxv is the number of XX crossovers above x-axis (2 more turns then previous)
+        xxv = int((abs(Sec-Pri)+2)/4)
+        xxl = L/2 - (W+S)*(2*T-2) - (2*W+1.5*S)
+        for step in range(xxv):
+            _place(plan, ext, 'XXM', 0, xxl-step*xxs)
+        # If the remaining tracks are not divisible by 4,
+        # then there are two tracks remaining for an X structure
+        if (Pri+Sec > 4*xxv+2*T-2):
+            _place(plan, ext, 'XM', 0, L/2 - (W+S)*(2*T-2) - 4*(W+S)*xxv - (W+0.5*S))
+
+    ##############################
+    # Add in/out port extensions #
+    ##############################
+    _ports(plan, ext)
+
+    #####################################################################
+    # Logic for rotating balun so the secondary is always on the bottom #
+    #####################################################################
+    # If T/2 is even
+    if int(1- (T/2)%2):
+        if Sec > Pri:
+            plan['rotation'] = 180
+
+    # If T/2 is odd
+    else:
+        if Sec < Pri:
+            plan['rotation'] = 180
+
+    ###############################
+    # Add center tap to secondary #
+    ###############################
+    # The secondary center tap will always be at this location for this balun topology
+    plan['ctaps'].append((0, -L/2 + (W/2+S)))
+
+    return plan
+
+
+def Plan_XI(L, W, S, Pri, Sec, ext=None):
+    '''
+
+    Placement plan of a planar balun with XI crossovers.
+    Center tap point of the secondary is extended with a square.
+
+    L : Overall length of the octagonal balun.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    Pri : Number of turns of the primary.
+          An integer that is >= 1.
+    Sec : Number of turns of the secondary.
+          An even integer >= 2.
+
+    ext : Half extents of the parts by cell name, see 'Part_Ext'.
+          The default is the parts generated by Balun_Build with a 4x4 via
+          array.
+
+    '''
+
+    if ext == None:
+        ext = Part_Ext('XI', L, W, S)
+
+    plan = _plan('XI', L, W, S, Pri, Sec)
+
+    ####################################################################
+    # Logic for determining turn expansion on the Primary or Secondary #
+    ####################################################################
+    # ex_p => bool, expansion on the priamry?
+    # ex_s => bool, expansion on the secondary?
+    ex_p = False
+    ex_s = False
+
+    # Determine if 1:2 ratio of Primary to Secondary turns is chosen
+    if Sec/2 != Pri:
+        if Sec/2 < Pri:
+            ex_p = True
+        else:
+            ex_s = True
+
+    ##################################################
+    # Start of left to right placement of crossovers #
+    ##################################################
+    # xil is starting point for leftmost 'XI' crossover
+    # xis is the step size for the 'XI' crossover
+    # xin is the number of 'XI' crossover on each half about y-axis
+    xil = -L/2 + (1.5*W+S)
+    xis = 3*(W+S)
+
+    # Find xin
+    if Sec/2 == Pri:
+        xin = int((Pri + Sec)/3)
+    else:
+        if Sec/2 < Pri:
+            xin = int(Sec/2)
+        else:
+            xin = Pri
+
+    # Place 'XI' and 'XIM' in alternating order
+    for step in range(xin):
+        _place(plan, ext, 'XI', xil+step*xis, 0, 90, bool(step%2))
+        _place(plan, ext, 'XIM', -xil-step*xis, 0, 90, bool(step%2))
+
+    # xl is starting point for leftmost 'X' crossover
+    # xs is the step size for the 'X' crossover
+    # xn is the number of 'X' crossover on each half about y-axis
+    xl = -L/2 + xin*xis + (W+0.5*S)
+    xs = 2*(W + S)
+    xn = int((Pri + Sec - 3*xin)/2)
+
+    # If there is turn expansion(no longer a 1:2 balun), place 'X' and 'XM'
+    for step in range(xn):
+        _place(plan, ext, 'X', xl + step*xs, 0, 90, bool(step%2))
+        _place(plan, ext, 'XM', -xl - step*xs, 0, 90, bool(step%2))
+
+    #####################################################################
+    # Generate a list of crossovers above the x-axis from the outermost #
+    # for the case that the balun is 1:2                                #
+    #####################################################################
+    CO_UPPER=['XM']
+    for index in range(xin):
+        if index==0:
+            continue
+        if (index % 2):
+            CO_UPPER.pop()
+            CO_UPPER.append('XXM')
+            CO_UPPER.append('J')
+        else:
+            CO_UPPER.pop()
+            CO_UPPER.append('XM')
+            CO_UPPER.append('XM')
+
+    #####################################################################
+    # Generate a list of crossovers below the x-axis from the outermost #
+    # for the case that the balun is 1:2                                #
+    #####################################################################
+    CO_LOWER=['J']
+    for index in range(xin):
+        if index==0:
+            continue
+        if (index % 2):
+            CO_LOWER.pop()
+            CO_LOWER.append('X')
+            CO_LOWER.append('X')
+        else:
+            CO_LOWER.pop()
+            CO_LOWER.append('XX')
+            CO_LOWER.append('J')
+
+    #####################################################################
+    # Modify the lists for the crossovers for either above or below the #
+    # the x-axis to account for turn expansion in the primary           #
+    #####################################################################
+    if ex_p == True:
+        if xin%2:
+            CO_LOWER.pop()
+
+            ex_tl = Pri + Sec - (3*xin - 1)
+            xn = int(ex_tl/2)
+            for step in range(xn):
+                CO_LOWER.append('X')
+            if ex_tl%2:
+                CO_LOWER.append('J')
+
+            ex_tu = Pri + Sec - (3*xin)
+            xn = int(ex_tu/2)
+            for step in range(xn):
+                CO_UPPER.append('XM')
+            if ex_tu%2:
+                CO_UPPER.append('J')
+        else:
+            CO_UPPER.pop()
+
+            ex_tu = Pri + Sec - (3*xin - 1)
+            xn = int(ex_tu/2)
+            for step in range(xn):
+                CO_UPPER.append('XM')
+            if ex_tu%2:
+                CO_UPPER.append('J')
+
+            ex_tl = Pri + Sec - (3*xin)
+            xn = int(ex_tl/2)
+            for step in range(xn):
+                CO_LOWER.append('X')
+            if ex_tl%2:
+                CO_LOWER.append('J')
+
+    #####################################################################
+    # Modify the lists for the crossovers for either above or below the #
+    # the x-axis to account for turn expansion in the secondary         #
+    #####################################################################
+    if ex_s == True:
+        if xin%2:
+            CO_UPPER.pop()
+            #ex_tu => extension of turns for upper crossovers
+            ex_tu = Pri + Sec - (3*xin - 2)
+            xn = int(ex_tu/4)
+            for step in range(xn):
+                CO_UPPER.append('XXM')
+            if ex_tu%4 > 0:
+                CO_UPPER.append('XM')
+            #ex_tl => extension of turns for lower crossovers
+            ex_tl = Pri + Sec - (3*xin)
+            xn = int(ex_tl/4)
+            for step in range(xn):
+                CO_LOWER.append('XX')
+            if ex_tl%4 > 0:
+                CO_LOWER.append('X')
+        else:
+            CO_LOWER.pop()
+
+            ex_tl = Pri + Sec - (3*xin - 2)
+            xn = int(ex_tl/4)
+            for step in range(xn):
+                CO_LOWER.append('XX')
+            if ex_tl%4 > 0:
+                CO_LOWER.append('X')
+
+            ex_tu = Pri + Sec - (3*xin)
+            xn = int(ex_tu/4)
+            for step in range(xn):
+                CO_UPPER.append('XXM')
+            if ex_tu%4 > 0:
+                CO_UPPER.append('XM')
+
+    ##########################################################
+    # Start of upper to lower placement of crossovers        #
+    # 'J' only leaves the room of a track for a jumper       #
+    ##########################################################
+    # y_loc is the uppermost starting point
+    y_loc = L/2 - W - S
+
+    for cell in CO_UPPER:
+        if cell != 'J':
+            y_shift = ext[cell][1]
+            y_loc = y_loc - y_shift
+            _place(plan, ext, cell, 0, y_loc)
+        else:
+            y_shift = W
+        y_loc = y_loc - y_shift - S
+
+    # y_loc is the lowermost starting point
+    y_loc = -L/2 + 2*(W + S)
+
+    for cell in CO_LOWER:
+        if cell != 'J':
+            y_shift = ext[cell][1]
+            y_loc = y_loc + y_shift
+            _place(plan, ext, cell, 0, y_loc)
+        else:
+            y_shift = W
+        y_loc = y_loc + y_shift + S
+    # End of routine for upper to lower placement of crossovers
+
+    ##############################
+    # Add in/out port extensions #
+    ##############################
+    _ports(plan, ext)
+
+    ###############################
+    # Add center tap to secondary #
+    ###############################
+    # The secondary center tap will always be at this location for this balun topology
+    plan['ctaps'].append((0, -L/2 + (W/2+S)))
+
+    return plan
+
+
+PLAN = {'X' : Plan_X, 'XX' : Plan_XX, 'XI' : Plan_XI}
+
+
+def Balun_Plan(topology, L, W, S, Pri, Sec, viaM=4, viaW=1, viaS=1):
+    '''
+
+    Placement plan of a balun built by Balun_Build with the same arguments.
+
+    topology : Balun topology, one of 'X', 'XX', or 'XI'.
+
+    L, W, S, Pri, Sec : The balun parameters.
+
+    viaM, viaW, viaS : Rows and columns, width, and spacing of the via array.
+
+    '''
+
+    ext = Part_Ext(topology, L, W, S, viaM, viaW, viaS)
+    return PLAN[topology](L, W, S, int(Pri), int(Sec), ext)
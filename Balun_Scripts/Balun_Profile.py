@@ -0,0 +1,298 @@
+'''
+Opt-in profiling of the balun build pipeline.
+
+The build functions mark their stages with 'Stage'.  While no Profile is
+active, 'Stage' returns a shared do-nothing context, so the hooks cost a
+function call and stay in place.  Inside a Profile, every stage adds a
+record to the profile:
+
+balun : Cell name of the balun being built, or None outside a balun.
+
+stage : Name of the stage, e.g. 'X', 'TR', 'P', 'place', 'fast_boolean',
+        'flatten', or 'write'.
+
+parent : Name of the enclosing stage, or None.
+
+seconds : Wall time of the stage.
+
+polygons, vertices, references : Counts of the cells and polygon sets
+                                 the stage passed to 'count'.  Only the
+                                 elements directly in a cell are counted,
+                                 not the cells it references.
+
+With Profile(memory=True), memory allocated by Python is traced with
+tracemalloc and the records also have:
+
+bytes : Memory still allocated at the end of the stage, less the memory
+        allocated at its start.
+
+peak_bytes : Highest memory allocated during the stage, less the memory
+             allocated at its start.
+
+sites : With Profile(sites=N), the N source lines that allocated the most
+        memory kept by the stage, as a list of [file:line, bytes, count].
+
+A Profile is active only in the thread that entered it.  Stages run on
+other threads, such as the DRC workers or the GDS writer thread, are not
+recorded in it, so they cannot break the nesting of its stages.
+
+Example:
+
+    with Profile() as profile:
+        Balun_Build(lib, 'XX', 300, 8, 3, 2, 2)
+    print(profile.summary())
+'''
+
+import threading
+import time
+
+# Active Profile of each thread, in 'profile'
+_active = threading.local()
+
+
+class _Null:
+    '''
+
+    Stage used while profiling is disabled.
+
+    '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def count(self, *items):
+        pass
+
+
+_NULL = _Null()
+
+
+def _snapshot():
+    '''
+
+    tracemalloc snapshot without the allocations of tracemalloc itself.
+
+    '''
+
+    import tracemalloc
+
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+class _Stage:
+    '''
+
+    Stage of an active Profile.
+
+    '''
+
+    def __init__(self, profile, name, balun):
+        self.profile = profile
+        self.record = {'balun' : balun or profile.balun, 'stage' : name, 'parent' : None,
+                       'seconds' : 0.0, 'polygons' : 0, 'vertices' : 0, 'references' : 0}
+        self._balun = balun
+
+    def __enter__(self):
+        profile = self.profile
+        if profile._stack:
+            self.record['parent'] = profile._stack[-1]
+        profile._stack.append(self.record['stage'])
+        if self._balun != None:
+            self._outer = profile.balun
+            profile.balun = self._balun
+        if profile.memory:
+            self._memory_enter()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.record['seconds'] = time.perf_counter() - self._t0
+        profile = self.profile
+        if profile.memory:
+            self._memory_exit()
+        profile._stack.pop()
+        if self._balun != None:
+            profile.balun = self._outer
+        profile._emit(self.record)
+        return False
+
+    def _memory_enter(self):
+        '''
+
+        Start tracing the memory of the stage.
+
+        The tracemalloc peak is reset for the stage, so the peak reached so
+        far is first kept for the enclosing stage.
+
+        '''
+
+        import tracemalloc
+
+        profile = self.profile
+        self._snapshot = None
+        if profile.sites:
+            self._snapshot = _snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if profile._peaks:
+            profile._peaks[-1] = max(profile._peaks[-1], peak)
+        profile._peaks.append(current)
+        tracemalloc.reset_peak()
+        self._m0 = current
+
+    def _memory_exit(self):
+        import tracemalloc
+
+        profile = self.profile
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(profile._peaks.pop(), peak)
+        self.record['bytes'] = current - self._m0
+        self.record['peak_bytes'] = peak - self._m0
+        if self._snapshot != None:
+            stats = _snapshot().compare_to(self._snapshot, 'lineno')
+            self.record['sites'] = [[str(stat.traceback[0]), stat.size_diff, stat.count_diff]
+                                    for stat in stats[:profile.sites] if stat.size_diff > 0]
+            self._snapshot = None
+        # The enclosing stage saw this peak too
+        if profile._peaks:
+            profile._peaks[-1] = max(profile._peaks[-1], peak)
+
+    def count(self, *items):
+        '''
+
+        Add the polygons, vertices, and references of GDS cells or polygon
+        sets to the record of the stage.  Tuples and lists of them are
+        counted item by item, and None items are skipped.
+
+        '''
+
+        record = self.record
+        for item in items:
+            if item == None:
+                continue
+            if isinstance(item, (tuple, list)):
+                self.count(*item)
+                continue
+            if hasattr(item, 'references'):
+                record['references'] += len(item.references)
+                polysets = list(item.polygons) + list(item.paths)
+            else:
+                polysets = [item]
+            for polyset in polysets:
+                polygons = getattr(polyset, 'polygons', ())
+                record['polygons'] += len(polygons)
+                record['vertices'] += sum(len(points) for points in polygons)
+
+
+class Profile:
+    '''
+
+    Collects the stage records of the builds run while it is active.
+
+    sink : Optional function called with each record as it is made, e.g.
+           to write the records as JSON lines.  The records are kept in
+           'records' either way.
+
+    memory : True to also trace the memory of each stage with tracemalloc.
+             Tracing slows the builds down several times, so the times of a
+             memory profile are not representative.
+
+    sites : Number of top allocation sites to record per stage, with
+            memory.  Each stage then takes two tracemalloc snapshots, which
+            add to the peak memory of the enclosing stages.
+
+    Use as a context manager.  Profiles may be nested; the inner one is
+    active until it exits.  A Profile is active in its own thread only.
+
+    '''
+
+    def __init__(self, sink=None, memory=False, sites=0):
+        self.sink = sink
+        self.memory = memory or sites > 0
+        self.sites = sites
+        self.records = []
+        self.balun = None
+        self._stack = []
+        self._peaks = []
+        self._outer = None
+        self._tracing = False
+
+    def __enter__(self):
+        self._outer = getattr(_active, 'profile', None)
+        _active.profile = self
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+        return self
+
+    def __exit__(self, *args):
+        _active.profile = self._outer
+        if self._tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._tracing = False
+        return False
+
+    def _emit(self, record):
+        self.records.append(record)
+        if self.sink != None:
+            self.sink(record)
+
+    def summary(self):
+        '''
+
+        Totals of the records by stage name.
+
+        Returns a dictionary of stage name to a dictionary of 'calls',
+        'seconds', 'polygons', 'vertices', and 'references', plus the total
+        'bytes' and the largest 'peak_bytes' with memory.
+
+        '''
+
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {'calls' : 0, 'seconds' : 0.0, 'polygons' : 0,
+                                                        'vertices' : 0, 'references' : 0})
+            total['calls'] += 1
+            for name in ('seconds', 'polygons', 'vertices', 'references'):
+                total[name] += record[name]
+            if 'bytes' in record:
+                total['bytes'] = total.get('bytes', 0) + record['bytes']
+                total['peak_bytes'] = max(total.get('peak_bytes', 0), record['peak_bytes'])
+        return totals
+
+
+def Stage(name, balun=None):
+    '''
+
+    Context of a stage of the build pipeline.
+
+    name : Name of the stage.
+
+    balun : Cell name of the balun, for the outer most stage of a build.
+            The stages inside it are recorded for this balun.
+
+    Returns a context manager with a 'count' method for the cells or
+    polygon sets made by the stage.  Does nothing if no Profile is active
+    in this thread.
+
+    '''
+
+    profile = getattr(_active, 'profile', None)
+    if profile == None:
+        return _NULL
+    return _Stage(profile, name, balun)
+
+
+def Enabled():
+    '''
+
+    True if a Profile is active in this thread.
+
+    '''
+
+    return getattr(_active, 'profile', None) != None
@@ -0,0 +1,284 @@
+import itertools
+import multiprocessing
+import os
+import time
+import gdspy
+import Balun_Scripts.Balun_DRC as BD
+import Balun_Scripts.Balun_Nets as BN
+import Balun_Scripts.Balun_Parts as BP
+import Balun_Scripts.Balun_Profile as BPF
+import Balun_Scripts.Polygon_Check as PC
+from Balun_Scripts.Balun_Build import Balun_Build
+from Balun_Scripts.Balun_Writer import GDS_Stream, GDS_Stream_Thread
+
+#############################################################
+# Parameters of a sweep point and their defaults, in order. #
+# A parameter left out of the grid takes its default.       #
+#############################################################
+PARAMS = (('topology', 'XX'), ('L', 300), ('W', 8), ('S', 3),
+          ('Pri', 2), ('Sec', 2), ('viaM', 4), ('viaW', 1), ('viaS', 1),
+          ('clearance', 'boolean'), ('flat', True))
+
+# Parts shared by the points built in this process
+_PARTS = BP.Part_Cache()
+
+
+def Sweep_Points(grid):
+    '''
+
+    Expand a parameter grid into a list of sweep points.
+
+    grid : Dictionary of parameter name to a value or a list of values.
+           Parameter names are those of 'Balun_Build':
+           'topology', 'L', 'W', 'S', 'Pri', 'Sec', 'viaM', 'viaW', 'viaS',
+           'clearance', 'flat'.
+
+    Returns a list of dictionaries, one per point of the cartesian product.
+
+    '''
+
+    names = [name for name, default in PARAMS]
+    for name in grid:
+        if name not in names:
+            raise ValueError('Unknown sweep parameter: ' + str(name))
+
+    axes = []
+    for name, default in PARAMS:
+        values = grid.get(name, default)
+        if isinstance(values, (str, int, float)):
+            values = [values]
+        axes.append(values)
+
+    return [dict(zip(names, point)) for point in itertools.product(*axes)]
+
+
+def Point_Name(point):
+    '''
+
+    GDS cell name of a sweep point, e.g. 'XX_L300_W8_S3_Pri2_Sec2'.
+    The via parameters and the clearance are added when they differ from
+    their defaults, e.g. 'XX_L300_W8_S3_Pri2_Sec2_viaM6_analytic'.
+    Hierarchical (not flat) points end with '_H'.
+
+    '''
+
+    defaults = dict(PARAMS)
+    name = '{topology}_L{L:g}_W{W:g}_S{S:g}_Pri{Pri}_Sec{Sec}'.format(**point)
+    for key in ('viaM', 'viaW', 'viaS'):
+        if point.get(key, defaults[key]) != defaults[key]:
+            name = name + '_{}{:g}'.format(key, point[key])
+    if point.get('clearance', defaults['clearance']) != defaults['clearance']:
+        name = name + '_' + point['clearance']
+    if not point.get('flat', True):
+        name = name + '_H'
+    return name
+
+
+def _build_point(args):
+    '''
+
+    Worker for 'Balun_Sweep'. Builds a single sweep point in a fresh library.
+
+    Returns a tuple (record, cell).  cell is the balun cell to stream, or
+    None when not streaming.
+
+    '''
+
+    point, gds_dir, stream, dedup, profile, checks = args
+
+    if profile:
+        with BPF.Profile() as stages:
+            record, balun_cell = _point(point, gds_dir, stream, dedup, checks)
+        record['stages'] = stages.records
+        return record, balun_cell
+
+    return _point(point, gds_dir, stream, dedup, checks)
+
+
+def _point(point, gds_dir, stream, dedup, checks):
+    '''
+
+    Build a single sweep point, see '_build_point'.
+
+    '''
+
+    lib = gdspy.GdsLibrary()
+
+    C_Name = Point_Name(point)
+
+    # Cells of hierarchical baluns share one stream, so keep their names
+    # apart, unless the stream tells them apart by geometry
+    ns = ''
+    if stream and not dedup and not point.get('flat', True):
+        ns = C_Name + '_'
+
+    t0 = time.perf_counter()
+    balun_cell, max_tracks, ratio_valid = Balun_Build(lib, C_Name = C_Name, ns = ns, cache = _PARTS, **point)
+    seconds = time.perf_counter() - t0
+
+    record = dict(point)
+    record['name'] = C_Name
+    record['built'] = balun_cell != None
+    record['max_tracks'] = max_tracks
+    record['ratio_valid'] = ratio_valid
+    record['seconds'] = seconds
+    record['polygons'] = 0
+
+    if balun_cell != None:
+        record['polygons'] = len(balun_cell.get_polygons())
+        _check(record, balun_cell, point, *checks)
+        if gds_dir != None:
+            cells = [balun_cell] + list(balun_cell.get_dependencies(True))
+            with BPF.Stage('write_gds', C_Name):
+                lib.write_gds(os.path.join(gds_dir, C_Name + '.gds'), cells = cells)
+
+    if stream:
+        return record, balun_cell
+    return record, None
+
+
+def _check(record, balun_cell, point, nets, drc, polygons):
+    '''
+
+    Run the checks of a sweep on a built balun and add their problems to
+    its record, see 'Balun_Sweep'.
+
+    '''
+
+    C_Name = record['name']
+    if polygons:
+        with BPF.Stage('polygons', C_Name):
+            record['polygon_problems'] = PC.Polygon_Check(balun_cell)
+    if nets:
+        with BPF.Stage('nets', C_Name):
+            record['net_problems'] = BN.Check_Nets(BN.Balun_Nets(balun_cell, **_balun_params(point)))
+    if drc != None:
+        # A thread per layer would only compete with the other workers
+        with BPF.Stage('drc', C_Name):
+            record['drc'] = BD.Balun_DRC(balun_cell, deck = drc, workers = 1, **_balun_params(point))
+
+
+def _balun_params(point):
+    '''
+
+    Balun parameters of a sweep point, without the build options.
+
+    '''
+
+    return {name : point[name] for name in ('topology', 'L', 'W', 'S', 'Pri', 'Sec', 'viaM', 'viaW', 'viaS')}
+
+
+def _collect(results, gds_file, gds_queue, dedup):
+    '''
+
+    Gather the records of the built points, streaming their balun cells
+    into 'gds_file' as they arrive.
+
+    Returns a tuple (records, writer stats).
+
+    '''
+
+    if gds_file == None:
+        return [record for record, cell in results], None
+
+    if gds_queue:
+        stream = GDS_Stream_Thread(gds_file, dedup = dedup, maxsize = gds_queue)
+    else:
+        stream = GDS_Stream(gds_file, dedup = dedup)
+
+    records = []
+    with stream:
+        for record, cell in results:
+            if cell != None and 'stages' in record:
+                # Time the write in this process, with the stages of the worker
+                with BPF.Profile(record['stages'].append):
+                    with BPF.Stage('write', record['name']) as stage:
+                        stage.count(cell)
+                        stream.write(cell)
+            elif cell != None:
+                stream.write(cell)
+            records.append(record)
+
+    return records, getattr(stream, 'stats', None)
+
+
+def Balun_Sweep(grid, processes=None, chunksize=8, gds_dir=None, gds_file=None, gds_queue=0, dedup=False,
+                profile=False, nets=False, drc=None, polygons=False):
+    '''
+
+    Build every point of a parameter grid over a pool of processes.
+
+    grid : Dictionary of parameter name to a value or a list of values.
+           See 'Sweep_Points'.
+
+    processes : Number of worker processes.
+                The default of None uses one process per CPU core.
+                With 1, the points are built in this process.
+
+    chunksize : Number of points handed to a worker at a time.
+
+    gds_dir : If given, each built balun is written to its own GDS file
+              in this directory.
+
+    gds_file : If given, every built balun is streamed into this single
+               GDS file as soon as it is finished, so memory does not grow
+               with the number of points.
+
+    gds_queue : With a gds_file, the size of the queue of a background
+                writer thread that writes the baluns while the next ones are
+                built.  0 writes them in the calling thread.
+
+    dedup : With a gds_file, write the crossover, via, and port cells that
+            hierarchical (not flat) baluns share only once, by geometry.
+            See Balun_Writer.GDS_Stream.
+
+    profile : True to profile every build, see Balun_Profile.  The stage
+              records of each point are added to its record under 'stages'.
+              The 'write' stage of a gds_file only times the hand-off to
+              the background writer thread when there is one.
+
+    nets : True to extract the nets of every built balun and check them,
+           see Balun_Nets.  The problems found are added to its record
+           under 'net_problems', an empty list for a valid balun.
+
+    drc : Rule deck to check every built balun against, see Balun_DRC,
+          e.g. Balun_DRC.DECK.  The violations are added to its record
+          under 'drc'.  None skips the check.
+
+    polygons : True to check the polygons of every built balun for
+               slivers, self-intersections, and off-grid vertices, see
+               Polygon_Check.  The problems found are added to its record
+               under 'polygon_problems'.
+
+    Returns a tuple (records, stats).
+    records is a list with one dictionary per point.
+    stats holds the point count, the number of baluns built, the wall time,
+    and the throughput in baluns per second, plus the statistics of the
+    background writer thread under 'writer' if there is one.
+
+    '''
+
+    points = Sweep_Points(grid)
+    if gds_dir != None:
+        os.makedirs(gds_dir, exist_ok = True)
+
+    t0 = time.perf_counter()
+    tasks = [(point, gds_dir, gds_file != None, dedup, profile, (nets, drc, polygons)) for point in points]
+    if processes == 1:
+        records, writer = _collect(map(_build_point, tasks), gds_file, gds_queue, dedup)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            records, writer = _collect(pool.imap(_build_point, tasks, chunksize),
+                                       gds_file, gds_queue, dedup)
+    seconds = time.perf_counter() - t0
+
+    built = sum(record['built'] for record in records)
+    stats = {'points' : len(points),
+             'built' : built,
+             'processes' : processes or os.cpu_count(),
+             'seconds' : seconds,
+             'baluns_per_s' : built/seconds if seconds > 0 else 0.0}
+    if writer != None:
+        stats['writer'] = writer
+
+    return records, stats
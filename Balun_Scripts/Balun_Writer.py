@@ -0,0 +1,317 @@
+import copy
+import hashlib
+import queue
+import threading
+import time
+import numpy as np
+import gdspy
+
+
+class GDS_Stream:
+    '''
+
+    Writes finished GDS cells one at a time into a single GDSII file.
+
+    Each cell is encoded and appended to the open stream as soon as it is
+    written, so no library of every design needs to be held in memory.
+    Cells referenced by a written cell are written along with it, once
+    per name.  A referenced cell whose name was already written is skipped
+    if its geometry is the same, and raises ValueError otherwise; build the
+    designs with a namespace ('ns') when they are hierarchical, or use
+    'dedup'.
+
+    outfile : File name or binary file object of the GDSII stream.
+
+    name : Name of the GDSII library.
+
+    unit : Unit size for the objects in the library, in meters.
+
+    precision : Precision for the dimensions of the objects, in meters.
+
+    dedup : If True, the cells referenced by the written cells are compared
+            by a hash of their geometry.  A cell identical to one already
+            written is not written again, and the references to it point to
+            the written one.  Referenced cells of different geometry but the
+            same name are renamed, so designs do not need a namespace.
+            The written cells themselves keep their names.
+
+    Use as a context manager, or call 'close' when done.
+
+    cells : Number of cells written.
+
+    merged : Number of referenced cells not written because an identical
+             one already was.
+
+    '''
+
+    def __init__(self, outfile, name='library', unit=1.0e-6, precision=1.0e-9, dedup=False):
+        self._writer = gdspy.GdsWriter(outfile, name, unit, precision)
+        # Id and geometry hash of the cell written under each name; the
+        # hash is None for the cells passed to 'write'
+        self._names = {}
+        self._grid = precision/unit
+        self._dedup = dedup
+        self._hashes = {}
+        self.cells = 0
+        self.merged = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, cell, release=True):
+        '''
+
+        Append a cell and the cells it references to the stream.
+
+        cell : GDS cell to write.
+
+        release : If True, the polygons, paths, labels, and references of
+                  the cell are dropped once it is written, so its memory is
+                  freed even if the cell itself is still referenced.
+
+        '''
+
+        if cell.name in self._names:
+            raise ValueError('Cell name already written to the GDS stream: ' + cell.name)
+
+        if self._dedup:
+            self._write_dedup(cell)
+        else:
+            # Referenced cells first, skipping the ones already written
+            for dep in sorted(cell.get_dependencies(True), key = lambda c: c.name):
+                key = Cell_Hash(dep, grid = self._grid)
+                if dep.name in self._names:
+                    written, written_key = self._names[dep.name]
+                    if written_key != key and not (written_key == None and written == id(dep)):
+                        raise ValueError('Cell name already written to the GDS stream: ' + dep.name)
+                    continue
+                self._writer.write_cell(dep)
+                self._names[dep.name] = (id(dep), key)
+                self.cells += 1
+
+            self._writer.write_cell(cell)
+            self._names[cell.name] = (id(cell), None)
+            self.cells += 1
+
+        if release:
+            cell.polygons = []
+            cell.paths = []
+            cell.labels = []
+            cell.references = []
+
+    def _write_dedup(self, cell):
+        '''
+
+        Write a cell, writing each referenced cell only once per geometry.
+
+        '''
+
+        # Name written for each referenced cell, by id, for this cell only
+        written = {}
+
+        def resolve(dep, top):
+            if id(dep) in written:
+                return written[id(dep)]
+
+            # Referenced cells first, so the references hash by what they
+            # actually point to
+            references = []
+            for ref in dep.references:
+                if isinstance(ref.ref_cell, gdspy.Cell):
+                    ref = copy.copy(ref)
+                    ref.ref_cell = resolve(ref.ref_cell, False)
+                references.append(ref)
+
+            key = None
+            if not top:
+                key = Cell_Hash(dep, references, self._grid)
+                if key in self._hashes:
+                    self.merged += 1
+                    written[id(dep)] = self._hashes[key]
+                    return self._hashes[key]
+
+            name = dep.name
+            if not top and name in self._names:
+                name = name + '_' + key[:8]
+
+            # Shallow copy with the resolved names, so the cell itself is untouched
+            out = copy.copy(dep)
+            out.name = name
+            out.references = references
+            self._writer.write_cell(out)
+            self._names[name] = (id(dep), key)
+            self.cells += 1
+
+            if key != None:
+                self._hashes[key] = name
+            written[id(dep)] = name
+            return name
+
+        resolve(cell, True)
+
+    def close(self):
+        '''
+
+        Finish the GDSII stream and close the file if it was opened here.
+
+        '''
+
+        if self._writer != None:
+            self._writer.close()
+            self._writer = None
+
+
+def Cell_Hash(cell, references=None, grid=1.0e-3):
+    '''
+
+    SHA-256 hash of the geometry of a GDS cell.
+
+    Two cells with the same polygons, paths, labels, and references have the
+    same hash, whatever their name and the order of their elements.
+
+    cell : GDS cell to hash.
+
+    references : References to hash in place of those of the cell.
+                 Their 'ref_cell' may be a cell or a cell name.
+
+    grid : Coordinates are snapped to this grid before hashing, in user
+           units.  Use the precision of the GDSII file.
+
+    '''
+
+    if references == None:
+        references = cell.references
+
+    def snap(points):
+        return np.round(np.asarray(points)/grid).astype(np.int64).tobytes()
+
+    elements = []
+    polygon_sets = list(cell.polygons)
+    for path in cell.paths:
+        if hasattr(path, 'to_polygonset'):
+            path = path.to_polygonset()
+        polygon_sets.append(path)
+    for polyset in polygon_sets:
+        for points, layer, datatype in zip(polyset.polygons, polyset.layers, polyset.datatypes):
+            elements.append(b'P%d,%d,' % (layer, datatype) + snap(points))
+
+    for label in cell.labels:
+        elements.append(('T{},{},{},'.format(label.layer, label.texttype, label.text)).encode()
+                        + snap(label.position))
+
+    for ref in references:
+        name = ref.ref_cell.name if isinstance(ref.ref_cell, gdspy.Cell) else ref.ref_cell
+        text = 'R{},{},{},{},'.format(name, ref.rotation, ref.magnification, bool(ref.x_reflection))
+        if isinstance(ref, gdspy.CellArray):
+            text += 'A{},{},'.format(ref.columns, ref.rows) + repr(snap(ref.spacing))
+        elements.append(text.encode() + snap(ref.origin))
+
+    digest = hashlib.sha256()
+    for element in sorted(elements):
+        digest.update(hashlib.sha256(element).digest())
+    return digest.hexdigest()
+
+
+class GDS_Stream_Thread(GDS_Stream):
+    '''
+
+    GDS_Stream that encodes and writes the cells on a background thread.
+
+    'write' only puts the cell into a bounded queue, so the next design is
+    built while the previous ones are being written.  When the queue is
+    full, 'write' waits for the writer thread to catch up, which bounds the
+    memory held by cells waiting to be written.
+
+    maxsize : Number of cells the queue holds.
+
+    The other arguments are those of GDS_Stream.
+
+    stats : Dictionary of the writer statistics.
+            'cells' : number of cells written, with their dependencies.
+            'merged' : number of duplicate referenced cells not written.
+            'write_seconds' : time the writer thread spent writing.
+            'wait_seconds' : time 'write' waited on a full queue.
+            'max_depth' : largest number of cells waiting in the queue.
+            'mean_depth' : mean number of cells waiting, seen by 'write'.
+
+    '''
+
+    def __init__(self, outfile, name='library', unit=1.0e-6, precision=1.0e-9, dedup=False, maxsize=8):
+        GDS_Stream.__init__(self, outfile, name, unit, precision, dedup)
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._puts = 0
+        self._depth = 0
+        self.stats = {'cells' : 0, 'merged' : 0, 'write_seconds' : 0.0, 'wait_seconds' : 0.0,
+                      'max_depth' : 0, 'mean_depth' : 0.0}
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def _run(self):
+        '''
+
+        Writer thread. Writes queued cells until it gets None.
+
+        '''
+
+        while True:
+            item = self._queue.get()
+            if item == None:
+                break
+            if self._error != None:
+                continue
+            t0 = time.perf_counter()
+            try:
+                GDS_Stream.write(self, *item)
+            except Exception as error:
+                self._error = error
+            self.stats['write_seconds'] += time.perf_counter() - t0
+            self.stats['cells'] = self.cells
+            self.stats['merged'] = self.merged
+
+    def _raise(self):
+        # The error stays set, so the writer thread writes nothing more
+        # and every later call raises it again
+        if self._error != None:
+            raise self._error
+
+    def write(self, cell, release=True):
+        '''
+
+        Queue a cell to be appended to the stream with the cells it
+        references.  See GDS_Stream.write.
+
+        An error of the writer thread is raised by every later call to
+        'write' or 'close'; no cell is written after it.
+
+        '''
+
+        self._raise()
+
+        depth = self._queue.qsize()
+        self._puts += 1
+        self._depth += depth
+        self.stats['max_depth'] = max(self.stats['max_depth'], depth + 1)
+        self.stats['mean_depth'] = self._depth/self._puts
+
+        t0 = time.perf_counter()
+        self._queue.put((cell, release))
+        self.stats['wait_seconds'] += time.perf_counter() - t0
+
+    def close(self):
+        '''
+
+        Wait for the queued cells to be written, then finish the GDSII
+        stream.
+
+        '''
+
+        if self._thread != None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            GDS_Stream.close(self)
+        self._raise()
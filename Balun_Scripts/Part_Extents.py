@@ -0,0 +1,265 @@
+'''
+Closed-form extents of the balun parts.
+
+All parts are symmetric about the origin, so each part is described by its
+half extents (hx, hy): the part spans -hx..hx along x and -hy..hy along y.
+The functions only use arithmetic and NumPy, so W, S, and v may be
+NumPy arrays, and none of them need gdspy.  NumPy itself is only imported
+for arrays, so scalar extents stay quick to import, e.g. for the 'check'
+and 'plan' commands.
+
+v is the half width of the via array of a crossover.  The default of 0
+assumes the vias fit inside the metal of the crossover.
+'''
+
+import math
+
+#preliminary calculations of some constants
+tanz = math.tan(math.pi/8)
+Sqr2 = math.sqrt(2)
+
+
+def scalars(*values):
+    '''
+
+    True if all the values are plain numbers, not arrays.
+
+    '''
+
+    return all(isinstance(value, (int, float)) for value in values)
+
+
+def _maximum(a, b):
+    '''
+
+    Element-wise maximum, without NumPy for scalars.
+
+    '''
+
+    if scalars(a, b):
+        return max(a, b)
+
+    import numpy as np
+    return np.maximum(a, b)
+
+
+def SQ_EXT(W):
+    '''
+
+    Half extents of the W by W square of 'SQ'.
+
+    W : Width of the metal track.
+
+    '''
+
+    return W/2, W/2
+
+
+def VIA_EXT(m, w, s):
+    '''
+
+    Half extents of the m by m via array of 'VIA'.
+
+    m : Number of rows and columns of the via array.
+
+    w : Width of a square via.
+
+    s : The spacing between vias in the array.
+
+    '''
+
+    half = 0.5*(m-1)*(w+s) + 0.5*w
+    return half, half
+
+
+def J_EXT(W, S, edge_x = None):
+    '''
+
+    Half extents of the 'J' jumper.
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    edge_x : Half width to extend the jumper to.
+             None for the natural width of the jumper.
+
+    '''
+
+    if edge_x is None:
+        edge_x = S*tanz + W + S/2 + W/Sqr2
+
+    return edge_x, W/2
+
+
+def X_EXT(W, S, v = 0, edge_x = None):
+    '''
+
+    Half extents of the 'X' crossover (and of 'XM').
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    v : Half width of the via array.
+
+    edge_x : Half width to extend the crossover to.
+             None for the natural width of the crossover.
+
+    '''
+
+    if edge_x is None:
+        edge_x = S*tanz + W + S/2 + W/Sqr2
+
+    # Vias are centered at (edge_x - W/2, 0.5*(W + S))
+    hx = _maximum(edge_x, edge_x - W/2 + v)
+    hy = _maximum(W + S/2, 0.5*(W + S) + v)
+    return hx, hy
+
+
+def XX_EXT(W, S, v = 0):
+    '''
+
+    Half extents of the 'XX' crossover (and of 'XXM').
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    v : Half width of the via array.
+
+    '''
+
+    edge_x = S*tanz + S/2 + S/Sqr2 + W + W*Sqr2
+
+    # Outer vias are centered at (edge_x - W/2, 1.5*(W + S))
+    hx = _maximum(edge_x, edge_x - W/2 + v)
+    hy = _maximum(2*W + 1.5*S, 1.5*(W + S) + v)
+    return hx, hy
+
+
+def XI_EXT(W, S, v = 0, edge_x = None):
+    '''
+
+    Half extents of the 'XI' crossover (and of 'XIM').
+
+    W : Width of the metal track.
+
+    S : Spacing between the metal tracks.
+
+    v : Half width of the via array.
+
+    edge_x : Half width to extend the crossover to.
+             None for the natural width of the crossover.
+
+    '''
+
+    if edge_x is None:
+        edge_x = S + W/2 + W/Sqr2 + W + S*tanz
+
+    # Vias are centered at (edge_x - W/2, S + W)
+    hx = _maximum(edge_x, edge_x - W/2 + v)
+    hy = _maximum(S + 1.5*W, S + W + v)
+    return hx, hy
+
+
+def TR_EXT(L):
+    '''
+
+    Half extents of the octagonal tracks of 'TR'.
+
+    L : Overall length of the octagonal balun.
+
+    '''
+
+    return L/2, L/2
+
+
+def P_EXT(L, W, sep_x):
+    '''
+
+    Half extents of the ports of 'P'.
+
+    L : Overall length of the octagonal balun.
+
+    W : Width of the metal track.
+
+    sep_x : Half width of the crossover that separates the ports.
+
+    '''
+
+    return sep_x, L/2 + W
+
+
+def BB(ext):
+    '''
+
+    Bounding box [[x_min, y_min], [x_max, y_max]] of half extents (hx, hy).
+
+    '''
+
+    import numpy as np
+
+    hx, hy = ext
+    return np.array([[-hx, -hy], [hx, hy]], dtype=float)
+
+
+def bbox(cell):
+    '''
+
+    Bounding box of a GDS cell.
+
+    Cells generated by Balun_Parts publish their bounding box, so it is
+    returned without walking the polygons of the cell.  Any other cell
+    falls back to gdspy's get_bounding_box().
+
+    cell : GDS cell.
+
+    '''
+
+    import numpy as np
+
+    extent = getattr(cell, 'extent', None)
+    if extent is None:
+        return cell.get_bounding_box()
+    return np.array(extent)
+
+
+def ref_bbox(ref):
+    '''
+
+    Bounding box of a GDS cell reference.
+
+    Same as ref.get_bounding_box(), but computed from the published bounding
+    box of the referenced cell.  The cost does not depend on the number of
+    polygons in the cell.
+
+    ref : gdspy.CellReference with a rotation that is a multiple of 90 degrees.
+
+    '''
+
+    import numpy as np
+
+    rotation = ref.rotation or 0
+    if rotation % 90 or getattr(ref.ref_cell, 'extent', None) is None:
+        return ref.get_bounding_box()
+
+    pts = np.array(ref.ref_cell.extent, dtype=float)
+    if ref.x_reflection:
+        pts[:, 1] = -pts[:, 1]
+    if ref.magnification is not None:
+        pts = pts*ref.magnification
+
+    # Exact quarter turns, counterclockwise
+    quarter = int(round(rotation/90)) % 4
+    if quarter == 1:
+        pts = np.stack((-pts[:, 1], pts[:, 0]), axis=1)
+    elif quarter == 2:
+        pts = -pts
+    elif quarter == 3:
+        pts = np.stack((pts[:, 1], -pts[:, 0]), axis=1)
+
+    if ref.origin is not None:
+        pts = pts + ref.origin
+
+    return np.array([pts.min(axis=0), pts.max(axis=0)])
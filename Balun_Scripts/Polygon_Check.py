@@ -0,0 +1,192 @@
+'''
+Validity check of the polygons of the balun layouts.
+
+The vertex lists of the parts and the clearances cut out of the tracks can
+leave polygons that a mask writer or an EM solver rejects.  Each polygon
+is checked on its own, as it is written to GDS, i.e. with its vertices
+rounded to the database unit:
+
+duplicate : Two consecutive vertices are the same point.
+
+spike : The outline turns back on itself, a feature of zero width.
+
+self_intersection : Two edges that do not follow each other cross or
+                    touch.
+
+zero_area : The polygon has no area.
+
+sliver : The polygon is thinner than min_width on average, i.e. twice
+         its area over its perimeter is below it, as for a thin triangle.
+
+narrow : Two edges of the polygon face each other across its inside
+         closer than min_width.
+
+notch : Two edges of the polygon face each other across its outside
+        closer than min_width, i.e. it nearly touches itself.
+
+off_grid : A vertex is not on the manufacturing grid.
+
+The edges are paired by a sweep along x: the edges of all the polygons
+are sorted by polygon and by their left end, and each edge is only
+tested against the edges of its polygon that start before it ends.  The
+check is a few sorts and array operations, fast enough for every balun
+of a sweep.
+
+Problem keys:
+
+problem : One of the names above.
+
+layer, datatype : GDS layer and datatype of the polygon.
+
+polygon : Index of the polygon in the list of its layer and datatype, as
+          returned by get_polygons(by_spec=True).
+
+point : Vertex or point [x, y] where the problem is.
+
+value : Distance between the edges for 'narrow' and 'notch', average
+        width for 'sliver', number of off-grid vertices of the polygon for
+        'off_grid', and None otherwise.
+'''
+
+import numpy as np
+import Balun_Scripts.Balun_DRC as BD
+import Balun_Scripts.Balun_Nets as BN
+
+
+def _problem(problem, spec, polygon, point, value=None):
+    '''
+
+    Problem dictionary, see the module documentation.
+
+    '''
+
+    return {'problem' : problem, 'layer' : int(spec[0]), 'datatype' : int(spec[1]), 'polygon' : int(polygon),
+            'point' : [float(point[0]), float(point[1])], 'value' : value}
+
+
+def Polygon_Check(polygons, min_width=1e-2, grid=1e-3, precision=1e-3):
+    '''
+
+    Check the polygons of a layout.
+
+    polygons : gdspy cell, or dictionary of (layer, datatype) to a list of
+               arrays of points, as returned by get_polygons(by_spec=True).
+
+    min_width : Polygons or parts of polygons thinner than this are
+                reported as 'sliver' or 'narrow'.
+
+    grid : Manufacturing grid the vertices must be on.
+
+    precision : Database unit the vertices are rounded to when written,
+                the 'precision' of GDS_Stream over its 'unit'.
+
+    Returns the list of problems found, see the module documentation,
+    empty if every polygon is valid.
+
+    '''
+
+    if hasattr(polygons, 'get_polygons'):
+        polygons = polygons.get_polygons(by_spec = True)
+
+    specs = []
+    shapes = []
+    for spec, points in polygons.items():
+        specs.extend((spec, n) for n in range(len(points)))
+        shapes.extend(points)
+    if not shapes:
+        return []
+
+    problems = []
+
+    # As written to GDS
+    sizes = np.array([len(points) for points in shapes])
+    points = np.round(np.concatenate(shapes)/precision)*precision
+    owner = np.repeat(np.arange(len(shapes)), sizes)
+    first = np.cumsum(sizes) - sizes
+
+    def following(owner, first, sizes):
+        # Next vertex of each vertex, wrapping around each polygon; a
+        # polygon left without vertices has none to wrap
+        after = np.arange(len(owner)) + 1
+        full = sizes > 0
+        after[(first + sizes - 1)[full]] = first[full]
+        return after
+
+    # Manufacturing grid, up to the rounding to the database unit
+    off = np.any(abs(points/grid - np.round(points/grid)) > 1e-6*max(precision/grid, 1), axis = 1)
+    found, at, counts = np.unique(owner[off], return_index = True, return_counts = True)
+    for s, k, count in zip(found, np.flatnonzero(off)[at], counts):
+        problems.append(_problem('off_grid', *specs[s], points[k], int(count)))
+
+    # Drop the repeated vertices, after reporting them
+    repeat = np.all(points == points[following(owner, first, sizes)], axis = 1)
+    for k in np.flatnonzero(repeat):
+        problems.append(_problem('duplicate', *specs[owner[k]], points[k]))
+    points, owner = points[~repeat], owner[~repeat]
+    sizes = np.bincount(owner, minlength = len(shapes))
+    first = np.cumsum(sizes) - sizes
+    starts = points
+    ends = points[following(owner, first, sizes)]
+
+    # Area and perimeter of each polygon
+    cross = starts[:, 0]*ends[:, 1] - starts[:, 1]*ends[:, 0]
+    area = np.bincount(owner, cross, len(shapes))/2
+    lengths = np.hypot(*(ends - starts).T)
+    perimeter = np.bincount(owner, lengths, len(shapes))
+    average = 2*abs(area)/np.maximum(perimeter, 1e-300)
+    for s in np.flatnonzero((sizes < 3) | (abs(area) <= precision*precision)):
+        problems.append(_problem('zero_area', *specs[s], shapes[s][0]))
+    for s in np.flatnonzero((sizes >= 3) & (abs(area) > precision*precision) & (average < min_width)):
+        problems.append(_problem('sliver', *specs[s], shapes[s][0], float(average[s])))
+    if not len(points):
+        return problems
+
+    # Edges that turn back on the previous edge
+    after = following(owner, first, sizes)
+    d0 = ends - starts
+    d1 = d0[after]
+    turn = d0[:, 0]*d1[:, 1] - d0[:, 1]*d1[:, 0]
+    back = (abs(turn) <= 1e-9*lengths*lengths[after]) & ((d0*d1).sum(1) < 0)
+    for k in np.flatnonzero(back & (sizes[owner] >= 3)):
+        problems.append(_problem('spike', *specs[owner[k]], ends[k]))
+
+    # Sweep along x: each edge against the edges of its polygon that
+    # start before it ends
+    low = np.minimum(starts, ends) - min_width
+    high = np.maximum(starts, ends) + min_width
+    span = high[:, 0].max() - low[:, 0].min() + 1
+    key = owner*span + (low[:, 0] - low[:, 0].min())
+    order = np.argsort(key, kind = 'stable')
+    stop = np.searchsorted(key[order], owner[order]*span + (high[order, 0] - low[:, 0].min()), 'right')
+    i, j = BN._ranges(np.arange(1, len(order) + 1), stop)
+    i, j = order[i], order[j]
+
+    keep = ((low[i, 1] <= high[j, 1]) & (low[j, 1] <= high[i, 1]) &
+            (after[i] != j) & (after[j] != i) & (sizes[owner[i]] >= 3))
+    i, j = i[keep], j[keep]
+    distance, p, q = BD._closest(starts[i], ends[i], starts[j], ends[j])
+
+    touch = distance <= precision/2
+    seen = set()
+    for k in np.flatnonzero(touch):
+        # Every edge through the same point crosses there
+        if (owner[i[k]], tuple(p[k])) not in seen:
+            seen.add((owner[i[k]], tuple(p[k])))
+            problems.append(_problem('self_intersection', *specs[owner[i[k]]], p[k]))
+
+    # Outward normals; the polygons may turn either way
+    def outward(e):
+        return (np.stack((d0[e, 1], -d0[e, 0]), axis = 1)*np.sign(area[owner[e]])[:, None] /
+                np.maximum(lengths[e], 1e-300)[:, None])
+
+    na, nb = outward(i), outward(j)
+    v = q - p
+    va = (v*na).sum(1)
+    vb = (v*nb).sum(1)
+    close = ~touch & ((na*nb).sum(1) < -np.sqrt(0.5)) & (distance < min_width)
+    for problem, faces in (('narrow', (va < -1e-6*distance) & (vb > 1e-6*distance)),
+                           ('notch', (va > 1e-6*distance) & (vb < -1e-6*distance))):
+        for k in np.flatnonzero(close & faces):
+            problems.append(_problem(problem, *specs[owner[i[k]]], (p[k] + q[k])/2, float(distance[k])))
+
+    return problems
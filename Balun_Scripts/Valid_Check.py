@@ -1,7 +1,7 @@
-import numpy as np
-import gdspy
+import math
+import Balun_Scripts.Part_Extents as PE
 
-def max_tracks(lib,L, W, S, limit = 'XX'):
+def max_tracks(lib,L, W, S, limit = 'XX', ns = ''):
     '''
     
     Determine the maximum number of tracks based on length given by 'limit'
@@ -16,23 +16,113 @@ def max_tracks(lib,L, W, S, limit = 'XX'):
             Usually a crossover is passed in and its length determines
             the minimum length of the inner most track. 
     
+    ns : Namespace prefix of the GDS cell names of the balun parts.
+    
     '''
     
     if limit == None:
         length = 0
         
     else:
-        CO = gdspy.CellReference(lib.cells[limit])
-        length = 2*CO.get_bounding_box()[1][0]
+        length = 2*PE.bbox(lib.cells[ns + limit])[1][0]
+    
+    return int(_tracks(L, W, S, length))
+
+
+###############################################################
+# Crossover that limits the inner most track of each topology #
+###############################################################
+LIMIT = {'X' : 'X', 'XX' : 'XX', 'XI' : 'XI'}
+
+#############################################################
+# Half extents of the crossovers that can limit the tracks  #
+#############################################################
+LIMIT_EXT = {'X' : PE.X_EXT, 'XM' : PE.X_EXT,
+             'XX' : PE.XX_EXT, 'XXM' : PE.XX_EXT,
+             'XI' : PE.XI_EXT, 'XIM' : PE.XI_EXT}
+
+
+def _tracks(L, W, S, length):
+    '''
+    
+    Number of tracks, before truncation, that fit between the outer edge of
+    the balun and an inner most track of the given length.
+    
+    '''
     
     #preliminary calculations of some constants
-    tanz = np.tan(np.pi/8)
+    tanz = math.tan(math.pi/8)
     ld2tanz = length/(2*tanz)
     WpS = W +S
     
-    tracks = -(ld2tanz + W - L/2)/WpS + 1
+    return -(ld2tanz + W - L/2)/WpS + 1
+
+
+def max_tracks_analytic(L, W, S, limit = 'XX', viaM = 4, viaW = 1, viaS = 1):
+    '''
+    
+    Same as 'max_tracks', for the crossovers generated by Balun_Parts with
+    their natural width, but computed from the closed-form extents of
+    Part_Extents.  No GDS cells are needed.
+    
+    L, W, S, and the via parameters may be NumPy arrays of broadcastable
+    shapes, so many candidate baluns are screened in one call.
+    
+    L : Overall length of the octagonal balun.
+    
+    W : Width of the metal track.
+    
+    S : Spacing between the metal tracks.
+    
+    limit : Name of the crossover that limits the inner most track,
+            'X', 'XX', or 'XI'.  If None, the inner most track is 0 length.
+    
+    viaM : Number of rows and columns of the via array.
+    
+    viaW : Width of a square via.
+    
+    viaS : Spacing between vias in the array.
+    
+    Returns an int, or an integer array for array arguments.  NumPy is
+    only imported for array arguments.
+    
+    '''
+    
+    tracks = limit_tracks(L, W, S, limit, viaM, viaW, viaS)[1]
+    if PE.scalars(tracks):
+        return int(tracks)
+    
+    import numpy as np
+    
+    tracks = np.trunc(tracks).astype(int)
     
-    return int(tracks)
+    if np.ndim(tracks) == 0:
+        return int(tracks)
+    return tracks
+
+
+
+def limit_tracks(L, W, S, limit = 'XX', viaM = 4, viaW = 1, viaS = 1):
+    '''
+    
+    Length of the crossover that limits the inner most track, and the
+    number of tracks, before truncation, that fit around it.  The
+    arguments are those of 'max_tracks_analytic', and may be NumPy arrays
+    as well.
+    
+    Returns a tuple (length, tracks).  'max_tracks_analytic' truncates
+    tracks to an int.
+    
+    '''
+    
+    if limit == None:
+        length = 0
+        
+    else:
+        v = PE.VIA_EXT(viaM, viaW, viaS)[0]
+        length = 2*LIMIT_EXT[limit](W, S, v)[0]
+    
+    return length, _tracks(L, W, S, length)
 
                               
 def Ratio_X(Pri, Sec):
@@ -97,4 +187,39 @@ def Ratio_XI(Pri, Sec):
         valid = False
     
     return valid        
-   
\ No newline at end of file
+   
+
+
+def Ratio_Valid(topology, Pri, Sec):
+    '''
+    
+    Same turn ratio rules as 'Ratio_X', 'Ratio_XX', and 'Ratio_XI', for
+    NumPy arrays of turns.
+    
+    topology : Balun topology, one of 'X', 'XX', or 'XI'.
+    
+    Pri : Number of turns of the primary.
+    
+    Sec : Number of turns of the secondary.
+    
+    Returns a boolean array of the broadcast shape of Pri and Sec, or a
+    bool for plain numbers, without importing NumPy.
+    
+    '''
+    if PE.scalars(Pri, Sec):
+        return {'XX' : Ratio_XX, 'XI' : Ratio_XI}.get(topology, Ratio_X)(Pri, Sec)
+    
+    import numpy as np
+    
+    Pri = np.asarray(Pri)
+    Sec = np.asarray(Sec)
+    
+    valid = (Pri != 0) & (Sec != 0)
+    
+    if topology == 'XX':
+        valid &= (Pri == Sec) | ((Pri%2 == 0) & (Sec%2 == 0))
+        
+    elif topology == 'XI':
+        valid &= Sec%2 == 0
+    
+    return valid
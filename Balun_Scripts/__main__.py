@@ -0,0 +1,469 @@
+'''
+Command line entry point of the balun scripts.
+
+    python -m Balun_Scripts check XX 300 8 3 2 2
+    python -m Balun_Scripts plan XI 300 8 3 2 2
+    python -m Balun_Scripts graph XI 300 8 3 2 2
+    python -m Balun_Scripts build XX 300 8 3 2 2 -o Balun_XX.gds
+    python -m Balun_Scripts nets XI 300 8 3 2 2
+    python -m Balun_Scripts drc XI 300 8 3 2 2 --deck rules.json
+    python -m Balun_Scripts polygons X 400 2 1 4 4 --grid 0.005
+    python -m Balun_Scripts density XI 300 8 3 2 2 --window 100 --step 50 --min 0.2
+    python -m Balun_Scripts sweep --topology X XX XI --L 250 300 400 --gds-file sweep.gds
+    python -m Balun_Scripts bench --baseline bench_baseline.json
+
+No viewer is ever opened.  The modules are imported only by the commands
+that need them, so 'check', 'plan', and 'graph' do not import gdspy.
+'''
+
+import argparse
+import json
+import sys
+import Balun_Scripts.Balun_Profile as BPF
+
+
+def _balun_args(parser):
+    '''
+
+    Add the arguments of a single balun to a sub-command parser.
+
+    '''
+
+    parser.add_argument('topology', choices = ('X', 'XX', 'XI'), help = 'Balun topology.')
+    parser.add_argument('L', type = float, help = 'Overall length of the octagonal balun.')
+    parser.add_argument('W', type = float, help = 'Width of the metal track.')
+    parser.add_argument('S', type = float, help = 'Spacing between the metal tracks.')
+    parser.add_argument('Pri', type = int, help = 'Number of turns of the primary.')
+    parser.add_argument('Sec', type = int, help = 'Number of turns of the secondary.')
+    parser.add_argument('--viaM', type = int, default = 4, help = 'Rows and columns of the via array.')
+    parser.add_argument('--viaW', type = float, default = 1, help = 'Width of a square via.')
+    parser.add_argument('--viaS', type = float, default = 1, help = 'Spacing between vias.')
+
+
+def _check(args):
+    '''
+
+    Screen a balun with the closed-form rules of Valid_Check, the same way
+    Balun_Build does before generating any geometry.
+
+    '''
+
+    import Balun_Scripts.Valid_Check as VC
+    from Balun_Scripts.Balun_Atlas import LIMIT, Min_Length
+
+    max_tracks = VC.max_tracks_analytic(args.L, args.W, args.S, LIMIT[args.topology],
+                                        args.viaM, args.viaW, args.viaS)
+
+    # Total tracks should be even for 'XX' baluns
+    if args.topology == 'XX' and max_tracks%2:
+        max_tracks = max_tracks - 1
+
+    ratio_valid = bool(VC.Ratio_Valid(args.topology, args.Pri, args.Sec))
+    valid = ratio_valid and max_tracks >= args.Pri + args.Sec
+
+    result = {'max_tracks' : max_tracks, 'ratio_valid' : ratio_valid, 'valid' : valid}
+    if ratio_valid:
+        result['min_L'] = Min_Length(args.topology, args.W, args.S, args.Pri, args.Sec,
+                                     args.viaM, args.viaW, args.viaS)
+
+    print(json.dumps(result))
+    return 0 if valid else 1
+
+
+def _plan(args):
+    '''
+
+    Print the placement plan of a balun as JSON.
+
+    '''
+
+    from Balun_Scripts.Balun_Plan import Balun_Plan
+
+    plan = Balun_Plan(args.topology, args.L, args.W, args.S, args.Pri, args.Sec,
+                      args.viaM, args.viaW, args.viaS)
+    print(json.dumps(plan, indent = args.indent))
+    return 0
+
+
+def _graph(args):
+    '''
+
+    Print the graph of a balun and its windings as JSON, and verify it.
+
+    '''
+
+    import Balun_Scripts.Balun_Graph as BG
+
+    graph = BG.Balun_Graph(args.topology, args.L, args.W, args.S, args.Pri, args.Sec,
+                           args.viaM, args.viaW, args.viaS)
+    problems = BG.Check_Graph(graph)
+    graph['windings'] = BG.Windings(graph)
+    graph['problems'] = problems
+    print(json.dumps(graph, indent = args.indent))
+    return 1 if problems else 0
+
+
+def _write_stages(path, records):
+    '''
+
+    Write profiling stage records as JSON lines.
+
+    '''
+
+    with open(path, 'w') as outfile:
+        for record in records:
+            outfile.write(json.dumps(record) + '\n')
+
+
+def _build(args):
+    '''
+
+    Build a balun and write it to a GDS file.
+
+    '''
+
+    if args.profile != None:
+        with BPF.Profile() as profile:
+            status = _build_gds(args)
+        _write_stages(args.profile, profile.records)
+        return status
+    return _build_gds(args)
+
+
+def _build_gds(args):
+    '''
+
+    Build a balun and write it to a GDS file, see '_build'.
+
+    '''
+
+    import gdspy
+    from Balun_Scripts.Balun_Build import Balun_Build
+
+    C_Name = args.name or 'Balun_' + args.topology
+    outfile = args.output or C_Name + '.gds'
+    params = dict(topology = args.topology, L = args.L, W = args.W, S = args.S,
+                  Pri = args.Pri, Sec = args.Sec, viaM = args.viaM, viaW = args.viaW,
+                  viaS = args.viaS, tl = args.tl, bl = args.bl, vl = args.vl,
+                  clearance = args.clearance)
+
+    lib = gdspy.GdsLibrary()
+    if args.cache != None:
+        from Balun_Scripts.Balun_Cache import Balun_Cache
+        balun_cell, max_tracks, ratio_valid = Balun_Cache(args.cache).build(lib, C_Name = C_Name, **params)
+    else:
+        balun_cell, max_tracks, ratio_valid = Balun_Build(lib, C_Name = C_Name, flat = not args.hier, **params)
+
+    if balun_cell == None:
+        ##############################
+        # Display issues with inputs #
+        ##############################
+        if max_tracks < args.Pri + args.Sec:
+            print('Maximum number of tracks is: ' + str(max_tracks), file = sys.stderr)
+        if not ratio_valid:
+            print('Turn ratio not valid!', file = sys.stderr)
+        return 1
+
+    cells = [balun_cell] + list(balun_cell.get_dependencies(True))
+    with BPF.Stage('write_gds', C_Name):
+        lib.write_gds(outfile, cells = cells)
+    print(outfile)
+    return 0
+
+
+def _nets(args):
+    '''
+
+    Build a balun and print the nets of its layout as JSON, with the
+    problems found, see Balun_Nets.
+
+    '''
+
+    import gdspy
+    import Balun_Scripts.Balun_Graph as BG
+    import Balun_Scripts.Balun_Nets as BN
+    from Balun_Scripts.Balun_Build import Balun_Build
+
+    params = dict(topology = args.topology, L = args.L, W = args.W, S = args.S,
+                  Pri = args.Pri, Sec = args.Sec, viaM = args.viaM, viaW = args.viaW, viaS = args.viaS)
+    balun_cell = Balun_Build(gdspy.GdsLibrary(), **params)[0]
+    if balun_cell == None:
+        print('Balun not valid, see the check command.', file = sys.stderr)
+        return 1
+
+    nets = BN.Balun_Nets(balun_cell, **params)
+    problems = BN.Check_Nets(nets, BG.Balun_Graph(**params))
+    print(json.dumps({'nets' : nets, 'problems' : problems}, indent = args.indent))
+    return 1 if problems else 0
+
+
+def _deck(args):
+    '''
+
+    Rule deck of the --deck argument, or the default deck of Balun_DRC.
+
+    '''
+
+    import Balun_Scripts.Balun_DRC as BD
+
+    if args.deck == None:
+        return BD.DECK
+    return BD.Load_Deck(args.deck)
+
+
+def _drc(args):
+    '''
+
+    Build a balun and print the violations of a rule deck as JSON, see
+    Balun_DRC.
+
+    '''
+
+    import gdspy
+    import Balun_Scripts.Balun_DRC as BD
+    from Balun_Scripts.Balun_Build import Balun_Build
+
+    params = dict(topology = args.topology, L = args.L, W = args.W, S = args.S,
+                  Pri = args.Pri, Sec = args.Sec, viaM = args.viaM, viaW = args.viaW, viaS = args.viaS)
+    balun_cell = Balun_Build(gdspy.GdsLibrary(), **params)[0]
+    if balun_cell == None:
+        print('Balun not valid, see the check command.', file = sys.stderr)
+        return 1
+
+    violations = BD.Balun_DRC(balun_cell, deck = _deck(args), workers = args.workers, **params)
+    print(json.dumps(violations, indent = args.indent))
+    return 1 if violations else 0
+
+
+def _polygons(args):
+    '''
+
+    Build a balun and print the problems of its polygons as JSON, see
+    Polygon_Check.
+
+    '''
+
+    import gdspy
+    import Balun_Scripts.Polygon_Check as PC
+    from Balun_Scripts.Balun_Build import Balun_Build
+
+    balun_cell = Balun_Build(gdspy.GdsLibrary(), args.topology, args.L, args.W, args.S, args.Pri, args.Sec,
+                             args.viaM, args.viaW, args.viaS, clearance = args.clearance)[0]
+    if balun_cell == None:
+        print('Balun not valid, see the check command.', file = sys.stderr)
+        return 1
+
+    problems = PC.Polygon_Check(balun_cell, min_width = args.min_width, grid = args.grid)
+    print(json.dumps(problems, indent = args.indent))
+    return 1 if problems else 0
+
+
+def _density(args):
+    '''
+
+    Build a balun and print its metal density map, and the windows outside
+    the --min and --max densities, as JSON, see Balun_Density.
+
+    '''
+
+    import gdspy
+    import Balun_Scripts.Balun_Density as BDN
+    from Balun_Scripts.Balun_Build import Balun_Build
+
+    balun_cell = Balun_Build(gdspy.GdsLibrary(), args.topology, args.L, args.W, args.S, args.Pri, args.Sec,
+                             args.viaM, args.viaW, args.viaS)[0]
+    if balun_cell == None:
+        print('Balun not valid, see the check command.', file = sys.stderr)
+        return 1
+
+    try:
+        density_map = BDN.Density_Map(balun_cell, window = args.window, step = args.step, layers = args.layers)
+    except ValueError as error:
+        print(error, file = sys.stderr)
+        return 1
+    violations = BDN.Check_Density(density_map, {layer : (args.min, args.max) for layer in args.layers})
+    density_map['layers'] = {layer : density.tolist() for layer, density in density_map['layers'].items()}
+    print(json.dumps({'density' : density_map, 'violations' : violations}, indent = args.indent))
+    return 1 if violations else 0
+
+
+def _sweep(args):
+    '''
+
+    Build every point of a parameter grid, see Balun_Sweep.
+
+    '''
+
+    from Balun_Scripts.Balun_Sweep import Balun_Sweep
+
+    grid = {}
+    for name in ('topology', 'L', 'W', 'S', 'Pri', 'Sec', 'viaM', 'viaW', 'viaS', 'clearance'):
+        values = getattr(args, name)
+        if values != None:
+            grid[name] = values
+    if args.hier:
+        grid['flat'] = False
+
+    records, stats = Balun_Sweep(grid, processes = args.processes, gds_dir = args.gds_dir,
+                                 gds_file = args.gds_file, gds_queue = args.gds_queue,
+                                 dedup = args.dedup, profile = args.profile != None, nets = args.nets,
+                                 drc = _deck(args) if args.drc else None, polygons = args.polygons)
+
+    if args.records != None:
+        with open(args.records, 'w') as outfile:
+            json.dump(records, outfile, indent = 1)
+
+    if args.profile != None:
+        _write_stages(args.profile, [stage for record in records for stage in record.get('stages', ())])
+
+    print(json.dumps(stats))
+    return 0
+
+
+def _bench(args):
+    '''
+
+    Benchmark the builds, see Balun_Bench.
+
+    '''
+
+    import Balun_Scripts.Balun_Bench as BB
+
+    cases = BB.Bench_Cases(args.topology, args.L, args.W, args.S, args.step)
+
+    if args.memory:
+        results = BB.Memory_Bench(cases, args.sites)
+        if args.output != None:
+            BB.Save_Bench(results, args.output)
+        print(BB.Memory_Report(results))
+        return 0
+
+    results = BB.Balun_Bench(cases, args.repeat)
+
+    regressions = []
+    if args.baseline != None:
+        regressions = BB.Bench_Baseline(args.baseline, results, args.update, args.tolerance)
+    if args.output != None:
+        BB.Save_Bench(results, args.output)
+
+    print(BB.Report(results, regressions))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    '''
+
+    Parse the command line and run the command.
+
+    argv : Command line arguments, without the program name.
+           The default of None uses sys.argv.
+
+    Returns the exit status, 0 on success and 1 for a balun that is not valid.
+
+    '''
+
+    parser = argparse.ArgumentParser(prog = 'python -m Balun_Scripts',
+                                     description = 'Generate planar baluns without a viewer.')
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    check = commands.add_parser('check', help = 'Check if a balun is valid, without gdspy.')
+    _balun_args(check)
+    check.set_defaults(run = _check)
+
+    plan = commands.add_parser('plan', help = 'Print the placement plan of a balun, without gdspy.')
+    _balun_args(plan)
+    plan.add_argument('--indent', type = int, default = None, help = 'Indent of the JSON output.')
+    plan.set_defaults(run = _plan)
+
+    graph = commands.add_parser('graph', help = 'Print and verify the graph of a balun, without gdspy.')
+    _balun_args(graph)
+    graph.add_argument('--indent', type = int, default = None, help = 'Indent of the JSON output.')
+    graph.set_defaults(run = _graph)
+
+    build = commands.add_parser('build', help = 'Build a balun into a GDS file.')
+    _balun_args(build)
+    build.add_argument('-o', '--output', help = 'GDS file name.  The default is the cell name.')
+    build.add_argument('--name', help = "Cell name.  The default is 'Balun_' followed by the topology.")
+    build.add_argument('--tl', type = int, default = 37, help = 'Upper metal GDS layer.')
+    build.add_argument('--bl', type = int, default = 33, help = 'Lower metal GDS layer.')
+    build.add_argument('--vl', type = int, default = 36, help = 'Via GDS layer.')
+    build.add_argument('--clearance', choices = ('boolean', 'analytic'), default = 'boolean')
+    # The cache holds flat polygons only
+    layout = build.add_mutually_exclusive_group()
+    layout.add_argument('--hier', action = 'store_true', help = 'Keep the parts as GDS references.')
+    layout.add_argument('--cache', help = 'Directory of a Balun_Cache of built baluns.  Not with --hier.')
+    build.add_argument('--profile', help = 'JSON lines file to write the profile of each build stage to.')
+    build.set_defaults(run = _build)
+
+    nets = commands.add_parser('nets', help = 'Build a balun and check the nets of its layout.')
+    _balun_args(nets)
+    nets.add_argument('--indent', type = int, default = None, help = 'Indent of the JSON output.')
+    nets.set_defaults(run = _nets)
+
+    drc = commands.add_parser('drc', help = 'Build a balun and check it against a rule deck.')
+    _balun_args(drc)
+    drc.add_argument('--deck', help = 'JSON rule deck file.  The default is Balun_DRC.DECK.')
+    drc.add_argument('--workers', type = int, default = None, help = 'Number of threads checking the layers.')
+    drc.add_argument('--indent', type = int, default = None, help = 'Indent of the JSON output.')
+    drc.set_defaults(run = _drc)
+
+    polygons = commands.add_parser('polygons', help = 'Build a balun and check its polygons.')
+    _balun_args(polygons)
+    polygons.add_argument('--clearance', choices = ('boolean', 'analytic'), default = 'boolean')
+    polygons.add_argument('--min-width', type = float, default = 1e-2, help = 'Width of a sliver.')
+    polygons.add_argument('--grid', type = float, default = 1e-3, help = 'Manufacturing grid.')
+    polygons.add_argument('--indent', type = int, default = None, help = 'Indent of the JSON output.')
+    polygons.set_defaults(run = _polygons)
+
+    density = commands.add_parser('density', help = 'Build a balun and map its metal density.')
+    _balun_args(density)
+    density.add_argument('--window', type = float, default = 100.0, help = 'Side of the density windows.')
+    density.add_argument('--step', type = float, default = 50.0, help = 'Distance between the windows.')
+    density.add_argument('--layers', nargs = '+', type = int, default = [37, 33], help = 'GDS layers to map.')
+    density.add_argument('--min', type = float, default = None, help = 'Minimum density of every layer.')
+    density.add_argument('--max', type = float, default = None, help = 'Maximum density of every layer.')
+    density.add_argument('--indent', type = int, default = None, help = 'Indent of the JSON output.')
+    density.set_defaults(run = _density)
+
+    sweep = commands.add_parser('sweep', help = 'Build every balun of a parameter grid.')
+    sweep.add_argument('--topology', nargs = '+', choices = ('X', 'XX', 'XI'))
+    for name in ('L', 'W', 'S', 'viaW', 'viaS'):
+        sweep.add_argument('--' + name, nargs = '+', type = float)
+    for name in ('Pri', 'Sec', 'viaM'):
+        sweep.add_argument('--' + name, nargs = '+', type = int)
+    sweep.add_argument('--clearance', nargs = '+', choices = ('boolean', 'analytic'))
+    sweep.add_argument('--hier', action = 'store_true', help = 'Keep the parts as GDS references.')
+    sweep.add_argument('--processes', type = int, default = None, help = 'Number of worker processes.')
+    sweep.add_argument('--gds-dir', help = 'Directory to write one GDS file per balun.')
+    sweep.add_argument('--gds-file', help = 'Single GDS file to stream every balun into.')
+    sweep.add_argument('--gds-queue', type = int, default = 0, help = 'Queue size of the GDS writer thread.')
+    sweep.add_argument('--dedup', action = 'store_true', help = 'Write shared parts once into the GDS file.')
+    sweep.add_argument('--nets', action = 'store_true', help = 'Check the nets of every balun built.')
+    sweep.add_argument('--polygons', action = 'store_true', help = 'Check the polygons of every balun built.')
+    sweep.add_argument('--drc', action = 'store_true', help = 'Check every balun built against a rule deck.')
+    sweep.add_argument('--deck', help = 'JSON rule deck file for --drc.  The default is Balun_DRC.DECK.')
+    sweep.add_argument('--records', help = 'JSON file to write the record of every point to.')
+    sweep.add_argument('--profile', help = 'JSON lines file to write the profile of each build stage to.')
+    sweep.set_defaults(run = _sweep)
+
+    bench = commands.add_parser('bench', help = 'Benchmark the builds against a baseline.')
+    bench.add_argument('--topology', nargs = '+', choices = ('X', 'XX', 'XI'), default = ('X', 'XX', 'XI'))
+    bench.add_argument('--L', type = float, default = 1000, help = 'Balun length.')
+    bench.add_argument('--W', type = float, default = 8, help = 'Track width.')
+    bench.add_argument('--S', type = float, default = 3, help = 'Track spacing.')
+    bench.add_argument('--step', type = int, default = 2, help = 'Step of the number of tracks.')
+    bench.add_argument('--repeat', type = int, default = 3, help = 'Builds per balun, the fastest is kept.')
+    bench.add_argument('--baseline', help = 'Baseline JSON file.  Created if missing.')
+    bench.add_argument('--update', action = 'store_true', help = 'Replace the baseline with this run.')
+    bench.add_argument('--tolerance', type = float, default = 0.25, help = 'Allowed relative slow down.')
+    bench.add_argument('--output', help = 'JSON file to write the results to.')
+    bench.add_argument('--memory', action = 'store_true', help = 'Measure memory instead of time.')
+    bench.add_argument('--sites', type = int, default = 10, help = 'Top allocation sites kept with --memory.')
+    bench.set_defaults(run = _bench)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+'''
+This script is to sweep the balun parameters over a grid and build every valid
+balun over a pool of worker processes.  Each worker runs the same
+Balun_Parts -> Valid_Check -> Build chain as the other example scripts, in its
+own GDS library, so no 'LayoutViewer' is opened.
+'''
+from Balun_Scripts.Balun_Sweep import Balun_Sweep
+
+#########################
+# Variables. Change me. #
+#########################
+
+# Parameter grid.  Each entry is a value or a list of values.
+grid = {'topology' : ['X', 'XX', 'XI'],
+        'L' : [250, 300, 400],
+        'W' : [6, 8, 9],
+        'S' : [2, 3],
+        'Pri' : [1, 2, 3, 4],
+        'Sec' : [1, 2, 3, 4],
+        'viaM' : 4,
+        'viaW' : 1,
+        'viaS' : 1}
+
+# Number of worker processes, None for one per CPU core
+processes = None
+
+# Directory for the GDS files, None to only build
+gds_dir = None
+
+# Single GDS file that every balun is streamed into, None for no file
+gds_file = None
+
+# True writes the parts shared by hierarchical baluns once into gds_file
+dedup = True
+
+if __name__ == '__main__':
+    records, stats = Balun_Sweep(grid, processes = processes, gds_dir = gds_dir,
+                                 gds_file = gds_file, dedup = dedup)
+
+    print('Points: ' + str(stats['points']))
+    print('Baluns built: ' + str(stats['built']))
+    print('Time (s): ' + format(stats['seconds'], '.2f'))
+    print('Baluns per second: ' + format(stats['baluns_per_s'], '.1f'))
@@ -40,6 +40,10 @@ primaryTurns = 3
 # Turns in the secondary
 secondaryTurns = 3
 
+# True writes a flat GDS of polygons only.
+# False keeps the via arrays and crossovers as GDS references.
+flatGDS = True
+
 ##########################################
 # Generate GDS cells of some balun parts #
 ##########################################
@@ -49,13 +53,13 @@ secondaryTurns = 3
 BP.SQ(lib, trackWidth)
 
 # Generate GDS cell for the via array
-BP.VIA(lib, int(viaM), viaW, viaS)
+BP.VIA(lib, int(viaM), viaW, viaS, flat = flatGDS)
 
 # Generate the 'XX' crossover
-BP.XX(lib, trackWidth, trackSpacing)
+BP.XX(lib, trackWidth, trackSpacing, flat = flatGDS)
 
 # Generate the 'X' crossover
-BP.X(lib, trackWidth, trackSpacing)
+BP.X(lib, trackWidth, trackSpacing, flat = flatGDS)
 
 #############################################################
 # With the given balun parameters, will the balun be valid? #
@@ -80,19 +84,21 @@ if max_tracks >= (int(primaryTurns) + int(secondaryTurns)) and ratio_valid:
     BP.TR(lib, balunLength, trackWidth, trackSpacing, int(primaryTurns), int(secondaryTurns))
 
     # Generate ports
-    BP.P(lib)
+    BP.P(lib, flat = flatGDS)
     
     #################################
     # Construct the 'XX' type balun #
     #################################
-    Balun_XX_Build(lib, balunLength, trackWidth, trackSpacing, int(primaryTurns), int(secondaryTurns), C_Name = Cell_Name)
+    Balun_XX_Build(lib, balunLength, trackWidth, trackSpacing, int(primaryTurns), int(secondaryTurns), C_Name = Cell_Name, flat = flatGDS)
     
     #####################################################
     # Only write the balun cell into the GDS file in um #
     #####################################################
     cell_list = []
     cell_list.append(Cell_Name)
-    gdspy.write_gds(Cell_Name + '.gds', cells = cell_list, unit = 1.0e-6, precision = 1.0e-9)
+    # Cells referenced by a hierarchical balun
+    cell_list.extend(lib.cells[Cell_Name].get_dependencies(True))
+    lib.write_gds(Cell_Name + '.gds', cells = cell_list)
     
     ################################################
     # Display all the GDS cells in current library #